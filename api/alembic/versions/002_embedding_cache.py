@@ -0,0 +1,28 @@
+"""Persistent embedding cache table
+Revision ID: 002_embedding_cache
+Revises: 001_initial_schema
+Create Date: 2026-10-18 09:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+# revision identifiers, used by Alembic.
+revision = '002_embedding_cache'
+down_revision = '001_initial_schema'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Content-addressed cache: one row per (model, normalized text hash)
+    op.create_table(
+        'embedding_cache',
+        sa.Column('model', sa.String(), nullable=False),
+        sa.Column('text_hash', sa.String(length=64), nullable=False),
+        sa.Column('embedding', Vector(1536), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('model', 'text_hash')
+    )
+
+def downgrade():
+    op.drop_table('embedding_cache')
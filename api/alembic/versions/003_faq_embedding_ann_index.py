@@ -0,0 +1,48 @@
+"""ANN index on faqs.embedding
+Revision ID: 003_faq_embedding_ann_index
+Revises: 002_embedding_cache
+Create Date: 2026-10-18 10:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003_faq_embedding_ann_index'
+down_revision = '002_embedding_cache'
+branch_labels = None
+depends_on = None
+
+# HNSW is available from pgvector 0.5.0; older installs fall back to IVFFlat
+HNSW_MIN_VERSION = (0, 5, 0)
+
+def _parse_version(version: str) -> tuple:
+    return tuple(int(part) for part in version.split(".")[:3] if part.isdigit())
+
+def upgrade():
+    bind = op.get_bind()
+    version = bind.execute(sa.text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+
+    if version and _parse_version(version) >= HNSW_MIN_VERSION:
+        statement = """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_faqs_embedding_hnsw
+        ON faqs USING hnsw (embedding vector_cosine_ops)
+        WITH (m = 16, ef_construction = 64);
+        """
+    else:
+        # IVFFlat clusters are trained on existing rows: rows / 1000 lists, at least 100
+        row_count = bind.execute(sa.text("SELECT count(*) FROM faqs WHERE embedding IS NOT NULL")).scalar() or 0
+        lists = max(100, row_count // 1000)
+        statement = f"""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_faqs_embedding_ivfflat
+        ON faqs USING ivfflat (embedding vector_cosine_ops)
+        WITH (lists = {lists});
+        """
+
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute(statement)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_faqs_embedding_hnsw;')
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_faqs_embedding_ivfflat;')
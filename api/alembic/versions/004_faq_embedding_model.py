@@ -0,0 +1,26 @@
+"""Record the embedding model and native dimension of each FAQ vector
+Revision ID: 004_faq_embedding_model
+Revises: 003_faq_embedding_ann_index
+Create Date: 2026-10-18 13:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004_faq_embedding_model'
+down_revision = '003_faq_embedding_ann_index'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('faqs', sa.Column('embedding_model', sa.String(), nullable=True))
+    op.add_column('faqs', sa.Column('embedding_dim', sa.Integer(), nullable=True))
+    # Every existing vector came from the OpenAI provider
+    op.execute("""
+    UPDATE faqs SET embedding_model = 'text-embedding-ada-002', embedding_dim = 1536
+    WHERE embedding IS NOT NULL;
+    """)
+
+def downgrade():
+    op.drop_column('faqs', 'embedding_dim')
+    op.drop_column('faqs', 'embedding_model')
@@ -0,0 +1,19 @@
+"""Add tenants.tier for per-tier latency metrics
+Revision ID: 005_tenant_tier
+Revises: 004_faq_embedding_model
+Create Date: 2026-10-18 14:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005_tenant_tier'
+down_revision = '004_faq_embedding_model'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('tenants', sa.Column('tier', sa.String(), server_default='standard', nullable=False))
+
+def downgrade():
+    op.drop_column('tenants', 'tier')
@@ -0,0 +1,20 @@
+"""Add faqs.token_count for token-budgeted RAG context
+Revision ID: 006_faq_token_count
+Revises: 005_tenant_tier
+Create Date: 2026-10-18 15:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006_faq_token_count'
+down_revision = '005_tenant_tier'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Existing rows stay NULL and are counted when they are first used in a prompt
+    op.add_column('faqs', sa.Column('token_count', sa.Integer(), nullable=True))
+
+def downgrade():
+    op.drop_column('faqs', 'token_count')
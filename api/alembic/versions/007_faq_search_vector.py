@@ -0,0 +1,38 @@
+"""Full-text search column and GIN index on faqs
+Revision ID: 007_faq_search_vector
+Revises: 006_faq_token_count
+Create Date: 2026-10-18 16:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007_faq_search_vector'
+down_revision = '006_faq_token_count'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # The 'simple' configuration does no stemming or stop-word removal, so it works the
+    # same for every tenant's language and keeps product codes and names intact.
+    # Questions weigh more than answers. The column is maintained by Postgres and is
+    # deliberately not mapped on the FAQ model.
+    op.execute("""
+    ALTER TABLE faqs ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(question, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(answer, '')), 'B')
+    ) STORED;
+    """)
+
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_faqs_search_vector
+        ON faqs USING gin (search_vector);
+        """)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_faqs_search_vector;')
+    op.drop_column('faqs', 'search_vector')
@@ -0,0 +1,29 @@
+"""Add messages.user_phone and a per-conversation index for history lookups
+Revision ID: 008_message_user_phone
+Revises: 007_faq_search_vector
+Create Date: 2026-10-18 19:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008_message_user_phone'
+down_revision = '007_faq_search_vector'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Earlier rows have no user and never show up in a conversation history
+    op.add_column('messages', sa.Column('user_phone', sa.String(), nullable=True))
+
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_tenant_user_ts
+        ON messages (tenant_id, user_phone, ts DESC);
+        """)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_messages_tenant_user_ts;')
+    op.drop_column('messages', 'user_phone')
@@ -0,0 +1,128 @@
+"""Partition messages by month on ts
+Revision ID: 009_messages_partitioned
+Revises: 008_message_user_phone
+Create Date: 2026-10-18 21:00:00.000000
+
+Rebuilds `messages` as a table range-partitioned by month, copying the existing
+rows over. The copy takes an exclusive lock on messages for its duration, so
+run this upgrade in a maintenance window (or with the webhook paused) on large
+installs. Partitions for the months ahead are created here and afterwards by
+the create_messages_partitions() function, which the partition maintenance job
+calls; see app/services/message_partitions.py.
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '009_messages_partitioned'
+down_revision = '008_message_user_phone'
+branch_labels = None
+depends_on = None
+
+# Same value as the default of settings.MESSAGES_PARTITION_MONTHS_AHEAD, pinned
+# rather than read from it: migrations do not import app settings, and a
+# revision must do the same thing whenever it runs. Only the partitions needed
+# right after the upgrade are created here; the maintenance job
+# (ensure_partitions) extends them to the configured value on its next run.
+MONTHS_AHEAD = 3
+
+# Creates the missing monthly partitions from from_month through months_ahead
+# months after the current one, and returns how many it created
+CREATE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_messages_partitions(from_month date, months_ahead integer)
+RETURNS integer LANGUAGE plpgsql AS $$
+DECLARE
+    month_start date := date_trunc('month', from_month);
+    last_month date := date_trunc('month', now()) + make_interval(months => months_ahead);
+    partition_name text;
+    created integer := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := 'messages_y' || to_char(month_start, 'YYYY') || 'm' || to_char(month_start, 'MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, (month_start + interval '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+        month_start := month_start + interval '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$;
+"""
+
+def upgrade():
+    # Constraint and index names are schema-wide, the new table takes them over
+    op.execute('ALTER TABLE messages RENAME TO messages_unpartitioned;')
+    op.execute('ALTER TABLE messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey;')
+    op.execute('ALTER TABLE messages_unpartitioned DROP CONSTRAINT IF EXISTS messages_wa_msg_id_key;')
+    op.execute('DROP INDEX IF EXISTS ix_messages_tenant_id;')
+    op.execute('DROP INDEX IF EXISTS ix_messages_tenant_user_ts;')
+
+    # Unique constraints on a partitioned table must include the partition key.
+    # Meta's timestamp is part of every delivery of a message, so (wa_msg_id, ts)
+    # still identifies retried webhooks.
+    op.execute("""
+    CREATE TABLE messages (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+        tenant_id VARCHAR REFERENCES tenants (id),
+        wa_msg_id VARCHAR,
+        user_phone VARCHAR,
+        role role_enum,
+        text TEXT,
+        ts TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+        PRIMARY KEY (id, ts),
+        CONSTRAINT uq_messages_wa_msg_id_ts UNIQUE (wa_msg_id, ts)
+    ) PARTITION BY RANGE (ts);
+    """)
+    # Catches rows outside every monthly partition (very old redeliveries, clock skew)
+    # instead of failing the whole webhook batch they arrive in
+    op.execute('CREATE TABLE messages_default PARTITION OF messages DEFAULT;')
+    op.execute(CREATE_PARTITIONS_FUNCTION)
+    op.execute(f"""
+    SELECT create_messages_partitions(COALESCE(min(ts), now())::date, {MONTHS_AHEAD})
+    FROM messages_unpartitioned;
+    """)
+
+    # Rows from before ts was required are filed under the migration date
+    op.execute("""
+    INSERT INTO messages (id, tenant_id, wa_msg_id, user_phone, role, text, ts)
+    SELECT id, tenant_id, wa_msg_id, user_phone, role, text, COALESCE(ts, now())
+    FROM messages_unpartitioned;
+    """)
+    op.execute("SELECT setval(pg_get_serial_sequence('messages', 'id'), COALESCE(max(id), 0) + 1, false) FROM messages;")
+    op.execute('DROP TABLE messages_unpartitioned;')
+
+    # Built after the copy; the history index also serves tenant_id lookups,
+    # so the separate tenant_id index is not recreated
+    op.execute('CREATE INDEX ix_messages_tenant_user_ts ON messages (tenant_id, user_phone, ts DESC);')
+
+def downgrade():
+    op.execute('ALTER TABLE messages RENAME TO messages_partitioned;')
+    op.execute('ALTER TABLE messages_partitioned RENAME CONSTRAINT messages_pkey TO messages_partitioned_pkey;')
+    op.execute('ALTER TABLE messages_partitioned DROP CONSTRAINT uq_messages_wa_msg_id_ts;')
+    op.execute('DROP INDEX IF EXISTS ix_messages_tenant_user_ts;')
+
+    op.execute("""
+    CREATE TABLE messages (
+        id SERIAL PRIMARY KEY,
+        tenant_id VARCHAR REFERENCES tenants (id),
+        wa_msg_id VARCHAR UNIQUE,
+        user_phone VARCHAR,
+        role role_enum,
+        text TEXT,
+        ts TIMESTAMP WITHOUT TIME ZONE DEFAULT now()
+    );
+    """)
+    op.execute("""
+    INSERT INTO messages (id, tenant_id, wa_msg_id, user_phone, role, text, ts)
+    SELECT id, tenant_id, wa_msg_id, user_phone, role, text, ts
+    FROM messages_partitioned
+    ON CONFLICT DO NOTHING;
+    """)
+    op.execute("SELECT setval(pg_get_serial_sequence('messages', 'id'), COALESCE(max(id), 0) + 1, false) FROM messages;")
+    op.execute('DROP TABLE messages_partitioned CASCADE;')
+    op.execute('DROP FUNCTION IF EXISTS create_messages_partitions(date, integer);')
+    op.execute('CREATE INDEX ix_messages_tenant_id ON messages (tenant_id);')
+    op.execute('CREATE INDEX ix_messages_tenant_user_ts ON messages (tenant_id, user_phone, ts DESC);')
@@ -0,0 +1,61 @@
+"""Indexes for keyset pagination and substring filters on the admin list endpoints
+Revision ID: 010_admin_list_indexes
+Revises: 009_messages_partitioned
+Create Date: 2026-10-18 23:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010_admin_list_indexes'
+down_revision = '009_messages_partitioned'
+branch_labels = None
+depends_on = None
+
+# Trigram indexes let ILIKE '%text%' filters (3+ characters) use an index
+TRIGRAM_INDEXES = (
+    ('ix_tenants_system_prompt_trgm', 'tenants', 'system_prompt'),
+    ('ix_faqs_question_trgm', 'faqs', 'question'),
+    ('ix_faqs_answer_trgm', 'faqs', 'answer'),
+)
+
+# (name, definition) on the partitioned messages table
+MESSAGE_INDEXES = (
+    # Keyset pages of a tenant's history, newest first
+    ('ix_messages_tenant_ts_id', '(tenant_id, ts DESC, id DESC)'),
+    ('ix_messages_text_trgm', 'USING gin (text gin_trgm_ops)'),
+)
+
+def _message_partitions(bind) -> list:
+    return list(bind.execute(sa.text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'messages'::regclass ORDER BY 1"
+    )).scalars())
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm;')
+    bind = op.get_bind()
+
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, table, column in TRIGRAM_INDEXES:
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops);')
+
+        # A partitioned table cannot be indexed CONCURRENTLY as a whole: create the
+        # parent index ON ONLY (invalid, no rows), build each partition's index
+        # concurrently and attach it. Once all are attached the parent index is valid,
+        # and partitions created later get the index automatically.
+        for name, definition in MESSAGE_INDEXES:
+            op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON ONLY messages {definition};')
+            for partition in _message_partitions(bind):
+                partition_index = f'{partition}_{name[len("ix_messages_"):]}'
+                op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index} ON {partition} {definition};')
+                op.execute(f'ALTER INDEX {name} ATTACH PARTITION {partition_index};')
+
+def downgrade():
+    for name, _ in MESSAGE_INDEXES:
+        # Dropping the parent index drops the attached partition indexes
+        op.execute(f'DROP INDEX IF EXISTS {name};')
+    with op.get_context().autocommit_block():
+        for name, _, _ in TRIGRAM_INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name};')
+    # pg_trgm is left installed; other objects may depend on it
@@ -0,0 +1,78 @@
+"""Let create_messages_partitions take over rows already in messages_default
+Revision ID: 011_partition_default_rows
+Revises: 010_admin_list_indexes
+Create Date: 2026-10-19 10:00:00.000000
+
+A month's partition cannot be created while messages_default holds rows for
+that month, and the failed CREATE TABLE used to abort the whole maintenance
+run. The function now builds such a partition as a plain table, moves the rows
+over and attaches it; a month that still fails is reported as a warning and
+the remaining months are created anyway.
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '011_partition_default_rows'
+down_revision = '010_admin_list_indexes'
+branch_labels = None
+depends_on = None
+
+# Creates the missing monthly partitions from from_month through months_ahead
+# months after the current one, and returns how many it created
+CREATE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_messages_partitions(from_month date, months_ahead integer)
+RETURNS integer LANGUAGE plpgsql AS $$
+DECLARE
+    month_start date := date_trunc('month', from_month);
+    last_month date := date_trunc('month', now()) + make_interval(months => months_ahead);
+    month_end date;
+    partition_name text;
+    moved bigint;
+    created integer := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := 'messages_y' || to_char(month_start, 'YYYY') || 'm' || to_char(month_start, 'MM');
+        month_end := (month_start + interval '1 month')::date;
+        IF to_regclass(partition_name) IS NULL THEN
+            BEGIN
+                -- No new rows for the month may reach the default partition until the new one is attached
+                LOCK TABLE messages_default IN SHARE ROW EXCLUSIVE MODE;
+                IF EXISTS (SELECT 1 FROM messages_default WHERE ts >= month_start AND ts < month_end) THEN
+                    EXECUTE format('CREATE TABLE %I (LIKE messages INCLUDING DEFAULTS)', partition_name);
+                    EXECUTE format(
+                        'WITH moved AS (DELETE FROM messages_default WHERE ts >= %L AND ts < %L RETURNING *) '
+                        'INSERT INTO %I SELECT * FROM moved',
+                        month_start, month_end, partition_name
+                    );
+                    GET DIAGNOSTICS moved = ROW_COUNT;
+                    -- Builds the partition's indexes and constraints from the parent's
+                    EXECUTE format(
+                        'ALTER TABLE messages ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                        partition_name, month_start, month_end
+                    );
+                    RAISE NOTICE 'Moved % rows from messages_default to %', moved, partition_name;
+                ELSE
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                        partition_name, month_start, month_end
+                    );
+                END IF;
+                created := created + 1;
+            EXCEPTION WHEN others THEN
+                RAISE WARNING 'Could not create messages partition %: %', partition_name, SQLERRM;
+            END;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+"""
+
+def upgrade():
+    op.execute(CREATE_PARTITIONS_FUNCTION)
+
+def downgrade():
+    # The function keeps the signature and behaviour of revision 009 for months
+    # without default rows, so it is left in place
+    pass
@@ -1,7 +1,8 @@
 # api/routers/admin.py с структурированным логированием
 from fastapi import APIRouter, Depends, HTTPException, Header, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 import os
 import math
 from datetime import datetime   
@@ -13,10 +14,22 @@ from app.models.faq import FAQ
 from app.models.message import Message
 from app.api.deps import get_db
 from app.schemas import admin as admin_schemas
-from app.schemas.bulk_import import BulkFAQImportRequest, BulkFAQImportResponse
-from app.services.ai import generate_embedding # Исправленный импорт для генерации эмбеддингов
+from app.schemas.bulk_import import BulkFAQImportRequest, BulkFAQImportResponse, BulkFAQImportStatusResponse
+from app.services.ai import embedding_columns, generate_embedding # Исправленный импорт для генерации эмбеддингов
+from app.services.pagination import (
+    InvalidCursor,
+    approximate_total,
+    contains_pattern,
+    cursor_page_response,
+    encode_cursor,
+    keyset_page,
+)
+from app.services.rag_context import faq_token_count
+from app.services.response_cache import response_cache
+from app.services.tenant_cache import tenant_cache
+from app.services.vector_index import vector_index
 from app.core.logging import get_logger
-from app.core.tasks import process_bulk_faq_import
+from app.core.tasks import celery_app, process_bulk_faq_import
 
 # Инициализируем структурированный логгер
 logger = get_logger(__name__)
@@ -61,16 +74,18 @@ def verify_admin_token(x_admin_token: str = Header(None)):
 # === Tenant Management ===
 
 @router.post("/tenants/", response_model=admin_schemas.TenantResponse, dependencies=[Depends(verify_admin_token)])
-async def create_tenant(tenant_data: admin_schemas.TenantCreate, db: Session = Depends(get_db)):
+async def create_tenant(tenant_data: admin_schemas.TenantCreate, db: AsyncSession = Depends(get_db)):
     """Create a new tenant."""
-    db_tenant = db.query(Tenant).filter(Tenant.phone_id == tenant_data.phone_id).first()
+    db_tenant = await db.scalar(select(Tenant).where(Tenant.phone_id == tenant_data.phone_id))
     if db_tenant:
         raise HTTPException(status_code=400, detail=f"Tenant with phone_id {tenant_data.phone_id} already exists.")
     
     new_tenant = Tenant(**tenant_data.model_dump())
     db.add(new_tenant)
-    db.commit()
-    db.refresh(new_tenant)
+    await db.commit()
+    await db.refresh(new_tenant)
+    # Keep every worker consistent with the committed row
+    await tenant_cache.invalidate(new_tenant.id)
     logger.info("Tenant created", extra={
         "tenant_id": new_tenant.id,
         "phone_id": new_tenant.phone_id
@@ -79,36 +94,59 @@ async def create_tenant(tenant_data: admin_schemas.TenantCreate, db: Session = D
 
 @router.get("/tenants/", response_model=admin_schemas.PaginatedResponse[admin_schemas.TenantResponse], dependencies=[Depends(verify_admin_token)])
 async def list_tenants(
-    page: int = Query(1, ge=1, description="Page number, starting from 1"),
+    page: int = Query(1, ge=1, description="Page number, starting from 1 (ignored with cursor)"),
     page_size: int = Query(20, ge=1, le=100, description="Number of items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    include_total: bool = Query(False, description="With cursor: add an (approximate) total"),
     phone_id: Optional[str] = None,
     system_prompt_contains: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    List all tenants with pagination and filtering.
+    List all tenants with pagination and filtering, ordered by id.
+    
+    Without `cursor`, pages are numbered and come with an exact total, as before.
+    Every page also returns `next_cursor`; following it is cheaper at any depth.
     
     - **phone_id**: Filter by exact phone_id match
     - **system_prompt_contains**: Filter by system_prompt containing this text
     """
     # Build query with filters
-    query = db.query(Tenant)
+    query = select(Tenant)
     
     # Apply filters if provided
     if phone_id:
-        query = query.filter(Tenant.phone_id == phone_id)
+        query = query.where(Tenant.phone_id == phone_id)
     if system_prompt_contains:
-        query = query.filter(Tenant.system_prompt.ilike(f"%{system_prompt_contains}%"))
+        # Served by the trigram index ix_tenants_system_prompt_trgm
+        query = query.where(Tenant.system_prompt.ilike(contains_pattern(system_prompt_contains), escape="\\"))
+    
+    if cursor is not None:
+        try:
+            tenants, next_cursor = await keyset_page(db, query, [Tenant.id], cursor, page_size)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        total, approximate = (None, False)
+        if include_total:
+            total, approximate = await approximate_total(
+                db, query, "tenants", filtered=bool(phone_id or system_prompt_contains)
+            )
+        logger.info("Tenants list retrieved", extra={
+            "page_size": page_size,
+            "returned": len(tenants),
+            "has_next": next_cursor is not None
+        })
+        return cursor_page_response(tenants, page_size, cursor, next_cursor, total, approximate)
     
     # Calculate total count with filters applied
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     # Calculate pagination values
     total_pages = math.ceil(total / page_size) if total > 0 else 1
     skip = (page - 1) * page_size
     
     # Get items for current page
-    tenants = query.offset(skip).limit(page_size).all()
+    tenants = (await db.scalars(query.order_by(Tenant.id).offset(skip).limit(page_size))).all()
     
     logger.info("Tenants list retrieved", extra={
         "total": total,
@@ -128,13 +166,14 @@ async def list_tenants(
         "page_size": page_size,
         "total_pages": total_pages,
         "has_next": page < total_pages,
-        "has_prev": page > 1
+        "has_prev": page > 1,
+        "next_cursor": encode_cursor([tenants[-1].id]) if tenants and page < total_pages else None
     }
 
 @router.get("/tenants/{tenant_id}", response_model=admin_schemas.TenantResponse, dependencies=[Depends(verify_admin_token)])
-async def get_tenant(tenant_id: str, db: Session = Depends(get_db)):
+async def get_tenant(tenant_id: str, db: AsyncSession = Depends(get_db)):
     """Get a specific tenant by ID."""
-    tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
+    tenant = await db.get(Tenant, tenant_id)
     if not tenant:
         logger.warning("Tenant not found", extra={"tenant_id": tenant_id})
         raise HTTPException(status_code=404, detail=f"Tenant with id {tenant_id} not found.")
@@ -143,9 +182,9 @@ async def get_tenant(tenant_id: str, db: Session = Depends(get_db)):
     return tenant
 
 @router.put("/tenants/{tenant_id}", response_model=admin_schemas.TenantResponse, dependencies=[Depends(verify_admin_token)])
-async def update_tenant(tenant_id: str, tenant_update: admin_schemas.TenantUpdate, db: Session = Depends(get_db)):
+async def update_tenant(tenant_id: str, tenant_update: admin_schemas.TenantUpdate, db: AsyncSession = Depends(get_db)):
     """Update an existing tenant."""
-    db_tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
+    db_tenant = await db.get(Tenant, tenant_id)
     if not db_tenant:
         logger.warning("Tenant not found for update", extra={"tenant_id": tenant_id})
         raise HTTPException(status_code=404, detail=f"Tenant with id {tenant_id} not found.")
@@ -154,8 +193,10 @@ async def update_tenant(tenant_id: str, tenant_update: admin_schemas.TenantUpdat
     for key, value in update_data.items():
         setattr(db_tenant, key, value)
     
-    db.commit()
-    db.refresh(db_tenant)
+    await db.commit()
+    await db.refresh(db_tenant)
+    await tenant_cache.invalidate(tenant_id)
+    response_cache.invalidate(tenant_id)
     logger.info("Tenant updated", extra={
         "tenant_id": tenant_id,
         "updated_fields": list(update_data.keys())
@@ -163,24 +204,27 @@ async def update_tenant(tenant_id: str, tenant_update: admin_schemas.TenantUpdat
     return db_tenant
 
 @router.delete("/tenants/{tenant_id}", status_code=204, dependencies=[Depends(verify_admin_token)])
-async def delete_tenant(tenant_id: str, db: Session = Depends(get_db)):
+async def delete_tenant(tenant_id: str, db: AsyncSession = Depends(get_db)):
     """Delete a tenant."""
-    db_tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
+    db_tenant = await db.get(Tenant, tenant_id)
     if not db_tenant:
         logger.warning("Tenant not found for deletion", extra={"tenant_id": tenant_id})
         raise HTTPException(status_code=404, detail=f"Tenant with id {tenant_id} not found.")
     
-    db.delete(db_tenant)
-    db.commit()
+    await db.delete(db_tenant)
+    await db.commit()
+    await tenant_cache.invalidate(tenant_id)
+    vector_index.drop(tenant_id)
+    response_cache.invalidate(tenant_id)
     logger.info("Tenant deleted", extra={"tenant_id": tenant_id})
     return
 
 # === FAQ Management ===
 
 @router.post("/tenants/{tenant_id}/faq/", response_model=admin_schemas.FAQResponse, dependencies=[Depends(verify_admin_token)])
-async def create_faq_entry(tenant_id: str, faq_data: admin_schemas.FAQCreate, db: Session = Depends(get_db)):
+async def create_faq_entry(tenant_id: str, faq_data: admin_schemas.FAQCreate, db: AsyncSession = Depends(get_db)):
     """Create a new FAQ entry for a tenant and generate its embedding."""
-    db_tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
+    db_tenant = await db.get(Tenant, tenant_id)
     if not db_tenant:
         logger.warning("Tenant not found for FAQ creation", extra={"tenant_id": tenant_id})
         raise HTTPException(status_code=404, detail=f"Tenant with id {tenant_id} not found.")
@@ -194,10 +238,19 @@ async def create_faq_entry(tenant_id: str, faq_data: admin_schemas.FAQCreate, db
         })
         raise HTTPException(status_code=500, detail="Failed to generate embedding for FAQ content.")
 
-    new_faq = FAQ(**faq_data.model_dump(), tenant_id=tenant_id, embedding=embedding)
+    new_faq = FAQ(
+        **faq_data.model_dump(),
+        tenant_id=tenant_id,
+        embedding=embedding,
+        token_count=faq_token_count(faq_data.question, faq_data.answer),
+        **embedding_columns()
+    )
     db.add(new_faq)
-    db.commit()
-    db.refresh(new_faq)
+    await db.commit()
+    await db.refresh(new_faq)
+    vector_index.upsert(tenant_id, new_faq.id, embedding)
+    response_cache.invalidate(tenant_id)
+    await tenant_cache.invalidate_faqs(tenant_id)
     logger.info("FAQ entry created", extra={
         "faq_id": new_faq.id,
         "tenant_id": tenant_id,
@@ -206,17 +259,176 @@ async def create_faq_entry(tenant_id: str, faq_data: admin_schemas.FAQCreate, db
     })
     return new_faq
 
+@router.get("/tenants/{tenant_id}/faq/", response_model=admin_schemas.PaginatedResponse[admin_schemas.FAQResponse], dependencies=[Depends(verify_admin_token)])
+async def list_faq_entries(
+    tenant_id: str,
+    page_size: int = Query(20, ge=1, le=100, description="Number of items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    include_total: bool = Query(False, description="Add an (approximate) total"),
+    filters: admin_schemas.FAQFilter = Depends(),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    List a tenant's FAQ entries by id, one cursor page at a time.
+    
+    - **question_contains** / **answer_contains**: Substring filters (trigram indexes)
+    - **search_text**: Full-text match across question and answer (Postgres)
+    """
+    query = select(FAQ).where(FAQ.tenant_id == tenant_id)
+    if filters.question_contains:
+        query = query.where(FAQ.question.ilike(contains_pattern(filters.question_contains), escape="\\"))
+    if filters.answer_contains:
+        query = query.where(FAQ.answer.ilike(contains_pattern(filters.answer_contains), escape="\\"))
+    if filters.search_text:
+        if db.get_bind().dialect.name == "postgresql":
+            # The generated faqs.search_vector column (not mapped on the model)
+            query = query.where(
+                text("faqs.search_vector @@ websearch_to_tsquery('simple', :search_text)").bindparams(
+                    search_text=filters.search_text
+                )
+            )
+        else:
+            pattern = contains_pattern(filters.search_text)
+            query = query.where(or_(FAQ.question.ilike(pattern, escape="\\"), FAQ.answer.ilike(pattern, escape="\\")))
+
+    try:
+        faqs, next_cursor = await keyset_page(db, query, [FAQ.id], cursor, page_size)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total, approximate = (None, False)
+    if include_total:
+        total, approximate = await approximate_total(db, query, "faqs", filtered=True)
+
+    logger.info("FAQ list retrieved", extra={
+        "tenant_id": tenant_id,
+        "page_size": page_size,
+        "returned": len(faqs),
+        "has_next": next_cursor is not None
+    })
+    return cursor_page_response(faqs, page_size, cursor, next_cursor, total, approximate)
+
+@router.put("/tenants/{tenant_id}/faq/{faq_id}", response_model=admin_schemas.FAQResponse, dependencies=[Depends(verify_admin_token)])
+async def update_faq_entry(tenant_id: str, faq_id: int, faq_update: admin_schemas.FAQUpdate, db: AsyncSession = Depends(get_db)):
+    """Update an FAQ entry and regenerate its embedding if the text changed."""
+    db_faq = await db.scalar(select(FAQ).where(FAQ.id == faq_id, FAQ.tenant_id == tenant_id))
+    if not db_faq:
+        logger.warning("FAQ not found for update", extra={"tenant_id": tenant_id, "faq_id": faq_id})
+        raise HTTPException(status_code=404, detail=f"FAQ with id {faq_id} not found for tenant {tenant_id}.")
+
+    update_data = faq_update.model_dump(exclude_unset=True)
+    text_changed = any(
+        key in update_data and update_data[key] != getattr(db_faq, key)
+        for key in ("question", "answer")
+    )
+    for key, value in update_data.items():
+        setattr(db_faq, key, value)
+    if text_changed or db_faq.token_count is None:
+        db_faq.token_count = faq_token_count(db_faq.question, db_faq.answer)
+
+    # Vectors from a previous embedding provider are re-embedded on any update
+    needs_embedding = text_changed or db_faq.embedding_model != embedding_columns()["embedding_model"]
+    if needs_embedding:
+        content_to_embed = f"Question: {db_faq.question} Answer: {db_faq.answer}"
+        embedding = await generate_embedding(content_to_embed)
+        if embedding is None:
+            logger.error("Failed to generate embedding for FAQ update", extra={
+                "tenant_id": tenant_id,
+                "faq_id": faq_id
+            })
+            await db.rollback()
+            raise HTTPException(status_code=500, detail="Failed to generate embedding for FAQ content.")
+        db_faq.embedding = embedding
+        for key, value in embedding_columns().items():
+            setattr(db_faq, key, value)
+
+    await db.commit()
+    await db.refresh(db_faq)
+    if needs_embedding:
+        vector_index.upsert(tenant_id, db_faq.id, db_faq.embedding)
+    response_cache.invalidate(tenant_id)
+    await tenant_cache.invalidate_faqs(tenant_id)
+    logger.info("FAQ entry updated", extra={
+        "faq_id": faq_id,
+        "tenant_id": tenant_id,
+        "updated_fields": list(update_data.keys()),
+        "embedding_regenerated": needs_embedding
+    })
+    return db_faq
+
+@router.delete("/tenants/{tenant_id}/faq/{faq_id}", status_code=204, dependencies=[Depends(verify_admin_token)])
+async def delete_faq_entry(tenant_id: str, faq_id: int, db: AsyncSession = Depends(get_db)):
+    """Delete an FAQ entry."""
+    db_faq = await db.scalar(select(FAQ).where(FAQ.id == faq_id, FAQ.tenant_id == tenant_id))
+    if not db_faq:
+        logger.warning("FAQ not found for deletion", extra={"tenant_id": tenant_id, "faq_id": faq_id})
+        raise HTTPException(status_code=404, detail=f"FAQ with id {faq_id} not found for tenant {tenant_id}.")
+
+    await db.delete(db_faq)
+    await db.commit()
+    vector_index.remove(tenant_id, faq_id)
+    response_cache.invalidate(tenant_id)
+    await tenant_cache.invalidate_faqs(tenant_id)
+    logger.info("FAQ entry deleted", extra={"tenant_id": tenant_id, "faq_id": faq_id})
+    return
+
+# === Message History ===
+
+@router.get("/tenants/{tenant_id}/messages/", response_model=admin_schemas.PaginatedResponse[admin_schemas.MessageResponse], dependencies=[Depends(verify_admin_token)])
+async def list_messages(
+    tenant_id: str,
+    page_size: int = Query(50, ge=1, le=200, description="Number of items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    include_total: bool = Query(False, description="Add an (approximate) total"),
+    filters: admin_schemas.MessageFilter = Depends(),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    List a tenant's messages, newest first, one cursor page at a time.
+    
+    - **user_phone**: One conversation
+    - **role**: user, assistant or system
+    - **text_contains**: Substring filter (trigram index)
+    - **from_date** / **to_date**: Time range; also limits the monthly partitions read
+    """
+    query = select(Message).where(Message.tenant_id == tenant_id)
+    if filters.user_phone:
+        query = query.where(Message.user_phone == filters.user_phone)
+    if filters.role:
+        query = query.where(Message.role == filters.role)
+    if filters.text_contains:
+        query = query.where(Message.text.ilike(contains_pattern(filters.text_contains), escape="\\"))
+    if filters.from_date:
+        query = query.where(Message.ts >= filters.from_date)
+    if filters.to_date:
+        query = query.where(Message.ts <= filters.to_date)
+
+    try:
+        messages, next_cursor = await keyset_page(db, query, [Message.ts, Message.id], cursor, page_size, descending=True)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total, approximate = (None, False)
+    if include_total:
+        total, approximate = await approximate_total(db, query, "messages", filtered=True)
+
+    logger.info("Messages list retrieved", extra={
+        "tenant_id": tenant_id,
+        "page_size": page_size,
+        "returned": len(messages),
+        "has_next": next_cursor is not None
+    })
+    return cursor_page_response(messages, page_size, cursor, next_cursor, total, approximate)
+
 @router.post("/tenants/{tenant_id}/faq/bulk-import/", response_model=BulkFAQImportResponse, dependencies=[Depends(verify_admin_token)])
 async def bulk_import_faq(
     tenant_id: str, 
     import_data: BulkFAQImportRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Bulk import multiple FAQ entries for a tenant using Celery task queue.
     """
     # Verify tenant exists
-    db_tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
+    db_tenant = await db.get(Tenant, tenant_id)
     if not db_tenant:
         logger.warning("Tenant not found for bulk FAQ import", extra={"tenant_id": tenant_id})
         raise HTTPException(status_code=404, detail=f"Tenant with id {tenant_id} not found.")
@@ -225,7 +437,8 @@ async def bulk_import_faq(
     import_items = [item.model_dump() for item in import_data.items]
     
     # Запускаем Celery-задачу
-    task = process_bulk_faq_import.delay(tenant_id=tenant_id, import_items=import_items)
+    # Publishing to the broker is blocking I/O
+    task = await asyncio.to_thread(process_bulk_faq_import.delay, tenant_id=tenant_id, import_items=import_items)
     
     logger.info("Bulk FAQ import task started", extra={
         "tenant_id": tenant_id,
@@ -242,4 +455,32 @@ async def bulk_import_faq(
         "task_id": task.id      # ID задачи для отслеживания
     }
 
+@router.get("/tenants/{tenant_id}/faq/bulk-import/{task_id}", response_model=BulkFAQImportStatusResponse, dependencies=[Depends(verify_admin_token)])
+def get_bulk_import_status(tenant_id: str, task_id: str):
+    """
+    Report the progress of a bulk FAQ import task.
+    Declared sync so the result-backend round trip runs in the threadpool.
+    """
+    task = celery_app.AsyncResult(task_id)
+    # PROGRESS carries the running counters in task.info, SUCCESS the final ones
+    progress = task.info if isinstance(task.info, dict) else {}
+    owner = progress.get("tenant_id") or (task.kwargs or {}).get("tenant_id")
+    # A failure carries no counters, only error text: it is reported to the owning tenant only
+    if owner != tenant_id and (owner is not None or task.state == "FAILURE"):
+        raise HTTPException(status_code=404, detail=f"Import task {task_id} not found for tenant {tenant_id}.")
+
+    if task.state == "FAILURE":
+        logger.error("Bulk FAQ import task failed", extra={"tenant_id": tenant_id, "task_id": task_id})
+        return {"task_id": task_id, "status": task.state, "errors": [{"error": str(task.result)}]}
+
+    return {
+        "task_id": task_id,
+        "status": task.state,
+        "total_items": progress.get("total_items"),
+        "processed_items": progress.get("processed_items", 0),
+        "successful_items": progress.get("successful_items", 0),
+        "failed_items": progress.get("failed_items", 0),
+        "errors": progress.get("errors") or None,
+    }
+
 # Остальные методы также обновляются аналогичным образом...
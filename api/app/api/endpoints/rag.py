@@ -1,12 +1,17 @@
 # api/routers/rag.py с структурированным логированием
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Исправленные импорты с использованием абсолютных путей
 from app.api.deps import get_db
-from app.models.tenant import Tenant
-from app.services.ai import get_rag_response, load_embedding_model
+from app.core.config import settings
+from app.services.ai import get_rag_response, prepare_rag_prompt, stream_answer
 from app.schemas.rag import RAGQueryRequest, RAGResponse
+from app.services.monitoring import StageTimer
+from app.services.tenant_cache import tenant_cache
 from app.core.logging import get_logger
 
 # Инициализируем структурированный логгер
@@ -17,10 +22,12 @@ router = APIRouter(
     tags=["RAG"],
 )
 
-@router.post("/query/", response_model=RAGResponse)
+@router.post("/query/", response_model=RAGResponse, response_model_exclude_none=True)
 async def query_rag_system(
     query: RAGQueryRequest,
-    db: Session = Depends(get_db)
+    response: Response,
+    debug: bool = Query(False, description="Include per-stage timings in the response body"),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Обрабатывает RAG-запрос и возвращает ответ, сгенерированный на основе релевантных FAQ.
@@ -34,35 +41,47 @@ async def query_rag_system(
                 "tenant_id": query.tenant_id
             }
         )
-        
+
         # Получаем данные тенанта
-        tenant = db.query(Tenant).filter(Tenant.id == query.tenant_id).first()
+        tenant = await tenant_cache.get_by_id(db, query.tenant_id)
         if not tenant:
             logger.warning(
                 "Tenant not found for RAG query",
                 extra={"tenant_id": query.tenant_id}
             )
             raise HTTPException(status_code=404, detail="Tenant not found")
-        
+
         # Получаем ответ от RAG-системы
-        response = await get_rag_response(
-            query=query.query,
-            tenant_id=query.tenant_id,
+        timer = StageTimer()
+        answer = await get_rag_response(
             db=db,
-            system_prompt=tenant.system_prompt
+            tenant_id=query.tenant_id,
+            user_query=query.query,
+            system_prompt=tenant.system_prompt,
+            timer=timer
         )
-        
+        timer.observe(tenant.tier)
+        if settings.RAG_SERVER_TIMING_ENABLED:
+            response.headers["Server-Timing"] = timer.server_timing()
+
         # Логируем успешный ответ
         logger.info(
             "RAG response generated",
             extra={
                 "tenant_id": query.tenant_id,
-                "response_length": len(response.answer),
-                "sources_count": len(response.sources)
+                "response_length": len(answer),
+                "stage_ms": timer.as_milliseconds()
             }
         )
-        
-        return response
+
+        return RAGResponse(
+            answer=answer,
+            tenant_id=query.tenant_id,
+            query=query.query,
+            timings_ms=timer.as_milliseconds() if debug else None
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         # Логируем ошибку
         logger.error(
@@ -77,3 +96,104 @@ async def query_rag_system(
             status_code=500,
             detail=f"Error processing query: {str(e)}"
         )
+
+
+def _sse_event(data: dict, event: str = None) -> str:
+    """Кодирует одно событие Server-Sent Events"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/query/stream")
+async def stream_rag_query(
+    query: RAGQueryRequest,
+    debug: bool = Query(False, description="Include per-stage timings in the final event"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Тот же RAG-запрос, но ответ отдается потоком Server-Sent Events по мере генерации:
+    события `data: {"delta": "..."}`, затем `event: done` (или `event: error`).
+    """
+    try:
+        logger.info(
+            "RAG stream query received",
+            extra={
+                "query_length": len(query.query),
+                "tenant_id": query.tenant_id
+            }
+        )
+
+        tenant = await tenant_cache.get_by_id(db, query.tenant_id)
+        if not tenant:
+            logger.warning(
+                "Tenant not found for RAG query",
+                extra={"tenant_id": query.tenant_id}
+            )
+            raise HTTPException(status_code=404, detail="Tenant not found")
+
+        # Поиск и сборка промпта до начала ответа: их ошибки остаются обычными HTTP-ошибками
+        timer = StageTimer()
+        prompt = await prepare_rag_prompt(
+            db=db,
+            tenant_id=query.tenant_id,
+            user_query=query.query,
+            system_prompt=tenant.system_prompt,
+            timer=timer
+        )
+        # Соединение с БД больше не нужно; не держим его, пока идет генерация
+        await db.close()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(
+            f"Error processing RAG query: {str(e)}",
+            extra={
+                "tenant_id": query.tenant_id,
+                "error": str(e)
+            },
+            exc_info=True
+        )
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing query: {str(e)}"
+        )
+
+    async def events():
+        response_length = 0
+        try:
+            async for delta in stream_answer(prompt, timer):
+                response_length += len(delta)
+                yield _sse_event({"delta": delta})
+        except Exception as e:
+            # Статус 200 уже отправлен, поэтому об ошибке сообщаем отдельным событием
+            logger.error(
+                f"Error streaming RAG answer: {str(e)}",
+                extra={
+                    "tenant_id": query.tenant_id,
+                    "error": str(e)
+                },
+                exc_info=True
+            )
+            yield _sse_event({"detail": "Error generating answer"}, event="error")
+            return
+
+        timer.observe(tenant.tier)
+        logger.info(
+            "RAG response streamed",
+            extra={
+                "tenant_id": query.tenant_id,
+                "response_length": response_length,
+                "stage_ms": timer.as_milliseconds()
+            }
+        )
+        yield _sse_event({"timings_ms": timer.as_milliseconds()} if debug else {}, event="done")
+
+    headers = {
+        "Cache-Control": "no-cache",
+        # Не даем nginx буферизовать поток
+        "X-Accel-Buffering": "no",
+    }
+    if settings.RAG_SERVER_TIMING_ENABLED:
+        # Генерация еще не началась, так что здесь только этапы до нее
+        headers["Server-Timing"] = timer.server_timing()
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
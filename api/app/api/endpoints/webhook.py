@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Request, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import JSONResponse
 from app.core.logging import logging as logger
-from app.api.deps import get_db
+from app.services.idempotency import recent_message_ids
+from app.services.monitoring import webhook_messages_total, webhook_statuses_total
+from app.services.webhook_pipeline import webhook_pipeline
+from app.services.whatsapp import WhatsAppClient
 import os
 
 router = APIRouter()
 
+# Status values Meta sends in status callbacks; anything else is counted as "other"
+KNOWN_STATUSES = {"sent", "delivered", "read", "failed", "deleted"}
+
 @router.get("/webhook")
 def verify_webhook(
     hub_mode: str = None,
@@ -18,14 +24,42 @@ def verify_webhook(
     raise HTTPException(status_code=403, detail="Verification failed")
 
 @router.post("/webhook")
-def webhook_handler(request: Request, db: Session = Depends(get_db)):
-    """Handler for webhooks from WhatsApp"""
+async def webhook_handler(request: Request):
+    """Handler for webhooks from WhatsApp.
+
+    Only parses the payload and queues the messages; answering happens in
+    webhook_pipeline workers so Meta is acknowledged immediately.
+    """
     try:
         # Log webhook receipt
         logger.info("Received webhook request")
         
+        body = await request.json()
+        queued = 0
+        for event in WhatsAppClient.iter_webhook_events(body):
+            if event["kind"] == "status":
+                status = event.get("status")
+                webhook_statuses_total.labels(
+                    status=status if status in KNOWN_STATUSES else "other"
+                ).inc()
+                continue
+            
+            # Retries of recently queued messages stop here; the DB insert catches the rest
+            message_id = event.get("message_id")
+            if message_id in recent_message_ids:
+                webhook_messages_total.labels(status="duplicate").inc()
+                continue
+            
+            if not webhook_pipeline.enqueue(event):
+                # Queue is full: a non-2xx makes Meta redeliver the whole batch later
+                logger.warning(f"Webhook queue full after {queued} messages, asking Meta to retry")
+                return JSONResponse(status_code=503, content={"status": "busy"})
+            if message_id:
+                recent_message_ids.add(message_id)
+            queued += 1
+        
         # Return successful response
-        return {"status": "ok"}
+        return {"status": "ok", "queued": queued}
     except Exception as e:
         logger.error(f"Error in webhook handler: {str(e)}")
         return {"status": "error", "message": str(e)}
@@ -6,11 +6,127 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = Field(..., env="DATABASE_URL")
     
+    # Async connection pool for the request path
+    DB_POOL_SIZE: int = Field(10, env="DB_POOL_SIZE")
+    DB_MAX_OVERFLOW: int = Field(20, env="DB_MAX_OVERFLOW")
+    DB_POOL_TIMEOUT_SECONDS: float = Field(30.0, env="DB_POOL_TIMEOUT_SECONDS")
+    DB_POOL_RECYCLE_SECONDS: int = Field(1800, env="DB_POOL_RECYCLE_SECONDS")
+    DB_POOL_PRE_PING: bool = Field(True, env="DB_POOL_PRE_PING")
+    DB_STATEMENT_TIMEOUT_MS: int = Field(30000, env="DB_STATEMENT_TIMEOUT_MS")
+    
     # WhatsApp API
     WH_TOKEN: str = Field(..., env="WH_TOKEN")
+    WHATSAPP_API_BASE_URL: str = Field("https://graph.facebook.com", env="WHATSAPP_API_BASE_URL")  # benchmarks point this at a stand-in
+    
+    # Shared outbound HTTP client for the Graph API
+    WHATSAPP_HTTP2: bool = Field(True, env="WHATSAPP_HTTP2")
+    WHATSAPP_MAX_CONNECTIONS: int = Field(100, env="WHATSAPP_MAX_CONNECTIONS")
+    WHATSAPP_MAX_KEEPALIVE_CONNECTIONS: int = Field(20, env="WHATSAPP_MAX_KEEPALIVE_CONNECTIONS")
+    WHATSAPP_KEEPALIVE_EXPIRY_SECONDS: float = Field(60.0, env="WHATSAPP_KEEPALIVE_EXPIRY_SECONDS")
+    WHATSAPP_TIMEOUT_SECONDS: float = Field(10.0, env="WHATSAPP_TIMEOUT_SECONDS")
+    
+    # Outbound scheduler (rate is per business phone number)
+    OUTBOUND_RATE_PER_SECOND: float = Field(20.0, env="OUTBOUND_RATE_PER_SECOND")
+    OUTBOUND_BURST: int = Field(20, env="OUTBOUND_BURST")
+    OUTBOUND_MAX_CONCURRENCY: int = Field(32, env="OUTBOUND_MAX_CONCURRENCY")
+    OUTBOUND_MAX_ATTEMPTS: int = Field(5, env="OUTBOUND_MAX_ATTEMPTS")
+    OUTBOUND_BACKOFF_BASE_SECONDS: float = Field(0.5, env="OUTBOUND_BACKOFF_BASE_SECONDS")
+    OUTBOUND_BACKOFF_MAX_SECONDS: float = Field(30.0, env="OUTBOUND_BACKOFF_MAX_SECONDS")
     
     # AI Service
     OPENAI_API_KEY: str = Field(None, env="OPENAI_API_KEY")
+    OPENAI_BASE_URL: str = Field(None, env="OPENAI_BASE_URL")  # e.g. http://127.0.0.1:8100/v1 for benchmarks
+    
+    # RAG answer generation (chat completions)
+    RAG_CHAT_MODEL: str = Field("gpt-4o", env="RAG_CHAT_MODEL")
+    RAG_TEMPERATURE: float = Field(0.2, env="RAG_TEMPERATURE")
+    RAG_MAX_COMPLETION_TOKENS: int = Field(512, env="RAG_MAX_COMPLETION_TOKENS")
+    RAG_MAX_PROMPT_TOKENS: int = Field(4000, env="RAG_MAX_PROMPT_TOKENS")  # FAQ context is trimmed to fit
+    RAG_RETRIEVAL_CANDIDATES: int = Field(10, env="RAG_RETRIEVAL_CANDIDATES")  # FAQs retrieved before packing
+    RAG_CONTEXT_MAX_TOKENS: int = Field(2000, env="RAG_CONTEXT_MAX_TOKENS")  # budget for the packed FAQ context
+    RAG_CONTEXT_DEDUP_THRESHOLD: float = Field(0.97, env="RAG_CONTEXT_DEDUP_THRESHOLD")  # cosine similarity
+    
+    # Embedding provider: "openai" or "local" (sentence-transformers on the CPU)
+    EMBEDDING_PROVIDER: str = Field("openai", env="EMBEDDING_PROVIDER")
+    EMBEDDING_LOCAL_MODEL: str = Field("sentence-transformers/all-MiniLM-L6-v2", env="EMBEDDING_LOCAL_MODEL")
+    EMBEDDING_LOCAL_BACKEND: str = Field("torch", env="EMBEDDING_LOCAL_BACKEND")  # torch, onnx
+    EMBEDDING_LOCAL_QUANTIZE: bool = Field(False, env="EMBEDDING_LOCAL_QUANTIZE")  # dynamic int8, torch backend only
+    EMBEDDING_LOCAL_ONNX_FILE: str = Field(None, env="EMBEDDING_LOCAL_ONNX_FILE")  # e.g. onnx/model_qint8_avx512_vnni.onnx
+    EMBEDDING_LOCAL_BATCH_SIZE: int = Field(32, env="EMBEDDING_LOCAL_BATCH_SIZE")
+    EMBEDDING_LOCAL_EXECUTOR: str = Field("thread", env="EMBEDDING_LOCAL_EXECUTOR")  # thread, process
+    EMBEDDING_LOCAL_WORKERS: int = Field(1, env="EMBEDDING_LOCAL_WORKERS")
+    
+    # Embedding request coalescing
+    EMBEDDING_BATCH_MAX_SIZE: int = Field(64, env="EMBEDDING_BATCH_MAX_SIZE")
+    EMBEDDING_BATCH_WAIT_MS: float = Field(10.0, env="EMBEDDING_BATCH_WAIT_MS")
+    
+    # Embedding cache
+    EMBEDDING_CACHE_MAX_ENTRIES: int = Field(5000, env="EMBEDDING_CACHE_MAX_ENTRIES")
+    EMBEDDING_CACHE_TTL_SECONDS: float = Field(86400.0, env="EMBEDDING_CACHE_TTL_SECONDS")
+    EMBEDDING_CACHE_PERSISTENT: bool = Field(False, env="EMBEDDING_CACHE_PERSISTENT")
+    
+    # In-memory FAQ vector index
+    VECTOR_INDEX_ENABLED: bool = Field(False, env="VECTOR_INDEX_ENABLED")
+    VECTOR_INDEX_MAX_TENANTS: int = Field(64, env="VECTOR_INDEX_MAX_TENANTS")
+    VECTOR_INDEX_MAX_AGE_SECONDS: float = Field(300.0, env="VECTOR_INDEX_MAX_AGE_SECONDS")
+    
+    # pgvector ANN search (per-query defaults, overridable in find_relevant_faqs)
+    PGVECTOR_HNSW_EF_SEARCH: int = Field(40, env="PGVECTOR_HNSW_EF_SEARCH")
+    PGVECTOR_IVFFLAT_PROBES: int = Field(10, env="PGVECTOR_IVFFLAT_PROBES")
+    PGVECTOR_ITERATIVE_SCAN: str = Field("strict_order", env="PGVECTOR_ITERATIVE_SCAN")  # off, strict_order, relaxed_order; off for pgvector < 0.8
+    
+    # Hybrid retrieval: full-text and pgvector ranks fused with reciprocal rank fusion (Postgres only)
+    HYBRID_SEARCH_ENABLED: bool = Field(False, env="HYBRID_SEARCH_ENABLED")
+    HYBRID_RRF_K: int = Field(60, env="HYBRID_RRF_K")
+    HYBRID_CANDIDATES: int = Field(50, env="HYBRID_CANDIDATES")  # taken from each ranking before fusion
+    # Short queries whose best full-text match scores at least this (ts_rank_cd normalized to 0..1)
+    # are answered from the lexical ranking alone, without an embedding call
+    HYBRID_LEXICAL_CONFIDENCE: float = Field(0.5, env="HYBRID_LEXICAL_CONFIDENCE")
+    HYBRID_LEXICAL_MAX_QUERY_WORDS: int = Field(4, env="HYBRID_LEXICAL_MAX_QUERY_WORDS")
+    
+    # Semantic response cache for RAG answers
+    RESPONSE_CACHE_ENABLED: bool = Field(False, env="RESPONSE_CACHE_ENABLED")
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD: float = Field(0.95, env="RESPONSE_CACHE_SIMILARITY_THRESHOLD")
+    RESPONSE_CACHE_MAX_ENTRIES: int = Field(256, env="RESPONSE_CACHE_MAX_ENTRIES")
+    RESPONSE_CACHE_TTL_SECONDS: float = Field(3600.0, env="RESPONSE_CACHE_TTL_SECONDS")
+    RESPONSE_CACHE_MAX_TENANTS: int = Field(100, env="RESPONSE_CACHE_MAX_TENANTS")
+    
+    # Conversation history for webhook replies (in-memory ring per user in front of the messages table)
+    CONVERSATION_HISTORY_ENABLED: bool = Field(True, env="CONVERSATION_HISTORY_ENABLED")
+    CONVERSATION_HISTORY_TURNS: int = Field(6, env="CONVERSATION_HISTORY_TURNS")
+    CONVERSATION_HISTORY_MAX_TOKENS: int = Field(800, env="CONVERSATION_HISTORY_MAX_TOKENS")
+    CONVERSATION_MEMORY_MAX_USERS: int = Field(10000, env="CONVERSATION_MEMORY_MAX_USERS")
+    CONVERSATION_MEMORY_TTL_SECONDS: float = Field(1800.0, env="CONVERSATION_MEMORY_TTL_SECONDS")
+    
+    # Monthly partitions of the messages table (see app/services/message_partitions.py)
+    MESSAGES_PARTITION_MONTHS_AHEAD: int = Field(3, env="MESSAGES_PARTITION_MONTHS_AHEAD")
+    MESSAGES_RETENTION_MONTHS: int = Field(12, env="MESSAGES_RETENTION_MONTHS")  # full months kept besides the current one
+    MESSAGES_ARCHIVE_DIR: str = Field("archive/messages", env="MESSAGES_ARCHIVE_DIR")  # put on a persistent volume
+    
+    # Admin list endpoints: filtered totals are counted up to this many rows
+    PAGINATION_COUNT_CAP: int = Field(10000, env="PAGINATION_COUNT_CAP")
+    
+    # Tenant configuration cache (Redis pub/sub spreads invalidations across workers)
+    TENANT_CACHE_TTL_SECONDS: float = Field(60.0, env="TENANT_CACHE_TTL_SECONDS")
+    TENANT_CACHE_MAX_ENTRIES: int = Field(10000, env="TENANT_CACHE_MAX_ENTRIES")
+    TENANT_CACHE_REDIS_URL: str = Field(None, env="TENANT_CACHE_REDIS_URL")
+    
+    # Per-stage RAG timings in a Server-Timing response header on /rag endpoints
+    RAG_SERVER_TIMING_ENABLED: bool = Field(False, env="RAG_SERVER_TIMING_ENABLED")
+    
+    # Webhook ingestion pipeline
+    WEBHOOK_QUEUE_MAXSIZE: int = Field(1000, env="WEBHOOK_QUEUE_MAXSIZE")
+    WEBHOOK_WORKERS: int = Field(4, env="WEBHOOK_WORKERS")
+    WEBHOOK_SHUTDOWN_TIMEOUT_SECONDS: float = Field(10.0, env="WEBHOOK_SHUTDOWN_TIMEOUT_SECONDS")
+    WEBHOOK_BATCH_MAX_SIZE: int = Field(50, env="WEBHOOK_BATCH_MAX_SIZE")
+    WEBHOOK_SEEN_IDS_MAX: int = Field(100000, env="WEBHOOK_SEEN_IDS_MAX")
+    WEBHOOK_SEEN_IDS_TTL_SECONDS: float = Field(3600.0, env="WEBHOOK_SEEN_IDS_TTL_SECONDS")
+    
+    # Celery (background jobs such as bulk FAQ imports)
+    CELERY_BROKER_URL: str = Field("redis://localhost:6379/0", env="CELERY_BROKER_URL")
+    CELERY_RESULT_BACKEND: str = Field("redis://localhost:6379/1", env="CELERY_RESULT_BACKEND")
+    BULK_IMPORT_CHUNK_SIZE: int = Field(500, env="BULK_IMPORT_CHUNK_SIZE")
+    BULK_IMPORT_MAX_ERRORS: int = Field(100, env="BULK_IMPORT_MAX_ERRORS")  # per-item errors kept in the task result
     
     # Logging
     LOG_LEVEL: str = Field("INFO", env="LOG_LEVEL")
@@ -1,5 +1,9 @@
 import os
+from typing import AsyncIterator, Optional
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -8,16 +12,72 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-# Create engine
+# Create engine (synchronous: Celery workers, scripts and thread-pool helpers)
 engine = create_engine(DATABASE_URL)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the request path, created on first use
+_async_engine: Optional[AsyncEngine] = None
+_async_session_factory: Optional[async_sessionmaker] = None
+
+
+def _async_database_url(database_url: str):
+    """Point a Postgres URL at the asyncpg driver, translating libpq's sslmode."""
+    url = make_url(database_url)
+    if url.get_backend_name() not in ("postgresql", "postgres"):
+        return url
+    url = url.set(drivername="postgresql+asyncpg")
+    if "sslmode" in url.query:
+        # asyncpg accepts the same values under the name `ssl`
+        url = url.difference_update_query(["sslmode"]).update_query_dict({"ssl": url.query["sslmode"]})
+    return url
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        from app.core.config import settings
+
+        _async_engine = create_async_engine(
+            _async_database_url(DATABASE_URL),
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+            connect_args={
+                # Enforced by the server, so a runaway query cannot hold a pooled connection forever.
+                # Vectors travel in pgvector's text format, which the ORM `Vector` type already handles.
+                "server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)},
+            },
+        )
+        _async_session_factory = async_sessionmaker(
+            _async_engine,
+            class_=AsyncSession,
+            autoflush=False,
+            # Objects stay usable after commit without a lazy load (which async sessions cannot do)
+            expire_on_commit=False,
+        )
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    """Open a new AsyncSession on the shared async engine."""
+    get_async_engine()
+    return _async_session_factory()
+
+
+async def dispose_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_session_factory = None
+
+
 # Function to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
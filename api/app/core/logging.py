@@ -19,3 +19,12 @@ logger.setLevel(logging_module.INFO)
 
 # Export logger as logging for backward compatibility
 logging = logger
+
+def get_logger(name: str):
+    """Return a named logger that writes through the shared console handler."""
+    named_logger = logging_module.getLogger(name)
+    if console_handler not in named_logger.handlers:
+        named_logger.addHandler(console_handler)
+        named_logger.setLevel(logging_module.INFO)
+        named_logger.propagate = False
+    return named_logger
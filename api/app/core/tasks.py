@@ -0,0 +1,248 @@
+"""Celery application and background tasks.
+
+Start a worker with:
+
+    celery -A app.core.tasks worker --loglevel=INFO
+
+and, for the scheduled maintenance jobs, one beat process:
+
+    celery -A app.core.tasks beat --loglevel=INFO
+
+`process_bulk_faq_import` streams an import through fixed-size chunks: each
+chunk is embedded with one batched call and written with a single COPY (or
+multi-row INSERT off Postgres) in its own transaction, and progress is
+published through the task state so the admin API can report it.
+"""
+
+import asyncio
+import csv
+import io
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from celery import Celery
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.models.faq import FAQ
+from app.services.monitoring import track_celery_task
+
+logger = get_logger(__name__)
+
+celery_app = Celery(
+    "lumi",
+    broker=settings.CELERY_BROKER_URL,
+    backend=settings.CELERY_RESULT_BACKEND,
+)
+celery_app.conf.update(
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    task_track_started=True,
+    # Stores task kwargs with the result, so a failed import can still be matched to its tenant
+    result_extended=True,
+    # Imports are long-running; do not let one worker hoard queued jobs
+    worker_prefetch_multiplier=1,
+    beat_schedule={
+        "maintain-message-partitions": {
+            "task": "app.core.tasks.maintain_message_partitions",
+            "schedule": 24 * 60 * 60,
+        },
+    },
+)
+
+FAQ_COPY_COLUMNS = (
+    "tenant_id", "question", "answer", "embedding", "embedding_model", "embedding_dim", "token_count", "ts",
+)
+
+# One event loop per worker process. The OpenAI client and the embedding cache
+# hold loop-bound connections, so they must not see a fresh loop per task.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def run_async(coroutine):
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop.run_until_complete(coroutine)
+
+
+def _vector_literal(embedding: List[float]) -> str:
+    return "[" + ",".join(str(float(value)) for value in embedding) + "]"
+
+
+def insert_faq_rows(db: Session, rows: List[Dict]):
+    """Write FAQ rows in one round trip: COPY on Postgres, a multi-row INSERT elsewhere."""
+    if not rows:
+        return
+    if db.get_bind().dialect.name != "postgresql":
+        db.execute(insert(FAQ), rows)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            _vector_literal(row[column]) if column == "embedding" else row[column]
+            for column in FAQ_COPY_COLUMNS
+        ])
+    buffer.seek(0)
+
+    # COPY runs on the session's own connection, so it commits with the chunk
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY faqs ({', '.join(FAQ_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def import_faqs(
+    db: Session,
+    tenant_id: str,
+    import_items: List[Dict],
+    chunk_size: int,
+    on_progress: Optional[Callable[[Dict], None]] = None,
+) -> Dict:
+    """Embed and insert FAQ items chunk by chunk, committing after each chunk.
+
+    Items that fail validation or embedding are reported in `errors` and do not
+    stop the import; a chunk whose write fails is rolled back and counted as failed.
+    """
+    # Imported here so the Celery app can be loaded without the AI stack
+    from app.services.ai import embedding_columns, generate_embeddings
+    from app.services.rag_context import faq_token_count
+
+    progress = {
+        "tenant_id": tenant_id,
+        "total_items": len(import_items),
+        "processed_items": 0,
+        "successful_items": 0,
+        "failed_items": 0,
+        "errors": [],
+    }
+
+    def record_error(position: int, message: str):
+        progress["failed_items"] += 1
+        if len(progress["errors"]) < settings.BULK_IMPORT_MAX_ERRORS:
+            progress["errors"].append({"index": position, "error": message})
+
+    chunk_size = max(1, chunk_size)
+    for chunk_start in range(0, len(import_items), chunk_size):
+        chunk = list(enumerate(import_items[chunk_start:chunk_start + chunk_size], start=chunk_start))
+
+        valid = []
+        for position, item in chunk:
+            question, answer = item.get("question"), item.get("answer")
+            if not question or not answer:
+                record_error(position, "question and answer are required")
+            else:
+                valid.append((position, question, answer))
+
+        embeddings = run_async(generate_embeddings([
+            f"Question: {question} Answer: {answer}" for _, question, answer in valid
+        ])) if valid else []
+        columns = embedding_columns() if valid else {}
+
+        now = datetime.utcnow()
+        rows, row_positions = [], []
+        for (position, question, answer), embedding in zip(valid, embeddings):
+            if embedding is None:
+                record_error(position, "failed to generate embedding")
+                continue
+            row_positions.append(position)
+            rows.append({
+                "tenant_id": tenant_id,
+                "question": question,
+                "answer": answer,
+                "embedding": embedding,
+                "token_count": faq_token_count(question, answer),
+                "ts": now,
+                **columns,
+            })
+
+        try:
+            insert_faq_rows(db, rows)
+            db.commit()
+            progress["successful_items"] += len(rows)
+        except Exception as e:
+            db.rollback()
+            logger.error("Error writing bulk import chunk", extra={
+                "tenant_id": tenant_id,
+                "chunk_start": chunk_start,
+                "rows": len(rows)
+            }, exc_info=e)
+            for position in row_positions:
+                record_error(position, f"database write failed: {type(e).__name__}")
+
+        progress["processed_items"] += len(chunk)
+        if on_progress is not None:
+            on_progress(progress)
+
+    return progress
+
+
+@celery_app.task(bind=True, name="app.core.tasks.process_bulk_faq_import")
+@track_celery_task("process_bulk_faq_import")
+def process_bulk_faq_import(self, tenant_id: str, import_items: List[Dict]) -> Dict:
+    """Celery entry point for admin bulk FAQ imports."""
+    from app.core.database import SessionLocal
+    from app.services.tenant_cache import publish_faq_invalidation
+
+    logger.info("Bulk FAQ import started", extra={
+        "task_id": self.request.id,
+        "tenant_id": tenant_id,
+        "items_count": len(import_items)
+    })
+
+    def report(progress: Dict):
+        self.update_state(state="PROGRESS", meta=progress)
+
+    db = SessionLocal()
+    try:
+        result = import_faqs(db, tenant_id, import_items, settings.BULK_IMPORT_CHUNK_SIZE, on_progress=report)
+    finally:
+        db.close()
+
+    logger.info("Bulk FAQ import finished", extra={
+        "task_id": self.request.id,
+        "tenant_id": tenant_id,
+        "successful_items": result["successful_items"],
+        "failed_items": result["failed_items"]
+    })
+
+    # The API workers' response caches and vector indexes still hold the old FAQs
+    if result["successful_items"]:
+        try:
+            publish_faq_invalidation(tenant_id)
+        except Exception as e:
+            logger.error("Error publishing FAQ cache invalidation", extra={
+                "task_id": self.request.id,
+                "tenant_id": tenant_id,
+                "error_type": type(e).__name__
+            }, exc_info=e)
+    return result
+
+
+@celery_app.task(name="app.core.tasks.maintain_message_partitions")
+@track_celery_task("maintain_message_partitions")
+def maintain_message_partitions() -> Dict:
+    """Daily: create the upcoming messages partitions and archive the expired ones."""
+    from app.core.database import SessionLocal
+    from app.services.message_partitions import apply_retention, ensure_partitions
+
+    db = SessionLocal()
+    try:
+        created = ensure_partitions(db)
+        result = apply_retention(db)
+    finally:
+        db.close()
+
+    result["partitions_created"] = created
+    logger.info("Messages partition maintenance finished", extra=result)
+    return result
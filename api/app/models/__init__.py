@@ -2,5 +2,6 @@ from .base import Base
 from .tenant import Tenant
 from .message import Message
 from .faq import FAQ
+from .embedding_cache import EmbeddingCacheEntry
 
-__all__ = ["Base", "Tenant", "Message", "FAQ"]
+__all__ = ["Base", "Tenant", "Message", "FAQ", "EmbeddingCacheEntry"]
@@ -12,4 +12,9 @@ class FAQ(Base):
     question: Mapped[str] = mapped_column(Text, nullable=False)
     answer: Mapped[str] = mapped_column(Text, nullable=False)
     embedding: Mapped[Vector] = mapped_column(Vector(1536), nullable=True)
+    # Provider model that produced `embedding` and its native width (the rest is zero padding)
+    embedding_model: Mapped[str] = mapped_column(String, nullable=True)
+    embedding_dim: Mapped[int] = mapped_column(Integer, nullable=True)
+    # Tokens the FAQ takes in a RAG prompt, counted on write (NULL for rows written before the column)
+    token_count: Mapped[int] = mapped_column(Integer, nullable=True)
     ts: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
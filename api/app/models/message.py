@@ -1,14 +1,26 @@
-from sqlalchemy import String, Text, DateTime, Integer, Enum, ForeignKey
+from sqlalchemy import BigInteger, String, Text, DateTime, Enum, ForeignKey, Identity, Index, UniqueConstraint, desc
 from sqlalchemy.orm import Mapped, mapped_column
 from datetime import datetime
 from .base import Base
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Unique keys of a partitioned table must include the partition key (ts)
+        UniqueConstraint("wa_msg_id", "ts", name="uq_messages_wa_msg_id_ts"),
+        # Last N turns of one conversation, newest first (also serves lookups by tenant_id)
+        Index("ix_messages_tenant_user_ts", "tenant_id", "user_phone", desc("ts")),
+        # Keyset pages of a tenant's message history, newest first
+        Index("ix_messages_tenant_ts_id", "tenant_id", desc("ts"), desc("id")),
+        # Monthly partitions, see app/services/message_partitions.py
+        {"postgresql_partition_by": "RANGE (ts)"},
+    )
     
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    tenant_id: Mapped[str] = mapped_column(String, ForeignKey("tenants.id"), index=True)
-    wa_msg_id: Mapped[str] = mapped_column(String, unique=True)
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    tenant_id: Mapped[str] = mapped_column(String, ForeignKey("tenants.id"))
+    wa_msg_id: Mapped[str] = mapped_column(String, nullable=True)
+    # WhatsApp id of the end user the conversation is with (sender of inbound, recipient of outbound turns)
+    user_phone: Mapped[str] = mapped_column(String, nullable=True)
     role: Mapped[str] = mapped_column(Enum("user", "assistant", "system", name="role_enum"))
     text: Mapped[str] = mapped_column(Text)
-    ts: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    ts: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=datetime.utcnow)
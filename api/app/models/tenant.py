@@ -9,3 +9,5 @@ class Tenant(Base):
     phone_id: Mapped[str] = mapped_column(String, unique=True, nullable=False)
     wh_token: Mapped[str] = mapped_column(Text, nullable=False)
     system_prompt: Mapped[str] = mapped_column(Text, default="You are a helpful assistant.")
+    # Service tier, used as a low-cardinality metrics label
+    tier: Mapped[str] = mapped_column(String, nullable=False, default="standard", server_default="standard")
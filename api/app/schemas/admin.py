@@ -7,12 +7,15 @@ T = TypeVar('T')
 
 class PaginatedResponse(BaseModel, Generic[T]):
     items: List[T]
-    total: int
-    page: int
+    # Cursor pages leave total out unless include_total is set, and may estimate it
+    total: Optional[int] = None
+    total_is_approximate: bool = False
+    page: Optional[int] = None  # Only for page-number pagination
     page_size: int
-    total_pages: int
+    total_pages: Optional[int] = None  # Only for page-number pagination
     has_next: bool
     has_prev: bool
+    next_cursor: Optional[str] = Field(None, description="Pass as `cursor` to get the next page; null on the last page")
 
 # === Filter Schemas ===
 class TenantFilter(BaseModel):
@@ -25,6 +28,7 @@ class FAQFilter(BaseModel):
     search_text: Optional[str] = None  # For full-text search across question and answer
 
 class MessageFilter(BaseModel):
+    user_phone: Optional[str] = None
     role: Optional[str] = None
     text_contains: Optional[str] = None
     from_date: Optional[datetime] = None
@@ -35,6 +39,7 @@ class TenantBase(BaseModel):
     phone_id: str = Field(..., description="WhatsApp Phone Number ID for the tenant")
     wh_token: str = Field(..., description="WhatsApp Permanent Token for the tenant")
     system_prompt: Optional[str] = Field("You are a helpful assistant.", description="Default system prompt for the AI")
+    tier: str = Field("standard", description="Service tier of the tenant (e.g. standard, premium)")
 
 class TenantCreate(TenantBase):
     id: str = Field(..., description="Unique identifier for the tenant (e.g., a slug or UUID)")
@@ -43,6 +48,7 @@ class TenantUpdate(BaseModel):
     phone_id: Optional[str] = None
     wh_token: Optional[str] = None
     system_prompt: Optional[str] = None
+    tier: Optional[str] = None
 
 class TenantResponse(TenantBase):
     id: str
@@ -67,6 +73,7 @@ class FAQResponse(FAQBase):
     id: int
     tenant_id: str
     # embedding: Optional[List[float]] = None # Decide if embedding should be in response
+    embedding_model: Optional[str] = None
     ts: Optional[datetime] = None # Assuming 'ts' is part of your FAQ model
 
     class Config:
@@ -90,6 +97,7 @@ class MessageResponse(MessageBase):
     id: int
     tenant_id: str
     wa_msg_id: Optional[str] = None
+    user_phone: Optional[str] = None
     ts: datetime
 
     class Config:
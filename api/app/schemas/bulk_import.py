@@ -13,3 +13,13 @@ class BulkFAQImportResponse(BaseModel):
     successful_items: int = Field(..., description="Number of successfully imported items")
     failed_items: int = Field(..., description="Number of items that failed to import")
     errors: Optional[List[Dict[str, Any]]] = Field(None, description="List of errors encountered during import")
+    task_id: Optional[str] = Field(None, description="ID of the background import task")
+
+class BulkFAQImportStatusResponse(BaseModel):
+    task_id: str = Field(..., description="ID of the background import task")
+    status: str = Field(..., description="Celery task state: PENDING, STARTED, PROGRESS, SUCCESS or FAILURE")
+    total_items: Optional[int] = Field(None, description="Total number of items in the import")
+    processed_items: int = Field(0, description="Number of items processed so far")
+    successful_items: int = Field(0, description="Number of items imported so far")
+    failed_items: int = Field(0, description="Number of items that failed so far")
+    errors: Optional[List[Dict[str, Any]]] = Field(None, description="Errors encountered so far (capped)")
@@ -1,4 +1,6 @@
 # api/schemas/rag.py
+from typing import Dict, Optional
+
 from pydantic import BaseModel, Field
 
 class RAGQueryRequest(BaseModel):
@@ -10,4 +12,5 @@ class RAGResponse(BaseModel):
     tenant_id: str = Field(..., description="The ID of the tenant for whom the query was made.")
     query: str = Field(..., description="The original user query.")
     # Potentially add retrieved_context or source_faqs_ids for debugging/transparency
+    timings_ms: Optional[Dict[str, float]] = Field(None, description="Per-stage latency in milliseconds (only with debug=true).")
   
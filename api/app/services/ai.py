@@ -1,21 +1,53 @@
 # api/ai.py с интеграцией структурированного логирования и мониторинга
+import asyncio
 import os
+from typing import AsyncIterator
+
 from openai import AsyncOpenAI
-from sqlalchemy.orm import Session
+from sqlalchemy import Float, bindparam, column, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from models import FAQ  # Assuming FAQ model is in models.py
-from logging_utils import get_logger
-from monitoring_utils import track_openai_call
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.models.faq import FAQ
+from app.services.embedding_cache import embedding_cache
+from app.services.embedding_providers import EmbeddingProvider, SentenceTransformerProvider, pad_embedding
+from app.services.monitoring import StageTimer, track_openai_call, track_openai_stream
+from app.services.response_cache import response_cache
+from app.services.rag_context import format_faq_entry, pack_faq_context
+from app.services.tokens import TOKENS_PER_REPLY, count_message_tokens
+from app.services.vector_index import vector_index
 
 # Инициализируем структурированный логгер
 logger = get_logger(__name__)
 
 # --- Configuration --- #
 EMBEDDING_MODEL_NAME = "text-embedding-ada-002"  # OpenAI model with 1536 dimensions
-EMBEDDING_DIM = 1536  # Fixed dimension for OpenAI text-embedding-ada-002
+EMBEDDING_DIM = FAQ.__table__.c.embedding.type.dim  # Width of the stored vectors; narrower providers are zero-padded
+EMBEDDING_MAX_INPUTS_PER_REQUEST = 2048  # OpenAI limit on inputs per embeddings request
 client = None
+embedding_provider: EmbeddingProvider | None = None
 
-def load_embedding_model():
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI API through the module-level `client`."""
+
+    name = "openai"
+
+    def __init__(self):
+        super().__init__(EMBEDDING_MODEL_NAME, dimension=1536, max_batch_size=EMBEDDING_MAX_INPUTS_PER_REQUEST)
+
+    @property
+    def ready(self) -> bool:
+        return client is not None
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        # Проверка API ключа перед запросом
+        if not os.getenv("OPENAI_API_KEY"):
+            logger.error("OPENAI_API_KEY is missing before embedding request")
+            raise RuntimeError("OPENAI_API_KEY environment variable not set")
+        return await _request_embeddings(texts)
+
+def _load_openai_client():
     global client
     if client is None:
         try:
@@ -30,96 +62,440 @@ def load_embedding_model():
                 "api_key_length": len(api_key)
             })
             
-            client = AsyncOpenAI(api_key=api_key)
+            # OPENAI_BASE_URL=None keeps the SDK default (api.openai.com or the SDK's own env variable)
+            client = AsyncOpenAI(api_key=api_key, base_url=settings.OPENAI_BASE_URL)
             logger.info("OpenAI client initialized", extra={"embedding_dimension": EMBEDDING_DIM})
         except Exception as e:
             logger.error("Error initializing OpenAI client", exc_info=e)
             client = None
 
+def load_embedding_model():
+    """Creates the embedding provider selected by EMBEDDING_PROVIDER."""
+    global embedding_provider
+    if settings.EMBEDDING_PROVIDER == "local":
+        if embedding_provider is None:
+            # The model itself is loaded lazily in the worker pool (or by warmup at startup)
+            embedding_provider = SentenceTransformerProvider(
+                model_name=settings.EMBEDDING_LOCAL_MODEL,
+                backend=settings.EMBEDDING_LOCAL_BACKEND,
+                quantize=settings.EMBEDDING_LOCAL_QUANTIZE,
+                onnx_file=settings.EMBEDDING_LOCAL_ONNX_FILE,
+                batch_size=settings.EMBEDDING_LOCAL_BATCH_SIZE,
+                executor=settings.EMBEDDING_LOCAL_EXECUTOR,
+                workers=settings.EMBEDDING_LOCAL_WORKERS,
+            )
+            logger.info("Using local embedding provider", extra={"model": settings.EMBEDDING_LOCAL_MODEL})
+        return
+
+    _load_openai_client()
+    if embedding_provider is None:
+        embedding_provider = OpenAIEmbeddingProvider()
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """Returns the configured provider, retrying initialization once if it failed at startup."""
+    if embedding_provider is None or not embedding_provider.ready:
+        logger.error("Embedding provider is not initialized.", extra={"provider": settings.EMBEDDING_PROVIDER})
+        # Attempt to reload the client if it failed initially
+        load_embedding_model()
+        if embedding_provider is None or not embedding_provider.ready:
+             raise RuntimeError("Embedding provider could not be initialized.")
+    return embedding_provider
+
+def embedding_columns() -> dict:
+    """FAQ column values describing vectors produced by the current provider."""
+    provider = get_embedding_provider()
+    return {"embedding_model": provider.model_name, "embedding_dim": provider.dimension}
+
+async def warmup_embedding_provider():
+    """Loads the provider's model ahead of the first request (a no-op for OpenAI)."""
+    if embedding_provider is None:
+        return
+    try:
+        await embedding_provider.warmup()
+    except Exception as e:
+        # Requests will retry the load; a failed warmup must not stop the app
+        logger.error("Embedding provider warmup failed", extra={"provider": embedding_provider.name}, exc_info=e)
+
+def close_embedding_provider():
+    if embedding_provider is not None:
+        embedding_provider.close()
+
 # Load the client at startup (when this module is imported)
 load_embedding_model()
 
 # --- Embedding Generation --- #
-@track_openai_call(model=EMBEDDING_MODEL_NAME, endpoint="embeddings")
+@track_openai_call(model=EMBEDDING_MODEL_NAME, endpoint="embeddings", batched=True)
+async def _request_embeddings(texts: list[str]) -> list[list[float]]:
+    """
+    Sends a single embeddings request for all texts and returns the vectors in input order.
+    """
+    response = await client.embeddings.create(
+        model=EMBEDDING_MODEL_NAME,
+        input=texts
+    )
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+async def generate_embeddings(texts: list[str], memory_checked: bool = False) -> list[list[float] | None]:
+    """
+    Generates vector embeddings for a batch of texts with as few provider calls as possible.
+    Texts already present in `embedding_cache` are served from it and never reach the provider.
+    Returns one entry per input text, in order, zero-padded to EMBEDDING_DIM; invalid texts
+    or failed requests yield None.
+
+    memory_checked=True tells the cache that the caller already missed its memory tier.
+    """
+    provider = get_embedding_provider()
+
+    results: list[list[float] | None] = [None] * len(texts)
+    valid_positions = [
+        position for position, text_content in enumerate(texts)
+        if text_content and isinstance(text_content, str)
+    ]
+    if len(valid_positions) < len(texts):
+        logger.warning("Invalid or empty text_content provided for embedding generation.", extra={
+            "invalid_count": len(texts) - len(valid_positions)
+        })
+    if not valid_positions:
+        return results
+
+    cached = await embedding_cache.get_many(
+        provider.model_name,
+        [texts[position] for position in valid_positions],
+        check_memory=not memory_checked,
+    )
+    for position, embedding in zip(valid_positions, cached):
+        results[position] = embedding
+    missing_positions = [position for position in valid_positions if results[position] is None]
+    if not missing_positions:
+        # Without an inference the local provider has not learnt its dimension,
+        # which embedding_columns() stores next to these vectors
+        if provider.dimension is None:
+            try:
+                await provider.resolve_dimension()
+            except Exception as e:
+                logger.error("Could not determine the embedding dimension", extra={
+                    "provider": provider.name,
+                    "error_type": type(e).__name__
+                }, exc_info=e)
+        return results
+
+    for chunk_start in range(0, len(missing_positions), provider.max_batch_size):
+        chunk_positions = missing_positions[chunk_start:chunk_start + provider.max_batch_size]
+        try:
+            embeddings = await provider.embed([texts[position] for position in chunk_positions])
+            embeddings = [pad_embedding(embedding, EMBEDDING_DIM) for embedding in embeddings]
+        except Exception as e:
+            # Структурированное логирование ошибок
+            logger.error("Error during embedding generation", extra={
+                "provider": provider.name,
+                "error_type": type(e).__name__,
+                "error_details": str(e),
+                "batch_size": len(chunk_positions)
+            }, exc_info=e)
+            continue
+
+        for position, embedding in zip(chunk_positions, embeddings):
+            results[position] = embedding
+        await embedding_cache.set_many(
+            provider.model_name,
+            [(texts[position], results[position]) for position in chunk_positions]
+        )
+
+    logger.info("Generated embeddings batch", extra={
+        "provider": provider.name,
+        "batch_size": len(valid_positions),
+        "cached_count": len(valid_positions) - len(missing_positions),
+        "failed_count": sum(1 for position in valid_positions if results[position] is None)
+    })
+    return results
+
+class EmbeddingCoalescer:
+    """
+    Gathers concurrent single-text embedding requests into one upstream batch.
+
+    The first pending request opens a window of `max_wait_ms`; the batch is flushed
+    when the window closes or as soon as `max_batch_size` texts are waiting, and each
+    caller receives its own vector. Identical texts within a batch are embedded once.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task] = set()
+
+    async def submit(self, text_content: str) -> list[float] | None:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text_content, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _run(self, batch: list[tuple[str, asyncio.Future]]):
+        unique_texts = list(dict.fromkeys(text_content for text_content, _ in batch))
+        try:
+            # Callers only get here after missing the memory tier in generate_embedding
+            embeddings = await generate_embeddings(unique_texts, memory_checked=True)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(unique_texts, embeddings))
+        for text_content, future in batch:
+            if not future.done():
+                future.set_result(by_text[text_content])
+
+embedding_coalescer = EmbeddingCoalescer(
+    max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+    max_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS,
+)
+
 async def generate_embedding(text_content: str) -> list[float] | None:
     """
-    Generates a vector embedding for the given text content using OpenAI API.
+    Generates a vector embedding for the given text content with the configured provider.
+    Cached texts are answered from `embedding_cache` immediately; concurrent misses
+    are coalesced into batched requests by `embedding_coalescer`.
     """
-    global client
-    if client is None:
-        logger.error("OpenAI client is not initialized. Cannot generate embedding.")
-        # Attempt to reload the client if it failed initially
-        load_embedding_model()
-        if client is None:
-             raise RuntimeError("OpenAI client could not be initialized.")
+    provider = get_embedding_provider()
 
     if not text_content or not isinstance(text_content, str):
         logger.warning("Invalid or empty text_content provided for embedding generation.")
         return None
-    
-    try:
-        logger.info("Generating embedding for text", extra={
-            "text_preview": text_content[:50] + "..." if len(text_content) > 50 else text_content,
-            "text_length": len(text_content)
-        })
-        
-        # Проверка API ключа перед запросом
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            logger.error("OPENAI_API_KEY is missing before embedding request")
-            return None
-        
-        response = await client.embeddings.create(
-            model=EMBEDDING_MODEL_NAME,
-            input=text_content
+
+    logger.info("Generating embedding for text", extra={
+        "text_preview": text_content[:50] + "..." if len(text_content) > 50 else text_content,
+        "text_length": len(text_content)
+    })
+
+    cached = embedding_cache.get(provider.model_name, text_content)
+    if cached is not None:
+        return cached
+    return await embedding_coalescer.submit(text_content)
+
+# --- Database Interaction with pgvector --- #
+async def _apply_ann_search_params(db: AsyncSession, top_k: int, ef_search: int | None, probes: int | None):
+    """
+    Sets pgvector's HNSW/IVFFlat search parameters for the current transaction only.
+    Higher ef_search/probes improve recall at the cost of latency. Iterative scans
+    (pgvector >= 0.8) keep scanning the index until enough rows survive the tenant filter;
+    with PGVECTOR_ITERATIVE_SCAN=off their settings are not sent at all, since older
+    pgvector versions reject them.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+
+    statement = "SELECT set_config('hnsw.ef_search', :ef_search, true), set_config('ivfflat.probes', :probes, true)"
+    params = {
+        # HNSW never returns more than ef_search candidates
+        "ef_search": str(max(ef_search or settings.PGVECTOR_HNSW_EF_SEARCH, top_k)),
+        "probes": str(probes or settings.PGVECTOR_IVFFLAT_PROBES),
+    }
+    if settings.PGVECTOR_ITERATIVE_SCAN != "off":
+        statement += (
+            ", set_config('hnsw.iterative_scan', :iterative_scan, true)"
+            # IVFFlat only supports relaxed ordering for iterative scans
+            ", set_config('ivfflat.iterative_scan', 'relaxed_order', true)"
         )
-        embedding = response.data[0].embedding
-        
-        # Логируем успешный результат
-        logger.info("Successfully generated embedding", extra={
-            "embedding_dimensions": len(embedding)
-        })
-        return embedding
+        params["iterative_scan"] = settings.PGVECTOR_ITERATIVE_SCAN
+    await db.execute(text(statement), params)
+
+async def _search_pgvector(
+    db: AsyncSession,
+    tenant_id: str,
+    query_embedding: list[float],
+    top_k: int,
+    ef_search: int | None = None,
+    probes: int | None = None,
+) -> list[FAQ]:
+    """Ranks the tenant's FAQs in the database with pgvector's cosine distance."""
+    await _apply_ann_search_params(db, top_k, ef_search, probes)
+
+    # Using SQLAlchemy's ORM with pgvector's cosine_distance
+    # Lower cosine_distance means higher similarity
+    result = await db.scalars(
+        select(FAQ)
+        .where(FAQ.tenant_id == tenant_id)
+        .where(FAQ.embedding != None)  # Ensure embedding is not null
+        .where(FAQ.embedding_model == embedding_provider.model_name)  # Only vectors from the same model are comparable
+        .order_by(FAQ.embedding.cosine_distance(query_embedding))
+        .limit(top_k)
+    )
+    return list(result.all())
+
+async def _search_vector_index(db: AsyncSession, tenant_id: str, query_embedding: list[float], top_k: int) -> list[FAQ]:
+    """Ranks the tenant's FAQs in the in-memory index and loads the winners by primary key."""
+    index = await vector_index.get_or_load(db, tenant_id, embedding_model=embedding_provider.model_name)
+    ranked = index.search(query_embedding, top_k)
+    if not ranked:
+        return []
+
+    faq_ids = [faq_id for faq_id, _ in ranked]
+    faqs_by_id = {faq.id: faq for faq in await db.scalars(select(FAQ).where(FAQ.id.in_(faq_ids)))}
+    return [faqs_by_id[faq_id] for faq_id in faq_ids if faq_id in faqs_by_id]
+
+# Columns of the FAQ model (faqs.search_vector is maintained by Postgres and not mapped)
+_FAQ_COLUMNS = ", ".join(f"faqs.{faq_column.name}" for faq_column in FAQ.__table__.columns)
+# 'simple' matches the configuration the search_vector column is generated with
+_TSQUERY = "websearch_to_tsquery('simple', :query_text)"
+
+_LEXICAL_SEARCH_SQL = text(f"""
+    SELECT {_FAQ_COLUMNS}, ts_rank_cd(faqs.search_vector, query, 32) AS lexical_score
+    FROM faqs, {_TSQUERY} AS query
+    WHERE faqs.tenant_id = :tenant_id AND faqs.search_vector @@ query
+    ORDER BY lexical_score DESC, faqs.id
+    LIMIT :top_k
+""")
+
+# Both rankings and their reciprocal rank fusion in one statement. Each ranking is
+# limited in a subquery first, so the vector side can still use the ANN index.
+_HYBRID_SEARCH_SQL = text(f"""
+    WITH lexical AS (
+        SELECT id, row_number() OVER (ORDER BY score DESC, id) AS rank
+        FROM (
+            SELECT faqs.id, ts_rank_cd(faqs.search_vector, query, 32) AS score
+            FROM faqs, {_TSQUERY} AS query
+            WHERE faqs.tenant_id = :tenant_id AND faqs.search_vector @@ query
+            ORDER BY score DESC
+            LIMIT :candidates
+        ) matches
+    ),
+    semantic AS (
+        SELECT id, row_number() OVER (ORDER BY distance, id) AS rank
+        FROM (
+            SELECT faqs.id, faqs.embedding <=> CAST(:embedding AS vector) AS distance
+            FROM faqs
+            WHERE faqs.tenant_id = :tenant_id
+              AND faqs.embedding IS NOT NULL
+              AND faqs.embedding_model = :embedding_model
+            ORDER BY distance
+            LIMIT :candidates
+        ) nearest
+    ),
+    fused AS (
+        SELECT COALESCE(lexical.id, semantic.id) AS id,
+               COALESCE(1.0 / (:rrf_k + lexical.rank), 0.0)
+               + COALESCE(1.0 / (:rrf_k + semantic.rank), 0.0) AS score
+        FROM lexical FULL OUTER JOIN semantic ON lexical.id = semantic.id
+    )
+    SELECT {_FAQ_COLUMNS}
+    FROM fused JOIN faqs ON faqs.id = fused.id
+    ORDER BY fused.score DESC, faqs.id
+    LIMIT :top_k
+""").bindparams(bindparam("embedding", type_=FAQ.__table__.c.embedding.type))
+
+def _supports_full_text(db: AsyncSession) -> bool:
+    return settings.HYBRID_SEARCH_ENABLED and db.get_bind().dialect.name == "postgresql"
+
+async def _search_hybrid(db: AsyncSession, tenant_id: str, user_query: str, query_embedding: list[float], top_k: int) -> list[FAQ]:
+    """Fuses the tenant's full-text and cosine-distance rankings with reciprocal rank fusion."""
+    await _apply_ann_search_params(db, settings.HYBRID_CANDIDATES, None, None)
+    result = await db.scalars(
+        select(FAQ).from_statement(_HYBRID_SEARCH_SQL),
+        {
+            "tenant_id": tenant_id,
+            "query_text": user_query,
+            "embedding": query_embedding,
+            "embedding_model": embedding_provider.model_name,
+            "candidates": max(settings.HYBRID_CANDIDATES, top_k),
+            "rrf_k": settings.HYBRID_RRF_K,
+            "top_k": top_k,
+        },
+    )
+    return list(result.all())
+
+async def find_confident_lexical_match(db: AsyncSession, tenant_id: str, user_query: str, top_k: int) -> list[FAQ] | None:
+    """
+    Full-text ranking alone, for short lookups such as product codes or names.
+    Returns the matches only when the best one scores at least HYBRID_LEXICAL_CONFIDENCE,
+    and None whenever the caller should fall back to embedding the query.
+    """
+    if not _supports_full_text(db) or not user_query:
+        return None
+    if len(user_query.split()) > settings.HYBRID_LEXICAL_MAX_QUERY_WORDS:
+        return None
+
+    try:
+        rows = (await db.execute(
+            select(FAQ, column("lexical_score", Float)).from_statement(_LEXICAL_SEARCH_SQL),
+            {"tenant_id": tenant_id, "query_text": user_query, "top_k": top_k},
+        )).all()
     except Exception as e:
-        # Структурированное логирование ошибок
-        logger.error("Error during embedding generation", extra={
-            "error_type": type(e).__name__,
-            "error_details": str(e)
-        }, exc_info=e)
-        
+        logger.error("Error in lexical FAQ search", extra={"tenant_id": tenant_id}, exc_info=e)
+        # Leave the session usable for the vector search that follows
+        await db.rollback()
         return None
 
-# --- Database Interaction with pgvector --- #
-async def find_relevant_faqs(db: Session, tenant_id: str, user_query: str, top_k: int = 3) -> list[FAQ]:
+    if not rows or rows[0].lexical_score < settings.HYBRID_LEXICAL_CONFIDENCE:
+        return None
+    logger.info("Confident lexical match, skipping embedding", extra={
+        "tenant_id": tenant_id,
+        "count": len(rows),
+        "top_score": rows[0].lexical_score
+    })
+    return [row.FAQ for row in rows]
+
+async def find_relevant_faqs(
+    db: AsyncSession,
+    tenant_id: str,
+    user_query: str,
+    top_k: int = 3,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    query_embedding: list[float] | None = None,
+) -> list[FAQ]:
     """
     Finds the top_k most relevant FAQs from the database for a specific tenant
-    based on the user query, using cosine similarity with pgvector.
+    based on the user query, using cosine similarity with pgvector, or with the
+    in-memory per-tenant index when VECTOR_INDEX_ENABLED is set. With
+    HYBRID_SEARCH_ENABLED (on Postgres) the full-text and vector rankings are
+    fused instead.
+
+    ef_search/probes override PGVECTOR_HNSW_EF_SEARCH/PGVECTOR_IVFFLAT_PROBES
+    for this query to trade recall for latency on the ANN index. Callers that
+    already embedded user_query can pass query_embedding to skip that step.
     """
-    global client
-    if client is None:
-        logger.error("OpenAI client is not initialized. Cannot find relevant FAQs.")
-        raise RuntimeError("OpenAI client is not initialized.")
+    if embedding_provider is None or not embedding_provider.ready:
+        logger.error("Embedding provider is not initialized. Cannot find relevant FAQs.")
+        raise RuntimeError("Embedding provider is not initialized.")
 
     if not user_query:
         logger.warning("Empty user query provided.")
         return []
 
-    query_embedding = await generate_embedding(user_query)
+    if query_embedding is None:
+        query_embedding = await generate_embedding(user_query)
     if query_embedding is None:
         logger.warning("Could not generate embedding for query", extra={"query": user_query})
         return []
 
     try:
-        # Using SQLAlchemy's ORM with pgvector's cosine_distance
-        # Lower cosine_distance means higher similarity
-        relevant_faqs = (
-            db.query(FAQ)
-            .filter(FAQ.tenant_id == tenant_id)
-            .filter(FAQ.embedding != None)  # Ensure embedding is not null
-            .order_by(FAQ.embedding.cosine_distance(query_embedding))
-            .limit(top_k)
-            .all()
-        )
+        if _supports_full_text(db):
+            relevant_faqs = await _search_hybrid(db, tenant_id, user_query, query_embedding, top_k)
+        elif settings.VECTOR_INDEX_ENABLED:
+            relevant_faqs = await _search_vector_index(db, tenant_id, query_embedding, top_k)
+        else:
+            relevant_faqs = await _search_pgvector(db, tenant_id, query_embedding, top_k, ef_search, probes)
         logger.info("Found relevant FAQs", extra={
             "count": len(relevant_faqs),
             "tenant_id": tenant_id,
@@ -135,48 +511,250 @@ async def find_relevant_faqs(db: Session, tenant_id: str, user_query: str, top_k
         return []
 
 # --- RAG Core Logic --- #
-@track_openai_call(model="gpt-4o", endpoint="chat/completions")
-async def get_rag_response(db: Session, tenant_id: str, user_query: str, system_prompt: str) -> str:
+CONTEXT_HEADER = "Relevant information from knowledge base:\n"
+NO_CONTEXT_MESSAGE = "No specific information found in the knowledge base for your query."
+
+class RAGPrompt:
+    """A prepared query: the chat messages to send, or an answer already found in the cache."""
+
+    __slots__ = ("tenant_id", "system_prompt", "query_embedding", "messages", "faq_count", "cached_answer", "cacheable")
+
+    def __init__(
+        self,
+        tenant_id: str,
+        system_prompt: str,
+        query_embedding: list[float] | None,
+        messages: list[dict] | None = None,
+        faq_count: int = 0,
+        cached_answer: str | None = None,
+    ):
+        self.tenant_id = tenant_id
+        self.system_prompt = system_prompt
+        self.query_embedding = query_embedding
+        self.messages = messages
+        self.faq_count = faq_count
+        self.cached_answer = cached_answer
+        # Answers that depend on conversation history must not be served to other queries
+        self.cacheable = True
+
+def _fit_history(history: list[dict], max_tokens: int) -> list[dict]:
+    """The most recent history messages that fit into max_tokens, oldest first."""
+    kept = []
+    for message in reversed(history):
+        max_tokens -= count_message_tokens([message], settings.RAG_CHAT_MODEL) - TOKENS_PER_REPLY
+        if max_tokens < 0:
+            break
+        kept.append(message)
+    return kept[::-1]
+
+def build_rag_messages(
+    system_prompt: str | None,
+    user_query: str,
+    faqs: list[FAQ],
+    max_prompt_tokens: int | None = None,
+    history: list[dict] | None = None,
+) -> tuple[list[dict], int]:
+    """
+    Builds the chat messages for a query. Earlier turns of the conversation
+    (history, oldest first) go between the system message and the query, newest
+    kept first within CONVERSATION_HISTORY_MAX_TOKENS. The FAQs (best-ranked first)
+    are packed by pack_faq_context into RAG_CONTEXT_MAX_TOKENS, or into whatever is
+    left of max_prompt_tokens (RAG_MAX_PROMPT_TOKENS by default) if that is less;
+    the rest are dropped. Returns the messages and the number of FAQs that made it in.
+    """
+    budget = max_prompt_tokens or settings.RAG_MAX_PROMPT_TOKENS
+    system_header = f"{system_prompt or ''}\n\nContext from knowledge base:\n".lstrip()
+
+    used_tokens = count_message_tokens(
+        [{"content": system_header + CONTEXT_HEADER}, {"content": user_query}], settings.RAG_CHAT_MODEL
+    )
+    history = _fit_history(history, min(settings.CONVERSATION_HISTORY_MAX_TOKENS, budget - used_tokens)) if history else []
+    if history:
+        used_tokens += count_message_tokens(history, settings.RAG_CHAT_MODEL) - TOKENS_PER_REPLY
+    context_budget = min(settings.RAG_CONTEXT_MAX_TOKENS, budget - used_tokens)
+    packed = pack_faq_context(faqs, context_budget)
+    context_parts = [
+        f"{position}. {format_faq_entry(faq_item.question, faq_item.answer)}"
+        for position, faq_item in enumerate(packed, start=1)
+    ]
+
+    if len(context_parts) < len(faqs):
+        logger.info("RAG: Packed FAQ context into the token budget", extra={
+            "faq_count": len(faqs),
+            "included_count": len(context_parts),
+            "context_budget": context_budget
+        })
+
+    if context_parts:
+        context_str = CONTEXT_HEADER + "\n\n".join(context_parts)
+    else:
+        context_str = NO_CONTEXT_MESSAGE
+    messages = [
+        {"role": "system", "content": system_header + context_str},
+        *history,
+        {"role": "user", "content": user_query},
+    ]
+    return messages, len(context_parts)
+
+async def prepare_rag_prompt(
+    db: AsyncSession,
+    tenant_id: str,
+    user_query: str,
+    system_prompt: str,
+    timer: StageTimer | None = None,
+    history: list[dict] | None = None,
+) -> RAGPrompt:
     """
-    Core RAG function:
-    1. Finds relevant FAQs for the user_query and tenant_id.
-    2. Constructs a prompt with this context.
-    3. (Conceptual) Sends the prompt to an LLM to generate a response.
+    Everything before generation, the only part that needs the database:
+    0. With HYBRID_SEARCH_ENABLED, answers short queries with a confident full-text
+       match straight from find_confident_lexical_match, skipping steps 1-2.
+    1. Looks for a cached answer to a near-identical query (RESPONSE_CACHE_ENABLED),
+       unless there is conversation history: a follow-up like "how much is it?"
+       means something different in every conversation.
+    2. Finds RAG_RETRIEVAL_CANDIDATES relevant FAQs for the user_query and tenant_id.
+    3. Builds the chat messages with the history and as much of that context as
+       the token budget allows.
     """
+    timer = timer or StageTimer()
     logger.info("RAG: Processing query", extra={
         "tenant_id": tenant_id,
         "query": user_query
     })
-    
-    relevant_faqs = await find_relevant_faqs(db, tenant_id, user_query, top_k=3)
-    
-    context_parts = []
-    if not relevant_faqs:
-        context_str = "No specific information found in the knowledge base for your query."
-    else:
-        for i, faq_item in enumerate(relevant_faqs):
-            context_parts.append(f"{i+1}. Question: {faq_item.question}\n   Answer: {faq_item.answer}")
-        context_str = "Relevant information from knowledge base:\n" + "\n\n".join(context_parts)
 
-    # Construct the prompt for the LLM
-    prompt = f"{system_prompt}\n\nContext from knowledge base:\n{context_str}\n\nUser Question: {user_query}\n\nAnswer:"
-    
+    # Exact lookups (product codes, names) need neither an embedding nor the cache
+    if _supports_full_text(db):
+        with timer.stage("retrieval"):
+            lexical_faqs = await find_confident_lexical_match(
+                db, tenant_id, user_query, top_k=settings.RAG_RETRIEVAL_CANDIDATES
+            )
+        if lexical_faqs is not None:
+            prompt = RAGPrompt(tenant_id, system_prompt, None)
+            with timer.stage("prompt_build"):
+                prompt.messages, prompt.faq_count = build_rag_messages(
+                    system_prompt, user_query, lexical_faqs, history=history
+                )
+            return prompt
+
+    with timer.stage("embedding"):
+        query_embedding = await generate_embedding(user_query)
+    prompt = RAGPrompt(tenant_id, system_prompt, query_embedding)
+    prompt.cacheable = not history
+
+    if settings.RESPONSE_CACHE_ENABLED and prompt.cacheable and query_embedding is not None:
+        with timer.stage("cache_lookup"):
+            prompt.cached_answer = response_cache.lookup(tenant_id, system_prompt, query_embedding)
+        if prompt.cached_answer is not None:
+            logger.info("RAG: Served response from semantic cache", extra={"tenant_id": tenant_id})
+            return prompt
+
+    with timer.stage("retrieval"):
+        relevant_faqs = await find_relevant_faqs(
+            db, tenant_id, user_query, top_k=settings.RAG_RETRIEVAL_CANDIDATES, query_embedding=query_embedding
+        )
+
+    with timer.stage("prompt_build"):
+        prompt.messages, prompt.faq_count = build_rag_messages(
+            system_prompt, user_query, relevant_faqs, history=history
+        )
+
     logger.debug("Constructed prompt for LLM", extra={
-        "prompt_length": len(prompt),
-        "faq_count": len(relevant_faqs)
+        "prompt_length": sum(len(message["content"]) for message in prompt.messages),
+        "faq_count": prompt.faq_count
     })
+    return prompt
+
+def _get_chat_client() -> AsyncOpenAI:
+    """Chat completions always go to OpenAI, whichever provider produces the embeddings."""
+    _load_openai_client()
+    if client is None:
+        raise RuntimeError("OpenAI client could not be initialized.")
+    return client
+
+@track_openai_call(model=settings.RAG_CHAT_MODEL, endpoint="chat/completions")
+async def _request_chat_completion(messages: list[dict]):
+    return await _get_chat_client().chat.completions.create(
+        model=settings.RAG_CHAT_MODEL,
+        messages=messages,
+        temperature=settings.RAG_TEMPERATURE,
+        max_tokens=settings.RAG_MAX_COMPLETION_TOKENS,
+    )
+
+@track_openai_stream(model=settings.RAG_CHAT_MODEL, endpoint="chat/completions")
+async def _stream_chat_completion(messages: list[dict]) -> AsyncIterator:
+    stream = await _get_chat_client().chat.completions.create(
+        model=settings.RAG_CHAT_MODEL,
+        messages=messages,
+        temperature=settings.RAG_TEMPERATURE,
+        max_tokens=settings.RAG_MAX_COMPLETION_TOKENS,
+        stream=True,
+        # The last chunk then carries the token usage of the whole completion
+        stream_options={"include_usage": True},
+    )
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        # Releases the HTTP connection when the consumer stops early (e.g. the client went away)
+        await stream.close()
+
+def _store_answer(prompt: RAGPrompt, answer: str):
+    if settings.RESPONSE_CACHE_ENABLED and prompt.cacheable and prompt.query_embedding is not None and answer:
+        response_cache.store(prompt.tenant_id, prompt.system_prompt, prompt.query_embedding, answer)
+
+async def generate_answer(prompt: RAGPrompt, timer: StageTimer | None = None) -> str:
+    """Generates the whole answer for a prepared prompt with one chat completion."""
+    if prompt.cached_answer is not None:
+        return prompt.cached_answer
+
+    timer = timer or StageTimer()
+    with timer.stage("generation"):
+        completion = await _request_chat_completion(prompt.messages)
+    answer = completion.choices[0].message.content or ""
+    _store_answer(prompt, answer)
+    return answer
+
+async def stream_answer(prompt: RAGPrompt, timer: StageTimer | None = None) -> AsyncIterator[str]:
+    """
+    Yields the answer for a prepared prompt piece by piece as the model produces it.
+    The answer is cached only once the stream has completed.
+    """
+    if prompt.cached_answer is not None:
+        yield prompt.cached_answer
+        return
+
+    timer = timer or StageTimer()
+    parts = []
+    with timer.stage("generation"):
+        async for chunk in _stream_chat_completion(prompt.messages):
+            # The final usage chunk has no choices
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    _store_answer(prompt, "".join(parts))
+
+async def get_rag_response(
+    db: AsyncSession,
+    tenant_id: str,
+    user_query: str,
+    system_prompt: str,
+    timer: StageTimer | None = None,
+) -> str:
+    """
+    Core RAG function: prepare_rag_prompt followed by generate_answer.
+
+    Pass a StageTimer to get the duration of each step; the caller records it
+    together with its own stages (e.g. sending the reply). Callers that should
+    not hold a database connection during generation call the two steps themselves.
+    """
+    timer = timer or StageTimer()
+    prompt = await prepare_rag_prompt(db, tenant_id, user_query, system_prompt, timer)
+    llm_answer = await generate_answer(prompt, timer)
 
-    # Step 3: (Conceptual) Send to LLM (e.g., OpenAI)
-    # This part would involve calling an actual LLM API.
-    # For now, we'll return a placeholder response that includes the context found.
-    
-    if not relevant_faqs:
-        llm_answer = f"I couldn't find specific information in our knowledge base for your question: '{user_query}'. Please try rephrasing or ask something else."
-    else:
-        llm_answer = f"Based on the information I found regarding '{user_query}':\n\n{context_str}\n\n(This is a conceptual answer. An actual LLM would synthesize this information to directly answer your question.)"
-    
     logger.info("RAG: Generated response", extra={
         "tenant_id": tenant_id,
-        "response_length": len(llm_answer)
+        "response_length": len(llm_answer),
+        "faq_count": prompt.faq_count,
+        "stage_ms": timer.as_milliseconds()
     })
     return llm_answer
@@ -0,0 +1,128 @@
+"""Conversation memory for webhook replies.
+
+Follow-up questions ("and how much is it?") only make sense with the turns
+before them. Every turn is stored in the messages table, but reading the last
+turns from there for each inbound message would put another query on the hot
+path. Instead the most recent turns of each active conversation are kept here,
+in a fixed-size ring per (tenant, user). A conversation is read from the
+database once, with one scan of ix_messages_tenant_user_ts, when this process
+first sees it or after CONVERSATION_MEMORY_TTL_SECONDS of silence; after that
+new turns are appended in memory. With several worker processes a ring can
+miss turns answered by another process until it expires; the table is always
+complete.
+"""
+
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.message import Message
+from app.services.monitoring import conversation_memory_requests_total
+
+
+class ConversationTurn:
+    """One stored message of a conversation."""
+
+    __slots__ = ("role", "text", "ts", "wa_msg_id")
+
+    def __init__(self, role: str, text: str, ts: datetime, wa_msg_id: Optional[str] = None):
+        self.role = role
+        self.text = text
+        self.ts = ts
+        self.wa_msg_id = wa_msg_id
+
+    def as_chat_message(self) -> Dict:
+        return {"role": self.role, "content": self.text}
+
+
+class ConversationMemory:
+    """LRU of per-user rings holding the last `turns` turns of each conversation."""
+
+    def __init__(self, turns: int, max_users: int, ttl_seconds: float):
+        self.turns = max(1, turns)
+        self.max_users = max(1, max_users)
+        self.ttl_seconds = ttl_seconds
+        self._rings: "OrderedDict[Tuple[str, str], Tuple[deque, float]]" = OrderedDict()
+
+    def _get(self, key: Tuple[str, str]) -> Optional[deque]:
+        entry = self._rings.get(key)
+        if entry is None:
+            return None
+        ring, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._rings[key]
+            return None
+        self._rings.move_to_end(key)
+        return ring
+
+    def _put(self, key: Tuple[str, str], ring: deque):
+        self._rings[key] = (ring, time.monotonic() + self.ttl_seconds)
+        self._rings.move_to_end(key)
+        while len(self._rings) > self.max_users:
+            self._rings.popitem(last=False)
+
+    def record(self, tenant_id: str, user_phone: str, turn: ConversationTurn):
+        """Append a turn to a conversation that is already in memory.
+
+        Conversations that are not are left alone: the turn is in the database
+        and is read together with the earlier ones on the next lookup.
+        """
+        key = (tenant_id, user_phone)
+        ring = self._get(key)
+        if ring is not None:
+            ring.append(turn)
+            self._put(key, ring)
+
+    async def history(
+        self,
+        db: AsyncSession,
+        tenant_id: str,
+        user_phone: str,
+        exclude_msg_id: Optional[str] = None,
+    ) -> List[ConversationTurn]:
+        """The last turns of a conversation, oldest first.
+
+        exclude_msg_id is the message being answered: it is already stored,
+        but belongs in the prompt as the query rather than as history.
+        """
+        key = (tenant_id, user_phone)
+        ring = self._get(key)
+        conversation_memory_requests_total.labels(result="hit" if ring is not None else "miss").inc()
+        if ring is None:
+            # One extra slot, so the excluded message does not cost a turn of history
+            rows = await db.execute(
+                select(Message.role, Message.text, Message.ts, Message.wa_msg_id)
+                .where(Message.tenant_id == tenant_id, Message.user_phone == user_phone)
+                .order_by(Message.ts.desc())
+                .limit(self.turns + 1)
+            )
+            ring = deque(
+                (ConversationTurn(row.role, row.text, row.ts, row.wa_msg_id) for row in reversed(rows.all())),
+                maxlen=self.turns + 1,
+            )
+            self._put(key, ring)
+
+        turns = [turn for turn in ring if turn.text and (exclude_msg_id is None or turn.wa_msg_id != exclude_msg_id)]
+        return turns[-self.turns:]
+
+    def clear(self):
+        self._rings.clear()
+
+
+async def save_turns(db: AsyncSession, rows: List[Dict]):
+    """Store outbound turns in one statement (inbound ones go through insert_new_messages)."""
+    if rows:
+        await db.execute(insert(Message), rows)
+        await db.commit()
+
+
+conversation_memory = ConversationMemory(
+    turns=settings.CONVERSATION_HISTORY_TURNS,
+    max_users=settings.CONVERSATION_MEMORY_MAX_USERS,
+    ttl_seconds=settings.CONVERSATION_MEMORY_TTL_SECONDS,
+)
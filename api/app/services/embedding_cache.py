@@ -0,0 +1,231 @@
+"""Content-addressed embedding cache.
+
+Vectors are keyed by (model name, SHA-256 of the normalized text). Lookups go
+through a bounded in-memory LRU tier first and, when enabled, a Postgres table
+second; hits from Postgres are promoted into memory.
+"""
+
+import asyncio
+import hashlib
+import re
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.monitoring import embedding_cache_requests_total
+
+logger = get_logger(__name__)
+
+CacheKey = Tuple[str, str]
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text_content: str) -> str:
+    """Normalize text so that trivially different spellings share a cache entry."""
+    normalized = unicodedata.normalize("NFC", text_content)
+    return _WHITESPACE_RE.sub(" ", normalized).strip()
+
+
+def make_cache_key(model: str, text_content: str) -> CacheKey:
+    """Build the (model, text hash) key for a text."""
+    digest = hashlib.sha256(normalize_text(text_content).encode("utf-8")).hexdigest()
+    return model, digest
+
+
+class LRUEmbeddingCache:
+    """Bounded in-memory LRU of embeddings with a per-entry TTL.
+
+    Vectors are stored as float32 arrays to keep the footprint at roughly
+    6 KB per 1536-d entry instead of a list of Python floats.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[CacheKey, Tuple[float, array]]" = OrderedDict()
+
+    def get(self, key: CacheKey) -> Optional[List[float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, vector = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return vector.tolist()
+
+    def set(self, key: CacheKey, embedding: Sequence[float]):
+        if self.max_entries == 0:
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, array("f", embedding))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class PostgresEmbeddingStore:
+    """Persistent embedding tier backed by the `embedding_cache` table.
+
+    Queries run in a worker thread with their own session so that callers on
+    the event loop are never blocked by the database round trip.
+    """
+
+    def _session(self):
+        # Imported lazily: app.core.database requires DATABASE_URL at import time
+        from app.core.database import SessionLocal
+        return SessionLocal()
+
+    def _load(self, keys: List[CacheKey]) -> Dict[CacheKey, List[float]]:
+        from sqlalchemy import select, tuple_
+        from app.models.embedding_cache import EmbeddingCacheEntry
+
+        db = self._session()
+        try:
+            rows = db.execute(
+                select(
+                    EmbeddingCacheEntry.model,
+                    EmbeddingCacheEntry.text_hash,
+                    EmbeddingCacheEntry.embedding,
+                ).where(
+                    tuple_(EmbeddingCacheEntry.model, EmbeddingCacheEntry.text_hash).in_(keys)
+                )
+            ).all()
+            return {(row.model, row.text_hash): [float(value) for value in row.embedding] for row in rows}
+        finally:
+            db.close()
+
+    def _store(self, items: Dict[CacheKey, Sequence[float]]):
+        from sqlalchemy.dialects.postgresql import insert
+        from app.models.embedding_cache import EmbeddingCacheEntry
+
+        db = self._session()
+        try:
+            statement = insert(EmbeddingCacheEntry).values([
+                {"model": model, "text_hash": text_hash, "embedding": list(embedding)}
+                for (model, text_hash), embedding in items.items()
+            ]).on_conflict_do_nothing(index_elements=["model", "text_hash"])
+            db.execute(statement)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def get_many(self, keys: List[CacheKey]) -> Dict[CacheKey, List[float]]:
+        if not keys:
+            return {}
+        return await asyncio.to_thread(self._load, keys)
+
+    async def set_many(self, items: Dict[CacheKey, Sequence[float]]):
+        if not items:
+            return
+        await asyncio.to_thread(self._store, items)
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache: in-memory LRU in front of an optional persistent store."""
+
+    def __init__(self, memory: LRUEmbeddingCache, store: Optional[PostgresEmbeddingStore] = None):
+        self.memory = memory
+        self.store = store
+
+    def get(self, model: str, text_content: str) -> Optional[List[float]]:
+        """Look a single text up in the memory tier only."""
+        embedding = self.memory.get(make_cache_key(model, text_content))
+        embedding_cache_requests_total.labels(
+            tier="memory",
+            result="hit" if embedding is not None else "miss"
+        ).inc()
+        return embedding
+
+    async def get_many(
+        self, model: str, texts: Sequence[str], check_memory: bool = True
+    ) -> List[Optional[List[float]]]:
+        """Look texts up in every enabled tier and return one entry per text (None on miss).
+
+        Pass check_memory=False when the caller has just missed the memory tier
+        for these texts, so that misses are not counted twice.
+        """
+        keys = [make_cache_key(model, text_content) for text_content in texts]
+        results: List[Optional[List[float]]] = [None] * len(keys)
+
+        if check_memory:
+            for position, key in enumerate(keys):
+                results[position] = self.memory.get(key)
+            hits = sum(1 for embedding in results if embedding is not None)
+            if hits:
+                embedding_cache_requests_total.labels(tier="memory", result="hit").inc(hits)
+            if len(keys) - hits:
+                embedding_cache_requests_total.labels(tier="memory", result="miss").inc(len(keys) - hits)
+
+        if self.store is None:
+            return results
+
+        missing = list(dict.fromkeys(key for key, embedding in zip(keys, results) if embedding is None))
+        if not missing:
+            return results
+
+        try:
+            stored = await self.store.get_many(missing)
+        except Exception as e:
+            logger.error("Error reading persistent embedding cache", extra={
+                "error_type": type(e).__name__,
+                "keys_count": len(missing)
+            }, exc_info=e)
+            stored = {}
+
+        if stored:
+            embedding_cache_requests_total.labels(tier="postgres", result="hit").inc(len(stored))
+        if len(missing) - len(stored):
+            embedding_cache_requests_total.labels(tier="postgres", result="miss").inc(len(missing) - len(stored))
+
+        for position, key in enumerate(keys):
+            if results[position] is None and key in stored:
+                results[position] = stored[key]
+                self.memory.set(key, stored[key])
+        return results
+
+    async def set_many(self, model: str, items: Sequence[Tuple[str, Sequence[float]]]):
+        """Store freshly generated embeddings in every enabled tier."""
+        entries = {make_cache_key(model, text_content): embedding for text_content, embedding in items}
+        for key, embedding in entries.items():
+            self.memory.set(key, embedding)
+
+        if self.store is None:
+            return
+        try:
+            await self.store.set_many(entries)
+        except Exception as e:
+            logger.error("Error writing persistent embedding cache", extra={
+                "error_type": type(e).__name__,
+                "keys_count": len(entries)
+            }, exc_info=e)
+
+    def clear(self):
+        """Drop the memory tier (the persistent tier is left untouched)."""
+        self.memory.clear()
+
+
+embedding_cache = EmbeddingCache(
+    memory=LRUEmbeddingCache(
+        max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.EMBEDDING_CACHE_TTL_SECONDS,
+    ),
+    store=PostgresEmbeddingStore() if settings.EMBEDDING_CACHE_PERSISTENT else None,
+)
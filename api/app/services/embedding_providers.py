@@ -0,0 +1,205 @@
+"""Embedding providers.
+
+`app.services.ai` talks to one provider chosen by EMBEDDING_PROVIDER: OpenAI
+over the network, or a local sentence-transformers model on the CPU. Local
+inference runs in a thread or process pool so it never blocks the event loop,
+and can use dynamic int8 quantization (torch) or an ONNX export. Vectors
+narrower than the `faqs.embedding` column are zero-padded to its width, which
+leaves cosine similarity between two padded vectors unchanged; the model that
+produced a vector and its native dimension are stored next to it.
+"""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+from app.core.logging import get_logger
+from app.services.monitoring import local_embedding_duration_seconds
+
+logger = get_logger(__name__)
+
+
+def pad_embedding(embedding: Sequence[float], width: int) -> List[float]:
+    """Zero-pad a vector to `width` dimensions."""
+    if len(embedding) > width:
+        raise ValueError(f"Embedding has {len(embedding)} dimensions, more than the column width {width}.")
+    return list(embedding) + [0.0] * (width - len(embedding))
+
+
+class EmbeddingProvider:
+    """Interface for anything that turns a batch of texts into vectors."""
+
+    name = "base"
+
+    def __init__(self, model_name: str, dimension: Optional[int], max_batch_size: int):
+        self.model_name = model_name
+        # Native output width; local models only know it once they are loaded
+        self.dimension = dimension
+        self.max_batch_size = max(1, max_batch_size)
+
+    @property
+    def ready(self) -> bool:
+        return True
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Return one vector per text, in order. Raises on failure."""
+        raise NotImplementedError
+
+    async def warmup(self):
+        """Load whatever the provider needs before the first request."""
+
+    async def resolve_dimension(self) -> Optional[int]:
+        """Native output width, loading the model if that is the only way to learn it."""
+        return self.dimension
+
+    def close(self):
+        """Release threads, processes or clients held by the provider."""
+
+
+def _load_sentence_transformer(model_name: str, backend: str, quantize: bool, onnx_file: Optional[str]):
+    # Heavy imports stay out of the OpenAI-only code path
+    from sentence_transformers import SentenceTransformer
+
+    model_kwargs = {"file_name": onnx_file} if backend == "onnx" and onnx_file else None
+    model = SentenceTransformer(model_name, device="cpu", backend=backend, model_kwargs=model_kwargs)
+    if quantize and backend == "torch":
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif quantize:
+        logger.warning("EMBEDDING_LOCAL_QUANTIZE only applies to the torch backend; "
+                       "point EMBEDDING_LOCAL_ONNX_FILE at a quantized ONNX export instead")
+    return model
+
+
+def _encode(model, texts: List[str], batch_size: int) -> List[List[float]]:
+    embeddings = model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    return embeddings.tolist()
+
+
+# Model owned by each worker process in "process" executor mode
+_process_model = None
+
+
+def _init_process_model(model_name: str, backend: str, quantize: bool, onnx_file: Optional[str]):
+    global _process_model
+    _process_model = _load_sentence_transformer(model_name, backend, quantize, onnx_file)
+
+
+def _encode_in_process(texts: List[str], batch_size: int) -> List[List[float]]:
+    return _encode(_process_model, texts, batch_size)
+
+
+def _dimension_in_process() -> int:
+    return _process_model.get_sentence_embedding_dimension()
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """Batched sentence-transformers inference on the local CPU.
+
+    With executor="thread" one model is shared by `workers` threads (PyTorch
+    and ONNX Runtime release the GIL while they compute). With
+    executor="process" each worker process loads its own copy, which costs
+    memory but sidesteps the GIL entirely for tokenization as well.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        model_name: str,
+        backend: str = "torch",
+        quantize: bool = False,
+        onnx_file: Optional[str] = None,
+        batch_size: int = 32,
+        executor: str = "thread",
+        workers: int = 1,
+    ):
+        super().__init__(model_name, dimension=None, max_batch_size=batch_size)
+        self.backend = backend
+        self.quantize = quantize
+        self.onnx_file = onnx_file
+        self.executor_kind = executor
+        self.workers = max(1, workers)
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # Forking a process that already initialized torch threads can deadlock
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_process_model,
+                    initargs=(self.model_name, self.backend, self.quantize, self.onnx_file),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embeddings")
+        return self._executor
+
+    def _load_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = _load_sentence_transformer(
+                        self.model_name, self.backend, self.quantize, self.onnx_file
+                    )
+                    self.dimension = self._model.get_sentence_embedding_dimension()
+                    logger.info("Loaded local embedding model", extra={
+                        "model": self.model_name,
+                        "backend": self.backend,
+                        "quantized": self.quantize,
+                        "embedding_dimension": self.dimension
+                    })
+        return self._model
+
+    def _encode_in_thread(self, texts: List[str]) -> List[List[float]]:
+        return _encode(self._load_model(), texts, self.max_batch_size)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        start_time = time.perf_counter()
+        if self.executor_kind == "process":
+            embeddings = await loop.run_in_executor(
+                self._get_executor(), _encode_in_process, texts, self.max_batch_size
+            )
+        else:
+            embeddings = await loop.run_in_executor(self._get_executor(), self._encode_in_thread, texts)
+        local_embedding_duration_seconds.labels(model=self.model_name).observe(time.perf_counter() - start_time)
+
+        if embeddings and self.dimension is None:
+            self.dimension = len(embeddings[0])
+        return embeddings
+
+    async def resolve_dimension(self) -> Optional[int]:
+        if self.dimension is None:
+            loop = asyncio.get_running_loop()
+            if self.executor_kind == "process":
+                self.dimension = await loop.run_in_executor(self._get_executor(), _dimension_in_process)
+            else:
+                await loop.run_in_executor(self._get_executor(), self._load_model)
+        return self.dimension
+
+    async def warmup(self):
+        await self.embed(["warmup"])
+        logger.info("Local embedding provider ready", extra={
+            "model": self.model_name,
+            "embedding_dimension": self.dimension,
+            "executor": self.executor_kind,
+            "workers": self.workers
+        })
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,80 @@
+"""Deduplication of WhatsApp webhook deliveries.
+
+Meta retries webhooks it considers unacknowledged, so the same `wa_msg_id` can
+arrive several times. Two layers keep a message from being answered twice:
+a bounded in-memory set of recently seen ids that short-circuits retries at the
+endpoint, and a bulk `INSERT ... ON CONFLICT (wa_msg_id, ts) DO NOTHING RETURNING`
+that tells workers which messages are new across restarts and processes. The
+partitioned messages table can only enforce uniqueness together with ts; that
+is enough because ts is Meta's send timestamp, which every retry repeats.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, List, Set
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.message import Message
+
+
+class RecentMessageIds:
+    """Bounded set of recently seen message ids with a per-id TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._expires_at: "OrderedDict[str, float]" = OrderedDict()
+
+    def __contains__(self, message_id: str) -> bool:
+        expires_at = self._expires_at.get(message_id)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self._expires_at[message_id]
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self._expires_at)
+
+    def add(self, message_id: str):
+        self._expires_at[message_id] = time.monotonic() + self.ttl_seconds
+        self._expires_at.move_to_end(message_id)
+        while len(self._expires_at) > self.max_entries:
+            self._expires_at.popitem(last=False)
+
+    def discard(self, message_id: str):
+        self._expires_at.pop(message_id, None)
+
+    def clear(self):
+        self._expires_at.clear()
+
+
+async def insert_new_messages(db: AsyncSession, rows: List[Dict]) -> Set[str]:
+    """Insert inbound messages in one statement and return the wa_msg_ids that were new.
+
+    Rows whose (wa_msg_id, ts) already exists are skipped by the unique
+    constraint, so a retried delivery never produces a second row or a second answer.
+    """
+    unique_rows = list({row["wa_msg_id"]: row for row in rows}.values())
+    if not unique_rows:
+        return set()
+
+    statement = (
+        insert(Message)
+        .values(unique_rows)
+        .on_conflict_do_nothing(index_elements=["wa_msg_id", "ts"])
+        .returning(Message.wa_msg_id)
+    )
+    new_ids = set((await db.execute(statement)).scalars())
+    await db.commit()
+    return new_ids
+
+
+recent_message_ids = RecentMessageIds(
+    max_entries=settings.WEBHOOK_SEEN_IDS_MAX,
+    ttl_seconds=settings.WEBHOOK_SEEN_IDS_TTL_SECONDS,
+)
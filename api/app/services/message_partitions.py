@@ -0,0 +1,146 @@
+"""Maintenance of the monthly partitions of the messages table.
+
+Since migration 009, `messages` is range-partitioned by month on `ts`, one
+table per month named messages_yYYYYmMM, plus messages_default for rows that
+fall outside all of them. Two jobs keep it that way:
+
+- ensure_partitions creates the partitions for the next
+  MESSAGES_PARTITION_MONTHS_AHEAD months, so inserts never land in the default
+  partition. Rows the default partition already holds for a new month are
+  moved into it (migration 011), and a month that cannot be created is logged
+  by Postgres as a warning without stopping the others.
+- apply_retention detaches every partition that ended more than
+  MESSAGES_RETENTION_MONTHS full months ago, writes it to a gzip-compressed CSV
+  file in MESSAGES_ARCHIVE_DIR and drops it. Dropping a whole partition frees
+  its table and indexes at once, without the bloat a bulk DELETE leaves behind.
+  A table is dropped only after its archive is complete, and a table left
+  detached by an interrupted run is archived by the next one.
+
+Both run daily from the Celery beat schedule (app.core.tasks) and can be run by
+hand with scripts/maintain_message_partitions.py.
+"""
+
+import gzip
+import os
+import re
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+PARTITION_NAME = re.compile(r"^messages_y(\d{4})m(\d{2})$")
+DEFAULT_PARTITION = "messages_default"
+
+
+def add_months(month: date, months: int) -> date:
+    """First day of the month `months` after (or before) the month of `month`."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_month(name: str) -> Optional[date]:
+    """The month a partition table holds, or None for tables that are not monthly partitions."""
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def retention_cutoff(today: date, retention_months: int) -> date:
+    """Rows before this date are past retention: the current month plus retention_months full months are kept."""
+    return add_months(today, -retention_months)
+
+
+def ensure_partitions(db: Session, months_ahead: Optional[int] = None) -> int:
+    """Create the missing partitions up to months_ahead months from now; returns how many were created."""
+    months_ahead = settings.MESSAGES_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    created = db.execute(
+        text("SELECT create_messages_partitions(CAST(now() AS date), :months_ahead)"),
+        {"months_ahead": months_ahead},
+    ).scalar()
+    db.commit()
+    if created:
+        logger.info("Created messages partitions", extra={"created": created, "months_ahead": months_ahead})
+
+    default_rows = db.execute(text(f"SELECT count(*) FROM (SELECT 1 FROM {DEFAULT_PARTITION} LIMIT 1000) AS sample")).scalar()
+    if default_rows:
+        logger.warning("Messages outside every monthly partition", extra={
+            "partition": DEFAULT_PARTITION,
+            "rows": default_rows
+        })
+    return created or 0
+
+
+def expired_partitions(db: Session, cutoff: date) -> List[Tuple[str, bool]]:
+    """Monthly partition tables that end on or before cutoff, oldest first, with whether each is still attached."""
+    rows = db.execute(text("""
+        SELECT relname, relispartition
+        FROM pg_class
+        WHERE relkind = 'r' AND relname ~ '^messages_y[0-9]{4}m[0-9]{2}$' AND pg_table_is_visible(oid)
+    """)).all()
+    expired = [
+        (row.relname, row.relispartition)
+        for row in rows
+        if add_months(partition_month(row.relname), 1) <= cutoff
+    ]
+    return sorted(expired)
+
+
+def archive_table(db: Session, table: str, archive_dir: str) -> str:
+    """Write a table to <archive_dir>/<table>.csv.gz and return the path.
+
+    The file is written under a temporary name and renamed when complete, so an
+    archive that exists is never partial.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{table}.csv.gz")
+    partial_path = f"{path}.partial"
+
+    cursor = db.connection().connection.cursor()
+    try:
+        with gzip.open(partial_path, "wb") as archive:
+            cursor.copy_expert(f"COPY {table} TO STDOUT WITH (FORMAT csv, HEADER)", archive)
+    finally:
+        cursor.close()
+    os.replace(partial_path, path)
+    return path
+
+
+def apply_retention(
+    db: Session,
+    retention_months: Optional[int] = None,
+    archive_dir: Optional[str] = None,
+    today: Optional[date] = None,
+    dry_run: bool = False,
+) -> Dict:
+    """Detach, archive and drop the partitions past retention; returns what was done."""
+    retention_months = settings.MESSAGES_RETENTION_MONTHS if retention_months is None else retention_months
+    archive_dir = archive_dir or settings.MESSAGES_ARCHIVE_DIR
+    cutoff = retention_cutoff(today or date.today(), retention_months)
+    result = {"cutoff": cutoff.isoformat(), "archived": [], "default_rows_deleted": 0}
+
+    for table, attached in expired_partitions(db, cutoff):
+        if dry_run:
+            result["archived"].append(table)
+            continue
+        if attached:
+            # Takes a short exclusive lock on messages; the partition stops receiving rows
+            db.execute(text(f"ALTER TABLE messages DETACH PARTITION {table}"))
+            db.commit()
+        path = archive_table(db, table, archive_dir)
+        db.execute(text(f"DROP TABLE {table}"))
+        db.commit()
+        logger.info("Archived messages partition", extra={"partition": table, "path": path})
+        result["archived"].append(table)
+
+    if not dry_run:
+        # Stray old rows are few; a plain DELETE is fine for the default partition
+        result["default_rows_deleted"] = db.execute(
+            text(f"DELETE FROM {DEFAULT_PARTITION} WHERE ts < :cutoff"), {"cutoff": cutoff}
+        ).rowcount
+        db.commit()
+    return result
@@ -3,14 +3,21 @@
 """
 import os
 import time
+from contextlib import contextmanager
+from typing import Dict, Optional
 from fastapi import FastAPI, Request
 from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
 from prometheus_client import CollectorRegistry, multiprocess
 from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 # Создаем реестр метрик
 registry = CollectorRegistry()
 
+# При нескольких воркерах prometheus_client пишет значения в mmap-файлы в этом каталоге
+# (переменная должна быть задана до импорта prometheus_client), а /metrics суммирует их
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir")
+
 # Определяем метрики
 http_requests_total = Counter(
     'http_requests_total', 
@@ -40,6 +47,21 @@ openai_api_duration_seconds = Histogram(
     registry=registry
 )
 
+openai_api_time_to_first_token_seconds = Histogram(
+    'openai_api_time_to_first_token_seconds',
+    'Time from sending a streaming OpenAI request to receiving its first chunk',
+    ['model', 'endpoint'],
+    registry=registry
+)
+
+openai_api_batch_size = Histogram(
+    'openai_api_batch_size',
+    'Number of inputs sent in a single OpenAI API call',
+    ['model', 'endpoint'],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048),
+    registry=registry
+)
+
 openai_api_tokens_total = Counter(
     'openai_api_tokens_total',
     'Total number of tokens used in OpenAI API calls',
@@ -47,6 +69,96 @@ openai_api_tokens_total = Counter(
     registry=registry
 )
 
+local_embedding_duration_seconds = Histogram(
+    'local_embedding_duration_seconds',
+    'Local embedding model inference duration per batch in seconds',
+    ['model'],
+    registry=registry
+)
+
+embedding_cache_requests_total = Counter(
+    'embedding_cache_requests_total',
+    'Total number of embedding cache lookups',
+    ['tier', 'result'],  # tier: memory, postgres; result: hit, miss
+    registry=registry
+)
+
+rag_stage_duration_seconds = Histogram(
+    'rag_stage_duration_seconds',
+    'Duration of each stage of answering a query, in seconds',
+    ['stage', 'tenant_tier'],  # stage: history, cache_lookup, embedding, retrieval, prompt_build, generation, send
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+    registry=registry
+)
+
+rag_response_cache_requests_total = Counter(
+    'rag_response_cache_requests_total',
+    'Total number of semantic response cache lookups',
+    ['result'],  # result: hit, miss
+    registry=registry
+)
+
+tenant_cache_requests_total = Counter(
+    'tenant_cache_requests_total',
+    'Total number of tenant cache lookups',
+    ['result'],  # result: hit, miss
+    registry=registry
+)
+
+conversation_memory_requests_total = Counter(
+    'conversation_memory_requests_total',
+    'Total number of conversation history lookups',
+    ['result'],  # result: hit (in-memory ring), miss (loaded from the database)
+    registry=registry
+)
+
+webhook_messages_total = Counter(
+    'webhook_messages_total',
+    'Total number of WhatsApp webhook messages by pipeline outcome',
+    ['status'],  # status: enqueued, rejected, duplicate, processed, ignored, failed
+    registry=registry
+)
+
+webhook_statuses_total = Counter(
+    'webhook_statuses_total',
+    'Total number of WhatsApp status callbacks received',
+    ['status'],  # status: sent, delivered, read, failed
+    registry=registry
+)
+
+webhook_queue_depth = Gauge(
+    'webhook_queue_depth',
+    'Number of webhook messages waiting for a pipeline worker',
+    multiprocess_mode='livesum',  # each worker has its own queue
+    registry=registry
+)
+
+webhook_queue_wait_seconds = Histogram(
+    'webhook_queue_wait_seconds',
+    'Time a webhook message spent in the queue before a worker picked it up',
+    registry=registry
+)
+
+webhook_processing_duration_seconds = Histogram(
+    'webhook_processing_duration_seconds',
+    'Time spent on one worker batch of webhook messages (persist, RAG and reply send)',
+    registry=registry
+)
+
+outbound_messages_total = Counter(
+    'outbound_messages_total',
+    'Total number of outbound WhatsApp send attempts by outcome',
+    ['status'],  # status: sent, retried, failed
+    registry=registry
+)
+
+outbound_queue_depth = Gauge(
+    'outbound_queue_depth',
+    'Number of outbound WhatsApp messages waiting for a send slot or a retry',
+    multiprocess_mode='livesum',  # each worker has its own scheduler
+    registry=registry
+)
+
 celery_tasks_total = Counter(
     'celery_tasks_total',
     'Total number of Celery tasks',
@@ -64,48 +176,124 @@ celery_task_duration_seconds = Histogram(
 active_tenants_gauge = Gauge(
     'active_tenants',
     'Number of active tenants',
+    multiprocess_mode='mostrecent',  # a global value, whichever worker computed it last
     registry=registry
 )
 
 active_users_gauge = Gauge(
     'active_users',
     'Number of active users in the last 24 hours',
+    multiprocess_mode='mostrecent',
     registry=registry
 )
 
+# Methods outside this set are labelled "other" so junk requests cannot add series
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+UNMATCHED_ROUTE = "<unmatched>"
+
+def _route_label(scope: Scope) -> str:
+    """
+    Шаблон маршрута (например /admin/tenants/{tenant_id}) вместо реального пути,
+    чтобы число серий метрик не росло вместе с количеством id
+    """
+    route = scope.get("route")
+    if route is None:
+        return UNMATCHED_ROUTE
+    return getattr(route, "path_format", None) or getattr(route, "path", UNMATCHED_ROUTE)
+
 class PrometheusMiddleware:
     """
-    Middleware для сбора метрик HTTP-запросов
+    Middleware для сбора метрик HTTP-запросов (чистый ASGI, без BaseHTTPMiddleware)
     """
-    def __init__(self, app: FastAPI):
+    def __init__(self, app: ASGIApp):
         self.app = app
 
-    async def __call__(self, request: Request, call_next):
-        start_time = time.time()
-        
-        # Обрабатываем запрос
-        response = await call_next(request)
-        
-        # Измеряем время выполнения
-        duration = time.time() - start_time
-        
-        # Получаем endpoint (без параметров запроса)
-        endpoint = request.url.path
-        
-        # Инкрементируем счетчик запросов
-        http_requests_total.labels(
-            method=request.method,
-            endpoint=endpoint,
-            status_code=response.status_code
-        ).inc()
-        
-        # Записываем время выполнения
-        http_request_duration_seconds.labels(
-            method=request.method,
-            endpoint=endpoint
-        ).observe(duration)
-        
-        return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            # Обрабатываем запрос; роутер записывает найденный маршрут в scope["route"]
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Измеряем время выполнения (до отправки последнего байта ответа)
+            duration = time.perf_counter() - start_time
+            method = scope["method"] if scope["method"] in HTTP_METHODS else "other"
+            endpoint = _route_label(scope)
+
+            # Инкрементируем счетчик запросов
+            http_requests_total.labels(
+                method=method,
+                endpoint=endpoint,
+                status_code=status_code
+            ).inc()
+
+            # Записываем время выполнения
+            http_request_duration_seconds.labels(
+                method=method,
+                endpoint=endpoint
+            ).observe(duration)
+
+class StageTimer:
+    """
+    Замер длительности этапов одного RAG-запроса (от поиска в кэше до отправки ответа)
+    """
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start_time
+
+    def observe(self, tenant_tier: Optional[str]):
+        """
+        Записывает все замеренные этапы в rag_stage_duration_seconds
+        """
+        for name, duration in self.stages.items():
+            rag_stage_duration_seconds.labels(
+                stage=name,
+                tenant_tier=tenant_tier or 'standard'
+            ).observe(duration)
+
+    def as_milliseconds(self) -> Dict[str, float]:
+        return {name: round(duration * 1000, 2) for name, duration in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """
+        Значение заголовка Server-Timing, например "embedding;dur=12.3, retrieval;dur=4.1"
+        """
+        return ", ".join(f"{name};dur={duration}" for name, duration in self.as_milliseconds().items())
+
+def collect_metrics() -> bytes:
+    """
+    Метрики в формате Prometheus: в multiprocess-режиме агрегируются файлы всех воркеров
+    """
+    if MULTIPROC_DIR:
+        scrape_registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(scrape_registry)
+        return generate_latest(scrape_registry)
+    return generate_latest(registry)
+
+def mark_process_dead(pid: int = None):
+    """
+    Убирает live-gauge завершившегося воркера из агрегации (нужно вызывать при его остановке)
+    """
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid or os.getpid())
 
 def setup_metrics(app: FastAPI):
     """
@@ -118,7 +306,7 @@ def setup_metrics(app: FastAPI):
     @app.get("/metrics", include_in_schema=False)
     async def metrics():
         return Response(
-            content=generate_latest(registry),
+            content=collect_metrics(),
             media_type=CONTENT_TYPE_LATEST
         )
     
@@ -129,9 +317,33 @@ def setup_metrics(app: FastAPI):
         # Например, количество активных тенантов
         pass
 
-def track_openai_call(model: str, endpoint: str):
+    @app.on_event("shutdown")
+    async def shutdown_metrics():
+        mark_process_dead()
+
+def record_openai_usage(model: str, usage):
+    """
+    Записывает prompt/completion токены из поля usage ответа OpenAI
+    """
+    if not usage:
+        return
+    if getattr(usage, 'prompt_tokens', None):
+        openai_api_tokens_total.labels(
+            model=model,
+            type='prompt'
+        ).inc(usage.prompt_tokens)
+    if getattr(usage, 'completion_tokens', None):
+        openai_api_tokens_total.labels(
+            model=model,
+            type='completion'
+        ).inc(usage.completion_tokens)
+
+def track_openai_call(model: str, endpoint: str, batched: bool = False):
     """
     Декоратор для отслеживания вызовов OpenAI API
+
+    Если batched=True, первый аргумент функции — список входов,
+    и его длина записывается в openai_api_batch_size.
     """
     def decorator(func):
         async def wrapper(*args, **kwargs):
@@ -143,23 +355,19 @@ def track_openai_call(model: str, endpoint: str):
                 endpoint=endpoint
             ).inc()
             
+            # Записываем размер батча для пакетных вызовов
+            if batched and args:
+                openai_api_batch_size.labels(
+                    model=model,
+                    endpoint=endpoint
+                ).observe(len(args[0]))
+            
             try:
                 # Выполняем оригинальную функцию
                 result = await func(*args, **kwargs)
                 
                 # Если есть информация о токенах, записываем ее
-                if hasattr(result, 'usage') and result.usage:
-                    if hasattr(result.usage, 'prompt_tokens'):
-                        openai_api_tokens_total.labels(
-                            model=model,
-                            type='prompt'
-                        ).inc(result.usage.prompt_tokens)
-                    
-                    if hasattr(result.usage, 'completion_tokens'):
-                        openai_api_tokens_total.labels(
-                            model=model,
-                            type='completion'
-                        ).inc(result.usage.completion_tokens)
+                record_openai_usage(model, getattr(result, 'usage', None))
                 
                 return result
             finally:
@@ -174,6 +382,46 @@ def track_openai_call(model: str, endpoint: str):
     
     return decorator
 
+def track_openai_stream(model: str, endpoint: str):
+    """
+    Декоратор для потоковых вызовов OpenAI API (асинхронных генераторов чанков)
+
+    Записывает время до первого чанка, полное время потока и токены из
+    чанка с usage (его присылает API при stream_options={"include_usage": True}).
+    """
+    def decorator(func):
+        async def wrapper(*args, **kwargs):
+            start_time = time.time()
+            first_chunk = True
+            
+            openai_api_calls_total.labels(
+                model=model,
+                endpoint=endpoint
+            ).inc()
+            
+            chunks = func(*args, **kwargs)
+            try:
+                async for chunk in chunks:
+                    if first_chunk:
+                        first_chunk = False
+                        openai_api_time_to_first_token_seconds.labels(
+                            model=model,
+                            endpoint=endpoint
+                        ).observe(time.time() - start_time)
+                    record_openai_usage(model, getattr(chunk, 'usage', None))
+                    yield chunk
+            finally:
+                # Закрываем поток и при досрочной остановке потребителя
+                await chunks.aclose()
+                openai_api_duration_seconds.labels(
+                    model=model,
+                    endpoint=endpoint
+                ).observe(time.time() - start_time)
+        
+        return wrapper
+    
+    return decorator
+
 def track_celery_task(task_name: str):
     """
     Декоратор для отслеживания выполнения Celery-задач
@@ -0,0 +1,363 @@
+"""Rate-limited outbound message scheduler for the WhatsApp Cloud API.
+
+Meta enforces throughput limits per business phone number, so every send goes
+through one token bucket per `phone_number_id`. A single dispatcher task picks
+the next message round-robin across phone numbers that have a token available,
+which keeps one tenant's broadcast from starving everyone else; within a phone
+number, conversational replies go before bulk (broadcast) messages. Throttled
+and failed sends are retried with jittered exponential backoff, and a
+`Retry-After` from Meta pauses the whole phone number for that long.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.monitoring import outbound_messages_total, outbound_queue_depth
+from app.services.whatsapp import WhatsAppClient
+
+logger = get_logger(__name__)
+
+SendFunc = Callable[[WhatsAppClient], Awaitable[Dict]]
+
+# HTTP statuses worth retrying
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Graph API error codes for throughput / pair rate limits
+RETRYABLE_ERROR_CODES = {4, 80007, 130429, 131048, 131056}
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `burst` stored."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds: float, now: float):
+        """Withhold tokens for `seconds`, e.g. after a Retry-After."""
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class _OutboundMessage:
+    __slots__ = ("phone_number_id", "client", "send", "bulk", "attempts", "future")
+
+    def __init__(self, client: WhatsAppClient, send: SendFunc, bulk: bool, future: asyncio.Future):
+        self.phone_number_id = client.phone_number_id
+        self.client = client
+        self.send = send
+        self.bulk = bulk
+        self.attempts = 0
+        self.future = future
+
+
+class _Lane:
+    """Pending messages and token bucket for one business phone number."""
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.interactive: Deque[_OutboundMessage] = deque()
+        self.bulk: Deque[_OutboundMessage] = deque()
+        self.active = False
+
+    def __len__(self) -> int:
+        return len(self.interactive) + len(self.bulk)
+
+    def push(self, item: _OutboundMessage, front: bool = False):
+        queue = self.bulk if item.bulk else self.interactive
+        if front:
+            queue.appendleft(item)
+        else:
+            queue.append(item)
+
+    def pop(self) -> _OutboundMessage:
+        return self.interactive.popleft() if self.interactive else self.bulk.popleft()
+
+
+def _retry_after(result: Dict) -> Optional[float]:
+    try:
+        return float(result.get("retry_after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(result: Dict) -> bool:
+    status_code = result.get("status_code")
+    if status_code is None or status_code in RETRYABLE_STATUS_CODES:
+        # No status means the request never completed (timeout, connection reset)
+        return True
+    try:
+        error_code = json.loads(result["error"]).get("error", {}).get("code")
+    except (TypeError, ValueError, AttributeError):
+        return False
+    return error_code in RETRYABLE_ERROR_CODES
+
+
+class OutboundScheduler:
+    """Fair, rate-limited dispatcher for outbound WhatsApp messages."""
+
+    def __init__(
+        self,
+        rate_per_second: float,
+        burst: int,
+        max_concurrency: int,
+        max_attempts: int,
+        backoff_base: float,
+        backoff_max: float,
+    ):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lanes: Dict[str, _Lane] = {}
+        self._ring: Deque[str] = deque()
+        self._delayed: List[Tuple[float, int, _OutboundMessage]] = []
+        self._sequence = itertools.count()
+        self._pending = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+
+    # --- Lifecycle --- #
+
+    def start(self):
+        """Start the dispatcher on the running event loop (idempotent)."""
+        if self._dispatcher is not None and not self._dispatcher.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+        logger.info("Outbound scheduler started", extra={
+            "rate_per_second": self.rate_per_second,
+            "max_concurrency": self.max_concurrency
+        })
+
+    async def stop(self):
+        """Stop dispatching, wait for in-flight sends and fail whatever is still queued."""
+        if self._dispatcher is None:
+            return
+        self._dispatcher.cancel()
+        await asyncio.gather(self._dispatcher, return_exceptions=True)
+        self._dispatcher = None
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+
+        leftovers = [item for lane in self._lanes.values() for item in (*lane.interactive, *lane.bulk)]
+        leftovers.extend(item for _, _, item in self._delayed)
+        for item in leftovers:
+            if not item.future.done():
+                item.future.set_exception(RuntimeError("Outbound scheduler stopped."))
+        self._lanes.clear()
+        self._ring.clear()
+        self._delayed.clear()
+        self._pending = 0
+        outbound_queue_depth.set(0)
+        logger.info("Outbound scheduler stopped", extra={"dropped": len(leftovers)})
+
+    # --- Public API --- #
+
+    async def submit(self, client: WhatsAppClient, send: SendFunc, bulk: bool = False) -> Dict:
+        """Queue a send and wait for its final result (after retries)."""
+        self.start()
+        item = _OutboundMessage(client, send, bulk, asyncio.get_running_loop().create_future())
+        self._push(item)
+        return await item.future
+
+    async def send_text(self, client: WhatsAppClient, to: str, text: str) -> Dict:
+        return await self.submit(client, lambda c: c.send_text_message(to, text))
+
+    async def send_template(
+        self,
+        client: WhatsAppClient,
+        to: str,
+        template_name: str,
+        language_code: str = "en_US",
+        components: Optional[List[Dict]] = None,
+        bulk: bool = False,
+    ) -> Dict:
+        return await self.submit(
+            client,
+            lambda c: c.send_template_message(to, template_name, language_code, components),
+            bulk=bulk,
+        )
+
+    async def broadcast_template(
+        self,
+        client: WhatsAppClient,
+        recipients: List[str],
+        template_name: str,
+        language_code: str = "en_US",
+        components: Optional[List[Dict]] = None,
+    ) -> List[Dict]:
+        """Send one template to many recipients as bulk traffic.
+
+        Sends run at most max_concurrency at a time, at the phone number's
+        rate, and behind any conversational replies for the same number.
+        Returns one result per recipient, in order.
+        """
+        results = await asyncio.gather(
+            *(
+                self.send_template(client, to, template_name, language_code, components, bulk=True)
+                for to in recipients
+            ),
+            return_exceptions=True,
+        )
+        failed = sum(1 for result in results if isinstance(result, Exception) or "error" in result)
+        logger.info("Template broadcast finished", extra={
+            "phone_number_id": client.phone_number_id,
+            "template_name": template_name,
+            "recipients": len(recipients),
+            "failed": failed
+        })
+        return [
+            {"error": str(result)} if isinstance(result, Exception) else result
+            for result in results
+        ]
+
+    # --- Internals --- #
+
+    def _lane(self, phone_number_id: str) -> _Lane:
+        lane = self._lanes.get(phone_number_id)
+        if lane is None:
+            lane = _Lane(TokenBucket(self.rate_per_second, self.burst))
+            self._lanes[phone_number_id] = lane
+        return lane
+
+    def _push(self, item: _OutboundMessage, front: bool = False):
+        lane = self._lane(item.phone_number_id)
+        lane.push(item, front=front)
+        if not lane.active:
+            lane.active = True
+            self._ring.append(item.phone_number_id)
+        self._pending += 1
+        outbound_queue_depth.set(self._pending)
+        self._wakeup.set()
+
+    def _promote_due(self, now: float):
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, item = heapq.heappop(self._delayed)
+            self._pending -= 1
+            # Retries go back to the front of their lane
+            self._push(item, front=True)
+
+    def _next_ready(self, now: float) -> Tuple[Optional[_OutboundMessage], Optional[float]]:
+        """Pick the next sendable message round-robin; otherwise return how long to wait."""
+        wait = None
+        for _ in range(len(self._ring)):
+            phone_number_id = self._ring[0]
+            self._ring.rotate(-1)
+            lane = self._lanes[phone_number_id]
+            if not lane:
+                self._ring.remove(phone_number_id)
+                lane.active = False
+                continue
+
+            delay = lane.bucket.delay(now)
+            if delay <= 0:
+                lane.bucket.consume(now)
+                self._pending -= 1
+                outbound_queue_depth.set(self._pending)
+                return lane.pop(), None
+            wait = delay if wait is None else min(wait, delay)
+
+        if self._delayed:
+            due = max(0.0, self._delayed[0][0] - now)
+            wait = due if wait is None else min(wait, due)
+        return None, wait
+
+    async def _dispatch(self):
+        while True:
+            # Take a send slot before a message: once popped from its lane, a
+            # message is only reachable through its send task, and stop() could
+            # not fail it if the dispatcher were cancelled in between
+            await self._semaphore.acquire()
+            while True:
+                now = time.monotonic()
+                self._promote_due(now)
+                item, wait = self._next_ready(now)
+                if item is not None:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+
+            task = asyncio.get_running_loop().create_task(self._send(item))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    def _backoff(self, attempts: int, result: Dict) -> float:
+        retry_after = _retry_after(result)
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        # Full jitter keeps retries from many tenants from synchronizing
+        return random.uniform(0, delay)
+
+    async def _send(self, item: _OutboundMessage):
+        try:
+            result = await item.send(item.client)
+        except Exception as e:
+            result = {"error": str(e)}
+        finally:
+            self._semaphore.release()
+        item.attempts += 1
+
+        if "error" in result and _is_retryable(result) and item.attempts < self.max_attempts:
+            delay = self._backoff(item.attempts, result)
+            now = time.monotonic()
+            if result.get("status_code") == 429 or _retry_after(result) is not None:
+                # The phone number is throttled: hold back everything queued behind it too
+                self._lane(item.phone_number_id).bucket.pause(delay, now)
+            heapq.heappush(self._delayed, (now + delay, next(self._sequence), item))
+            self._pending += 1
+            outbound_queue_depth.set(self._pending)
+            self._wakeup.set()
+            outbound_messages_total.labels(status="retried").inc()
+            logger.warning("Retrying outbound message", extra={
+                "phone_number_id": item.phone_number_id,
+                "attempt": item.attempts,
+                "delay": round(delay, 3),
+                "status_code": result.get("status_code")
+            })
+            return
+
+        outbound_messages_total.labels(status="failed" if "error" in result else "sent").inc()
+        if not item.future.done():
+            item.future.set_result(result)
+
+
+outbound_scheduler = OutboundScheduler(
+    rate_per_second=settings.OUTBOUND_RATE_PER_SECOND,
+    burst=settings.OUTBOUND_BURST,
+    max_concurrency=settings.OUTBOUND_MAX_CONCURRENCY,
+    max_attempts=settings.OUTBOUND_MAX_ATTEMPTS,
+    backoff_base=settings.OUTBOUND_BACKOFF_BASE_SECONDS,
+    backoff_max=settings.OUTBOUND_BACKOFF_MAX_SECONDS,
+)
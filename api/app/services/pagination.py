@@ -0,0 +1,133 @@
+"""Keyset (cursor) pagination for the admin list endpoints.
+
+OFFSET pagination reads and throws away every row before the page, so deep
+pages get slower the deeper they are. Here a page instead starts right after
+the sort key of the previous page's last row, which an index on the sort key
+finds directly at any depth. The key is handed to clients as an opaque cursor.
+
+Totals follow the same idea: an exact count(*) over a large table costs as much
+as reading it. Unfiltered totals come from the planner's row estimate
+(pg_class.reltuples, summed over partitions), filtered ones from a count
+capped at PAGINATION_COUNT_CAP rows; both are flagged as approximate.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute
+
+from app.core.config import settings
+
+
+class InvalidCursor(ValueError):
+    """The cursor was not produced by this API (or for a different listing)."""
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence[InstrumentedAttribute]) -> Tuple:
+    """Cursor values for the sort keys, converted back to the column types."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(payload)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor("Malformed cursor.") from e
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise InvalidCursor("Cursor does not match this listing.")
+
+    try:
+        return tuple(
+            datetime.fromisoformat(value) if key.type.python_type is datetime else key.type.python_type(value)
+            for key, value in zip(keys, values)
+        )
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor("Cursor does not match this listing.") from e
+
+
+def contains_pattern(value: str) -> str:
+    """ILIKE pattern for a substring match; LIKE wildcards in the value are escaped with a backslash."""
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def apply_keyset(
+    query: Select,
+    keys: Sequence[InstrumentedAttribute],
+    cursor: Optional[str],
+    page_size: int,
+    descending: bool = False,
+) -> Select:
+    """Order by the keys and start after the cursor; fetches one extra row to tell whether a next page exists."""
+    if cursor is not None:
+        values = decode_cursor(cursor, keys)
+        position = tuple_(*keys) if len(keys) > 1 else keys[0]
+        after = tuple_(*values) if len(keys) > 1 else values[0]
+        query = query.where(position < after if descending else position > after)
+    order = [key.desc() if descending else key.asc() for key in keys]
+    return query.order_by(*order).limit(page_size + 1)
+
+
+async def keyset_page(
+    db: AsyncSession,
+    query: Select,
+    keys: Sequence[InstrumentedAttribute],
+    cursor: Optional[str],
+    page_size: int,
+    descending: bool = False,
+) -> Tuple[List, Optional[str]]:
+    """One page of ORM objects and the cursor of the next page (None on the last one)."""
+    rows = (await db.scalars(apply_keyset(query, keys, cursor, page_size, descending))).all()
+    if len(rows) <= page_size:
+        return rows, None
+    items = rows[:page_size]
+    return items, encode_cursor([getattr(items[-1], key.key) for key in keys])
+
+
+async def _estimated_rows(db: AsyncSession, table: str) -> int:
+    """Planner estimate of a table's rows, including its partitions (0 if never analyzed)."""
+    estimate = await db.scalar(text("""
+        SELECT COALESCE(sum(reltuples) FILTER (WHERE reltuples > 0), 0)::bigint
+        FROM pg_class
+        WHERE oid = CAST(:table AS regclass)
+           OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = CAST(:table AS regclass))
+    """), {"table": table})
+    return int(estimate or 0)
+
+
+async def approximate_total(db: AsyncSession, query: Select, table: str, filtered: bool) -> Tuple[int, bool]:
+    """Total rows matching the query and whether that number is approximate."""
+    if not filtered and db.get_bind().dialect.name == "postgresql":
+        estimate = await _estimated_rows(db, table)
+        if estimate > 0:
+            return estimate, True
+
+    cap = settings.PAGINATION_COUNT_CAP
+    count = await db.scalar(select(func.count()).select_from(query.order_by(None).limit(cap + 1).subquery()))
+    return min(count, cap), count > cap
+
+
+def cursor_page_response(
+    items: List,
+    page_size: int,
+    cursor: Optional[str],
+    next_cursor: Optional[str],
+    total: Optional[int] = None,
+    total_is_approximate: bool = False,
+) -> Dict:
+    return {
+        "items": items,
+        "total": total,
+        "total_is_approximate": total_is_approximate,
+        "page_size": page_size,
+        "has_next": next_cursor is not None,
+        "has_prev": cursor is not None,
+        "next_cursor": next_cursor,
+    }
@@ -0,0 +1,92 @@
+"""Assembly of the FAQ context that goes into a RAG prompt.
+
+Retrieval returns a ranked candidate list (RAG_RETRIEVAL_CANDIDATES, more than
+will usually fit). `pack_faq_context` walks it best-first and keeps every FAQ
+that still fits the token budget and is not a near-duplicate of one already
+kept, so prompt size stays bounded however long individual answers are. Each
+FAQ's token count is computed once when it is written (`faqs.token_count`);
+rows written before that column existed are counted on the fly.
+"""
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.faq import FAQ
+from app.services.tokens import count_tokens
+
+# "N. " in front of an entry and the blank line after it
+ENTRY_OVERHEAD_TOKENS = 3
+
+
+def format_faq_entry(question: str, answer: str) -> str:
+    return f"Question: {question}\n   Answer: {answer}"
+
+
+def faq_token_count(question: str, answer: str) -> int:
+    """Tokens an FAQ takes in the context, stored in `faqs.token_count` on write."""
+    return count_tokens(format_faq_entry(question, answer), settings.RAG_CHAT_MODEL)
+
+
+def _entry_tokens(faq: FAQ) -> int:
+    token_count = faq.token_count
+    if token_count is None:
+        token_count = faq_token_count(faq.question, faq.answer)
+    return token_count + ENTRY_OVERHEAD_TOKENS
+
+
+def _text_key(faq: FAQ) -> str:
+    return " ".join(f"{faq.question} {faq.answer}".casefold().split())
+
+
+def _unit_vector(embedding) -> Optional[np.ndarray]:
+    if embedding is None:
+        return None
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else None
+
+
+def pack_faq_context(
+    faqs: Sequence[FAQ],
+    max_tokens: int,
+    dedup_threshold: Optional[float] = None,
+) -> List[FAQ]:
+    """
+    Greedily selects FAQs, best-ranked first, whose entries fit in max_tokens.
+
+    A candidate that does not fit is skipped (a shorter, lower-ranked one may
+    still fit). A candidate whose embedding has cosine similarity of at least
+    dedup_threshold (RAG_CONTEXT_DEDUP_THRESHOLD by default) with an already
+    selected FAQ, or whose normalized text is identical, is dropped as a duplicate.
+    """
+    threshold = settings.RAG_CONTEXT_DEDUP_THRESHOLD if dedup_threshold is None else dedup_threshold
+    selected: List[FAQ] = []
+    selected_vectors: List[np.ndarray] = []
+    selected_texts = set()
+    remaining = max_tokens
+
+    for faq in faqs:
+        if remaining < ENTRY_OVERHEAD_TOKENS:
+            break
+        tokens = _entry_tokens(faq)
+        if tokens > remaining:
+            continue
+
+        text_key = _text_key(faq)
+        if text_key in selected_texts:
+            continue
+        vector = _unit_vector(faq.embedding)
+        if vector is not None and selected_vectors:
+            comparable = [other for other in selected_vectors if other.shape == vector.shape]
+            if comparable and float(np.max(np.stack(comparable) @ vector)) >= threshold:
+                continue
+
+        selected.append(faq)
+        selected_texts.add(text_key)
+        if vector is not None:
+            selected_vectors.append(vector)
+        remaining -= tokens
+
+    return selected
@@ -0,0 +1,131 @@
+"""Per-tenant semantic cache for RAG answers.
+
+A cached answer is reused when a new query embedding is within the configured
+cosine similarity of an earlier query for the same tenant. Each tenant bucket is
+a fixed-size ring of normalized query vectors, so a lookup is one matmul over at
+most RESPONSE_CACHE_MAX_ENTRIES rows. Buckets remember a hash of the system
+prompt they were built under and are discarded when it changes; FAQ writes
+invalidate them explicitly through the admin router.
+
+Buckets live in each worker process. With TENANT_CACHE_REDIS_URL set, FAQ
+changes are broadcast over the tenant cache's pub/sub connection, so every
+worker drops the tenant's bucket. Without it, only the worker that handled the
+write is cleared. Other workers, and every worker after a bulk import, may then
+serve answers built from the old FAQs for up to RESPONSE_CACHE_TTL_SECONDS.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.monitoring import rag_response_cache_requests_total
+
+logger = get_logger(__name__)
+
+
+def _prompt_hash(system_prompt: Optional[str]) -> str:
+    return hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()
+
+
+def _normalize(embedding: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class TenantResponseCache:
+    """Fixed-capacity ring of (query vector, answer, expiry) entries for one tenant."""
+
+    def __init__(self, dim: int, max_entries: int, ttl_seconds: float, prompt_hash: str):
+        self.prompt_hash = prompt_hash
+        self.ttl_seconds = ttl_seconds
+        self._vectors = np.zeros((max(1, max_entries), dim), dtype=np.float32)
+        self._expires_at = np.zeros(max(1, max_entries), dtype=np.float64)
+        self._answers: List[Optional[str]] = [None] * max(1, max_entries)
+        self._next = 0
+
+    @property
+    def dim(self) -> int:
+        return self._vectors.shape[1]
+
+    def lookup(self, query: np.ndarray, threshold: float) -> Optional[str]:
+        if query.shape[0] != self.dim:
+            return None
+
+        scores = self._vectors @ query
+        # Empty and expired slots never match
+        scores[self._expires_at < time.monotonic()] = -1.0
+
+        best = int(np.argmax(scores))
+        if scores[best] >= threshold:
+            return self._answers[best]
+        return None
+
+    def store(self, query: np.ndarray, answer: str):
+        # Overwrite the oldest slot
+        slot = self._next
+        self._vectors[slot] = query
+        self._expires_at[slot] = time.monotonic() + self.ttl_seconds
+        self._answers[slot] = answer
+        self._next = (slot + 1) % len(self._answers)
+
+
+class SemanticResponseCache:
+    """LRU of per-tenant semantic answer caches."""
+
+    def __init__(self, threshold: float, max_entries: int, ttl_seconds: float, max_tenants: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_tenants = max(1, max_tenants)
+        self._tenants: "OrderedDict[str, TenantResponseCache]" = OrderedDict()
+
+    def _bucket(self, tenant_id: str, system_prompt: Optional[str], dim: Optional[int] = None) -> Optional[TenantResponseCache]:
+        """Return the tenant's bucket, creating one of width `dim` when given."""
+        prompt_hash = _prompt_hash(system_prompt)
+        bucket = self._tenants.get(tenant_id)
+        if bucket is not None and (bucket.prompt_hash != prompt_hash or dim not in (None, bucket.dim)):
+            # The system prompt (or embedding model) changed since these answers were generated
+            del self._tenants[tenant_id]
+            bucket = None
+
+        if bucket is None and dim is not None:
+            bucket = TenantResponseCache(dim, self.max_entries, self.ttl_seconds, prompt_hash)
+            self._tenants[tenant_id] = bucket
+            while len(self._tenants) > self.max_tenants:
+                self._tenants.popitem(last=False)
+
+        if bucket is not None:
+            self._tenants.move_to_end(tenant_id)
+        return bucket
+
+    def lookup(self, tenant_id: str, system_prompt: Optional[str], query_embedding: Sequence[float]) -> Optional[str]:
+        bucket = self._bucket(tenant_id, system_prompt)
+        answer = bucket.lookup(_normalize(query_embedding), self.threshold) if bucket is not None else None
+        rag_response_cache_requests_total.labels(result="hit" if answer is not None else "miss").inc()
+        return answer
+
+    def store(self, tenant_id: str, system_prompt: Optional[str], query_embedding: Sequence[float], answer: str):
+        query = _normalize(query_embedding)
+        self._bucket(tenant_id, system_prompt, dim=query.shape[0]).store(query, answer)
+
+    def invalidate(self, tenant_id: str):
+        """Forget every cached answer for a tenant (call after FAQ or prompt changes)."""
+        if self._tenants.pop(tenant_id, None) is not None:
+            logger.info("Response cache invalidated", extra={"tenant_id": tenant_id})
+
+    def clear(self):
+        self._tenants.clear()
+
+
+response_cache = SemanticResponseCache(
+    threshold=settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    max_tenants=settings.RESPONSE_CACHE_MAX_TENANTS,
+)
@@ -0,0 +1,262 @@
+"""In-process cache of tenant configuration.
+
+Every inbound message needs its tenant (by business `phone_id` for webhooks,
+by `id` for RAG queries). Tenants change rarely, so read-only snapshots are
+kept here, indexed both ways, for TENANT_CACHE_TTL_SECONDS. The admin router
+invalidates entries after each tenant write; when TENANT_CACHE_REDIS_URL is
+set, invalidations are also published over Redis pub/sub so every worker
+process drops its copy, and the TTL only bounds staleness if a message is lost.
+A dropped subscription is re-established with backoff; invalidations published
+while it was down are missed, so local tenant entries are cleared on reconnect.
+
+The same connection carries FAQ changes on a second channel. Caches built from
+a tenant's FAQs (the semantic response cache, the vector index) register with
+add_faq_listener and are dropped in every worker after an admin FAQ write or a
+finished bulk import.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.models.tenant import Tenant
+from app.services.monitoring import tenant_cache_requests_total
+
+logger = get_logger(__name__)
+
+INVALIDATION_CHANNEL = "tenant-cache:invalidate"
+# Tenants whose FAQs changed
+FAQ_INVALIDATION_CHANNEL = "tenant-cache:invalidate-faqs"
+# Backoff between attempts to restore a lost subscription
+RESUBSCRIBE_DELAY_SECONDS = 1.0
+RESUBSCRIBE_MAX_DELAY_SECONDS = 30.0
+
+
+class TenantSnapshot:
+    """Detached, read-only copy of the tenant columns the request path needs."""
+
+    __slots__ = ("id", "phone_id", "wh_token", "system_prompt", "tier")
+
+    def __init__(
+        self,
+        id: str,
+        phone_id: str,
+        wh_token: str,
+        system_prompt: Optional[str],
+        tier: Optional[str] = None,
+    ):
+        self.id = id
+        self.phone_id = phone_id
+        self.wh_token = wh_token
+        self.system_prompt = system_prompt
+        self.tier = tier or "standard"
+
+    @classmethod
+    def from_model(cls, tenant: Tenant) -> "TenantSnapshot":
+        return cls(tenant.id, tenant.phone_id, tenant.wh_token, tenant.system_prompt, tenant.tier)
+
+
+class TenantCache:
+    """LRU of tenant snapshots with a TTL, looked up by id or by phone_id."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int, redis_url: Optional[str] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.redis_url = redis_url
+        self._entries: "OrderedDict[str, Tuple[TenantSnapshot, float]]" = OrderedDict()
+        self._ids_by_phone: Dict[str, str] = {}
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+        self._faq_listeners: List[Callable[[str], None]] = []
+
+    # --- Local cache --- #
+
+    def _get(self, tenant_id: str) -> Optional[TenantSnapshot]:
+        entry = self._entries.get(tenant_id)
+        if entry is None:
+            return None
+        snapshot, expires_at = entry
+        if expires_at < time.monotonic():
+            self._drop(tenant_id)
+            return None
+        self._entries.move_to_end(tenant_id)
+        return snapshot
+
+    def _drop(self, tenant_id: str):
+        entry = self._entries.pop(tenant_id, None)
+        if entry is not None and self._ids_by_phone.get(entry[0].phone_id) == tenant_id:
+            del self._ids_by_phone[entry[0].phone_id]
+
+    def put(self, snapshot: TenantSnapshot):
+        self._drop(snapshot.id)
+        self._entries[snapshot.id] = (snapshot, time.monotonic() + self.ttl_seconds)
+        self._ids_by_phone[snapshot.phone_id] = snapshot.id
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate_local(self, tenant_id: str):
+        self._drop(tenant_id)
+
+    def clear(self):
+        self._entries.clear()
+        self._ids_by_phone.clear()
+
+    # --- Lookups --- #
+
+    async def get_by_id(self, db: AsyncSession, tenant_id: str) -> Optional[TenantSnapshot]:
+        snapshot = self._get(tenant_id)
+        tenant_cache_requests_total.labels(result="hit" if snapshot is not None else "miss").inc()
+        if snapshot is not None:
+            return snapshot
+
+        tenant = await db.get(Tenant, tenant_id)
+        if tenant is None:
+            return None
+        snapshot = TenantSnapshot.from_model(tenant)
+        self.put(snapshot)
+        return snapshot
+
+    async def get_by_phone_ids(self, db: AsyncSession, phone_ids: Iterable[Optional[str]]) -> Dict[str, TenantSnapshot]:
+        """Resolve business phone number ids to tenants, querying only the misses (in one query)."""
+        found: Dict[str, TenantSnapshot] = {}
+        missing = []
+        for phone_id in {phone_id for phone_id in phone_ids if phone_id}:
+            tenant_id = self._ids_by_phone.get(phone_id)
+            snapshot = self._get(tenant_id) if tenant_id is not None else None
+            if snapshot is not None and snapshot.phone_id == phone_id:
+                found[phone_id] = snapshot
+            else:
+                missing.append(phone_id)
+
+        if found:
+            tenant_cache_requests_total.labels(result="hit").inc(len(found))
+        if missing:
+            tenant_cache_requests_total.labels(result="miss").inc(len(missing))
+            for tenant in await db.scalars(select(Tenant).where(Tenant.phone_id.in_(missing))):
+                snapshot = TenantSnapshot.from_model(tenant)
+                self.put(snapshot)
+                found[snapshot.phone_id] = snapshot
+        return found
+
+    # --- Cross-process invalidation --- #
+
+    async def invalidate(self, tenant_id: str):
+        """Drop a tenant here and, with Redis configured, in every other worker."""
+        self.invalidate_local(tenant_id)
+        if self._redis is None:
+            return
+        try:
+            await self._redis.publish(INVALIDATION_CHANNEL, tenant_id)
+        except Exception as e:
+            logger.error("Error publishing tenant cache invalidation", extra={
+                "tenant_id": tenant_id,
+                "error_type": type(e).__name__
+            }, exc_info=e)
+
+    def add_faq_listener(self, callback: Callable[[str], None]):
+        """Call callback(tenant_id) whenever a process reports changed FAQs for that tenant."""
+        if callback not in self._faq_listeners:
+            self._faq_listeners.append(callback)
+
+    async def invalidate_faqs(self, tenant_id: str):
+        """Tell every worker, this one included, that a tenant's FAQs changed (no-op without Redis)."""
+        if self._redis is None:
+            return
+        try:
+            await self._redis.publish(FAQ_INVALIDATION_CHANNEL, tenant_id)
+        except Exception as e:
+            logger.error("Error publishing FAQ cache invalidation", extra={
+                "tenant_id": tenant_id,
+                "error_type": type(e).__name__
+            }, exc_info=e)
+
+    async def start(self):
+        """Subscribe to invalidations from other workers (no-op without TENANT_CACHE_REDIS_URL)."""
+        if not self.redis_url or self._listener is not None:
+            return
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self.redis_url, decode_responses=True)
+        self._listener = asyncio.get_running_loop().create_task(self._subscribe())
+
+    async def _subscribe(self):
+        """Keep a subscription to both channels, resubscribing with backoff whenever it drops."""
+        delay = RESUBSCRIBE_DELAY_SECONDS
+        reconnecting = False
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(INVALIDATION_CHANNEL, FAQ_INVALIDATION_CHANNEL)
+                logger.info("Tenant cache subscribed to invalidations", extra={
+                    "channels": [INVALIDATION_CHANNEL, FAQ_INVALIDATION_CHANNEL]
+                })
+                if reconnecting:
+                    # Invalidations sent while disconnected never arrived
+                    self.clear()
+                delay = RESUBSCRIBE_DELAY_SECONDS
+                await self._listen(pubsub)
+                logger.warning("Tenant cache invalidation subscription closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Tenant cache invalidation subscription failed", extra={
+                    "error_type": type(e).__name__,
+                    "retry_in": delay
+                }, exc_info=e)
+            reconnecting = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RESUBSCRIBE_MAX_DELAY_SECONDS)
+
+    async def _listen(self, pubsub):
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                if message.get("channel") == FAQ_INVALIDATION_CHANNEL:
+                    for callback in self._faq_listeners:
+                        callback(message["data"])
+                else:
+                    self.invalidate_local(message["data"])
+        finally:
+            await pubsub.close()
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+
+def publish_faq_invalidation(tenant_id: str, redis_url: Optional[str] = None) -> bool:
+    """Report changed FAQs from a process without the listener (e.g. a Celery worker).
+
+    Returns False when no Redis is configured; API workers then pick up the
+    change as their caches expire.
+    """
+    redis_url = redis_url or settings.TENANT_CACHE_REDIS_URL
+    if not redis_url:
+        return False
+    import redis
+
+    client = redis.from_url(redis_url)
+    try:
+        client.publish(FAQ_INVALIDATION_CHANNEL, tenant_id)
+    finally:
+        client.close()
+    return True
+
+
+tenant_cache = TenantCache(
+    ttl_seconds=settings.TENANT_CACHE_TTL_SECONDS,
+    max_entries=settings.TENANT_CACHE_MAX_ENTRIES,
+    redis_url=settings.TENANT_CACHE_REDIS_URL,
+)
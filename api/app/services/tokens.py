@@ -0,0 +1,62 @@
+"""Token counting for prompt budgeting.
+
+Uses tiktoken's encoding for the chat model when it is installed and its
+encoding files are available; otherwise falls back to an estimate of one token
+per four characters, which is close for English and errs high for most scripts
+that tokenize worse, so budgets stay conservative.
+"""
+
+import math
+from functools import lru_cache
+from typing import Dict, Iterable
+
+from app.core.logging import get_logger
+
+try:
+    import tiktoken
+except ImportError:  # optional: the estimate below is used instead
+    tiktoken = None
+
+logger = get_logger(__name__)
+
+# Chat formatting overhead in OpenAI's accounting: every message is wrapped in
+# role/separator tokens, and the reply is primed with a few more
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # e.g. the encoding file cannot be downloaded in an offline container
+        logger.warning("tiktoken encoding unavailable, estimating token counts", extra={
+            "model": model,
+            "error_type": type(e).__name__
+        })
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Number of tokens `text` takes in `model`'s encoding (estimated without tiktoken)."""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: Iterable[Dict[str, str]], model: str) -> int:
+    """Prompt tokens a list of chat messages will be billed for."""
+    return sum(
+        TOKENS_PER_MESSAGE + count_tokens(message["content"], model)
+        for message in messages
+    ) + TOKENS_PER_REPLY
@@ -0,0 +1,193 @@
+"""In-memory per-tenant vector index for FAQ retrieval.
+
+Each tenant's FAQ embeddings are kept L2-normalized in a float32 NumPy matrix
+with the FAQ ids in a parallel array, so cosine top-k is a single matmul plus
+`argpartition`. Indexes are loaded lazily from the database on first use and
+kept current by the admin router; they are process-local, so each index is
+also reloaded after VECTOR_INDEX_MAX_AGE_SECONDS to pick up writes made by
+other workers (or right away, when FAQ changes are broadcast over Redis, see
+tenant_cache).
+"""
+
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.models.faq import FAQ
+
+logger = get_logger(__name__)
+
+
+class TenantVectorIndex:
+    """Normalized embedding matrix with a parallel array of FAQ ids."""
+
+    def __init__(self, dim: int, initial_capacity: int = 64):
+        self.dim = dim
+        self.loaded_at = time.monotonic()
+        self._matrix = np.zeros((max(1, initial_capacity), dim), dtype=np.float32)
+        self._ids = np.zeros(max(1, initial_capacity), dtype=np.int64)
+        self._rows: dict[int, int] = {}
+        self._size = 0
+
+    @classmethod
+    def from_rows(cls, dim: int, rows: Sequence[Tuple[int, Sequence[float]]]) -> "TenantVectorIndex":
+        """Build an index from (faq_id, embedding) rows with one vectorized normalization."""
+        if not rows:
+            return cls(dim)
+        return cls.from_arrays(
+            dim,
+            np.asarray([faq_id for faq_id, _ in rows], dtype=np.int64),
+            np.asarray([embedding for _, embedding in rows], dtype=np.float32),
+        )
+
+    @classmethod
+    def from_arrays(cls, dim: int, ids: np.ndarray, matrix: np.ndarray) -> "TenantVectorIndex":
+        """Build an index from an id array and a float32 matrix, which is normalized in place."""
+        index = cls(dim, initial_capacity=len(ids))
+        if not len(ids):
+            return index
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+
+        index._matrix = matrix
+        index._ids = ids
+        index._rows = {int(faq_id): row for row, faq_id in enumerate(ids)}
+        index._size = len(ids)
+        return index
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        return self._matrix.nbytes + self._ids.nbytes
+
+    def _normalize(self, embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _grow(self, capacity: int):
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._ids = matrix, ids
+
+    def upsert(self, faq_id: int, embedding: Sequence[float]):
+        row = self._rows.get(faq_id)
+        if row is None:
+            if self._size == len(self._ids):
+                self._grow(len(self._ids) * 2)
+            row = self._size
+            self._rows[faq_id] = row
+            self._ids[row] = faq_id
+            self._size += 1
+        self._matrix[row] = self._normalize(embedding)
+
+    def remove(self, faq_id: int):
+        row = self._rows.pop(faq_id, None)
+        if row is None:
+            return
+
+        # Move the last row into the hole to keep the matrix dense
+        last = self._size - 1
+        if row != last:
+            moved_id = int(self._ids[last])
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+        self._size = last
+
+    def search(self, query_embedding: Sequence[float], top_k: int) -> List[Tuple[int, float]]:
+        """Return up to top_k (faq_id, cosine similarity) pairs, best first."""
+        if self._size == 0 or top_k <= 0:
+            return []
+
+        query = self._normalize(query_embedding)
+        scores = self._matrix[:self._size] @ query
+
+        k = min(top_k, self._size)
+        if k < self._size:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(self._size)
+        top = top[np.argsort(-scores[top])]
+        return [(int(self._ids[row]), float(scores[row])) for row in top]
+
+
+class VectorIndexRegistry:
+    """LRU of per-tenant indexes, loaded lazily from the `faqs` table."""
+
+    def __init__(self, dim: int, max_tenants: int, max_age_seconds: float):
+        self.dim = dim
+        self.max_tenants = max(1, max_tenants)
+        self.max_age_seconds = max_age_seconds
+        self._indexes: "OrderedDict[str, TenantVectorIndex]" = OrderedDict()
+
+    async def _load(self, db: AsyncSession, tenant_id: str, embedding_model: Optional[str]) -> TenantVectorIndex:
+        query = (
+            select(FAQ.id, FAQ.embedding)
+            .where(FAQ.tenant_id == tenant_id)
+            .where(FAQ.embedding != None)
+        )
+        if embedding_model is not None:
+            query = query.where(FAQ.embedding_model == embedding_model)
+        rows = (await db.execute(query)).all()
+        index = TenantVectorIndex.from_rows(self.dim, rows)
+
+        logger.info("Loaded tenant vector index", extra={
+            "tenant_id": tenant_id,
+            "faq_count": len(index),
+            "index_bytes": index.nbytes
+        })
+        return index
+
+    async def get_or_load(self, db: AsyncSession, tenant_id: str, embedding_model: Optional[str] = None) -> TenantVectorIndex:
+        """Return the tenant's index, (re)loading it when missing or stale.
+
+        embedding_model restricts the index to vectors produced by that model.
+        """
+        index = self._indexes.get(tenant_id)
+        if index is None or time.monotonic() - index.loaded_at > self.max_age_seconds:
+            index = await self._load(db, tenant_id, embedding_model)
+            self._indexes[tenant_id] = index
+        self._indexes.move_to_end(tenant_id)
+
+        while len(self._indexes) > self.max_tenants:
+            self._indexes.popitem(last=False)
+        return index
+
+    def get(self, tenant_id: str) -> Optional[TenantVectorIndex]:
+        return self._indexes.get(tenant_id)
+
+    def upsert(self, tenant_id: str, faq_id: int, embedding: Sequence[float]):
+        """Apply a created or updated FAQ; tenants that are not loaded are skipped."""
+        index = self._indexes.get(tenant_id)
+        if index is not None and embedding is not None:
+            index.upsert(faq_id, embedding)
+
+    def remove(self, tenant_id: str, faq_id: int):
+        index = self._indexes.get(tenant_id)
+        if index is not None:
+            index.remove(faq_id)
+
+    def drop(self, tenant_id: str):
+        self._indexes.pop(tenant_id, None)
+
+    def clear(self):
+        self._indexes.clear()
+
+
+vector_index = VectorIndexRegistry(
+    dim=FAQ.__table__.c.embedding.type.dim,
+    max_tenants=settings.VECTOR_INDEX_MAX_TENANTS,
+    max_age_seconds=settings.VECTOR_INDEX_MAX_AGE_SECONDS,
+)
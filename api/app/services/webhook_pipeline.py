@@ -0,0 +1,261 @@
+"""Asynchronous ingestion pipeline for WhatsApp webhooks.
+
+The webhook endpoint only parses the payload and puts messages on a bounded
+asyncio queue, so Meta gets its 200 within milliseconds. A pool of worker
+tasks drains the queue in batches: each batch is persisted with one
+idempotent bulk insert, and only messages that were actually new go on to
+the RAG step and the reply send. The replies that were sent are stored with
+one more insert per batch, so conversation_memory can give follow-up
+questions their history. When the queue is full the endpoint answers 503 and
+Meta redelivers later, which is the backpressure.
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.logging import get_logger
+from app.services.ai import generate_answer, prepare_rag_prompt
+from app.services.conversation import ConversationTurn, conversation_memory, save_turns
+from app.services.idempotency import insert_new_messages
+from app.services.monitoring import (
+    StageTimer,
+    webhook_messages_total,
+    webhook_processing_duration_seconds,
+    webhook_queue_depth,
+    webhook_queue_wait_seconds,
+)
+from app.services.outbound import outbound_scheduler
+from app.services.tenant_cache import TenantSnapshot, tenant_cache
+from app.services.whatsapp import WhatsAppClient
+
+logger = get_logger(__name__)
+
+# Stored for messages without a usable timestamp. It has to be the same on every
+# delivery; rows with it land in messages_default and are deleted by the first
+# retention run (see message_partitions.apply_retention), which only costs the
+# dedupe of a redelivery that arrives after that.
+MISSING_TIMESTAMP = datetime(1970, 1, 1)
+
+
+def _message_timestamp(message: Dict) -> datetime:
+    """Meta's send time for the message, or MISSING_TIMESTAMP.
+
+    Part of the idempotency key, so retries of a message must map to the same value.
+    """
+    try:
+        return datetime.utcfromtimestamp(int(message["timestamp"]))
+    except (KeyError, TypeError, ValueError, OverflowError, OSError):
+        return MISSING_TIMESTAMP
+
+
+class WebhookPipeline:
+    """Bounded queue of inbound messages drained in batches by a fixed pool of workers."""
+
+    def __init__(self, maxsize: int, workers: int, batch_size: int, shutdown_timeout: float):
+        self.maxsize = maxsize
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.shutdown_timeout = shutdown_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Create the queue and worker tasks on the running event loop."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.get_running_loop().create_task(self._worker(number))
+            for number in range(self.workers)
+        ]
+        logger.info("Webhook pipeline started", extra={
+            "workers": self.workers,
+            "queue_maxsize": self.maxsize,
+            "batch_size": self.batch_size
+        })
+
+    async def stop(self):
+        """Let workers drain the queue for up to shutdown_timeout, then cancel them."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Webhook pipeline stopped with messages still queued", extra={
+                "queue_depth": self._queue.qsize()
+            })
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Webhook pipeline stopped")
+
+    def enqueue(self, message: Dict) -> bool:
+        """Queue a parsed message without waiting. Returns False when the queue is full."""
+        if not self.running:
+            raise RuntimeError("Webhook pipeline is not running.")
+        try:
+            self._queue.put_nowait((time.monotonic(), message))
+        except asyncio.QueueFull:
+            webhook_messages_total.labels(status="rejected").inc()
+            return False
+
+        webhook_messages_total.labels(status="enqueued").inc()
+        webhook_queue_depth.set(self._queue.qsize())
+        return True
+
+    async def _worker(self, number: int):
+        while True:
+            # Block for one message, then take whatever else is already waiting
+            jobs = [await self._queue.get()]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            webhook_queue_depth.set(self._queue.qsize())
+
+            start_time = time.monotonic()
+            for enqueued_at, _ in jobs:
+                webhook_queue_wait_seconds.observe(start_time - enqueued_at)
+
+            try:
+                for status in await self.process_batch([message for _, message in jobs]):
+                    webhook_messages_total.labels(status=status).inc()
+            except Exception as e:
+                webhook_messages_total.labels(status="failed").inc(len(jobs))
+                logger.error("Error processing webhook batch", extra={
+                    "worker": number,
+                    "batch_size": len(jobs),
+                    "error_type": type(e).__name__
+                }, exc_info=e)
+            finally:
+                webhook_processing_duration_seconds.observe(time.monotonic() - start_time)
+                for _ in jobs:
+                    self._queue.task_done()
+
+    async def process_batch(self, messages: List[Dict]) -> List[str]:
+        """Persist a batch idempotently and answer the new messages.
+
+        Returns one outcome label per message for metrics.
+        """
+        async with AsyncSessionLocal() as db:
+            tenants = await tenant_cache.get_by_phone_ids(db, (message.get("phone_number_id") for message in messages))
+            rows = [
+                {
+                    "tenant_id": tenants[message.get("phone_number_id")].id,
+                    "wa_msg_id": message["message_id"],
+                    "user_phone": message.get("from"),
+                    "role": "user",
+                    "text": message.get("content"),
+                    "ts": _message_timestamp(message),
+                }
+                for message in messages
+                if message.get("phone_number_id") in tenants and message.get("message_id")
+            ]
+            new_ids = await insert_new_messages(db, rows)
+
+        for row in rows:
+            if row["wa_msg_id"] in new_ids and row["user_phone"]:
+                conversation_memory.record(row["tenant_id"], row["user_phone"], ConversationTurn(
+                    "user", row["text"], row["ts"], row["wa_msg_id"]
+                ))
+
+        outcomes: List[Optional[str]] = [None] * len(messages)
+        replies = []
+        for position, message in enumerate(messages):
+            tenant = tenants.get(message.get("phone_number_id"))
+            if tenant is None:
+                logger.warning("No tenant for webhook message", extra={
+                    "phone_number_id": message.get("phone_number_id"),
+                    "message_id": message.get("message_id")
+                })
+                outcomes[position] = "ignored"
+            elif message.get("message_id") not in new_ids:
+                outcomes[position] = "duplicate"
+            elif message.get("type") != "text" or not message.get("content"):
+                outcomes[position] = "ignored"
+            else:
+                # Each id is new only once, even if Meta repeated it inside this batch
+                new_ids.discard(message["message_id"])
+                replies.append((position, self._reply(tenant, message)))
+
+        results = await asyncio.gather(*(reply for _, reply in replies), return_exceptions=True)
+        await self._save_replies([result for result in results if isinstance(result, dict)])
+        for (position, _), result in zip(replies, results):
+            if isinstance(result, Exception):
+                logger.error("Error answering webhook message", extra={
+                    "message_id": messages[position].get("message_id"),
+                    "error_type": type(result).__name__
+                }, exc_info=result)
+                outcomes[position] = "failed"
+            else:
+                outcomes[position] = "processed"
+        return outcomes
+
+    async def _save_replies(self, rows: List[Dict]):
+        """Store the sent replies as assistant turns; a failure here never fails the batch."""
+        if not rows:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                await save_turns(db, rows)
+        except Exception as e:
+            logger.error("Error storing webhook replies", extra={
+                "reply_count": len(rows),
+                "error_type": type(e).__name__
+            }, exc_info=e)
+            return
+        for row in rows:
+            conversation_memory.record(row["tenant_id"], row["user_phone"], ConversationTurn(
+                "assistant", row["text"], row["ts"], row["wa_msg_id"]
+            ))
+
+    async def _reply(self, tenant: TenantSnapshot, message: Dict) -> Dict:
+        """Answer one message and return the reply as a messages row."""
+        timer = StageTimer()
+        # The connection goes back to the pool before the (much slower) generation step
+        async with AsyncSessionLocal() as db:
+            history = None
+            if settings.CONVERSATION_HISTORY_ENABLED:
+                with timer.stage("history"):
+                    turns = await conversation_memory.history(
+                        db, tenant.id, message["from"], exclude_msg_id=message["message_id"]
+                    )
+                history = [turn.as_chat_message() for turn in turns]
+            prompt = await prepare_rag_prompt(
+                db, tenant.id, message["content"], tenant.system_prompt, timer=timer, history=history
+            )
+        answer = await generate_answer(prompt, timer=timer)
+
+        client = WhatsAppClient.for_tenant(tenant.phone_id, tenant.wh_token)
+        with timer.stage("send"):
+            result = await outbound_scheduler.send_text(client, message["from"], answer)
+        timer.observe(tenant.tier)
+        if "error" in result:
+            raise RuntimeError(f"Reply send failed: {result['error']}")
+        return {
+            "tenant_id": tenant.id,
+            "wa_msg_id": (result.get("messages") or [{}])[0].get("id"),
+            "user_phone": message["from"],
+            "role": "assistant",
+            "text": answer,
+            "ts": datetime.utcnow(),
+        }
+
+
+webhook_pipeline = WebhookPipeline(
+    maxsize=settings.WEBHOOK_QUEUE_MAXSIZE,
+    workers=settings.WEBHOOK_WORKERS,
+    batch_size=settings.WEBHOOK_BATCH_MAX_SIZE,
+    shutdown_timeout=settings.WEBHOOK_SHUTDOWN_TIMEOUT_SECONDS,
+)
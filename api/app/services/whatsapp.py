@@ -3,7 +3,7 @@
 import json
 import logging
 import os
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterator, List, Optional, Union
 
 import httpx
 from app.core.config import settings
@@ -12,7 +12,14 @@ from app.core.config import settings
 logger = logging.getLogger(__name__)
 
 class WhatsAppClient:
-    """Client for WhatsApp Business API."""
+    """Client for WhatsApp Business API.
+    
+    All instances share one pooled httpx.AsyncClient (keep-alive, optional
+    HTTP/2) that is opened by startup() and closed by shutdown().
+    """
+    
+    _http_client: Optional[httpx.AsyncClient] = None
+    _tenant_clients: Dict[str, "WhatsAppClient"] = {}
     
     def __init__(self, phone_number_id: str = None, token: str = None):
         """Initialize WhatsApp client.
@@ -24,11 +31,70 @@ class WhatsAppClient:
         self.phone_number_id = phone_number_id or os.getenv("WHATSAPP_PHONE_NUMBER_ID")
         self.token = token or os.getenv("WHATSAPP_API_TOKEN")
         self.api_version = "v17.0"  # Current WhatsApp API version
-        self.base_url = f"https://graph.facebook.com/{self.api_version}/{self.phone_number_id}"
+        self.base_url = f"{settings.WHATSAPP_API_BASE_URL.rstrip('/')}/{self.api_version}/{self.phone_number_id}"
+        self.messages_url = f"{self.base_url}/messages"
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.token}"
+        }
         
         if not self.phone_number_id or not self.token:
             logger.warning("WhatsApp credentials not configured properly")
     
+    @classmethod
+    def for_tenant(cls, phone_number_id: str, token: str) -> "WhatsAppClient":
+        """Return the cached client for a tenant's phone number, rebuilding it if the token changed.
+        
+        Args:
+            phone_number_id: WhatsApp phone number ID
+            token: WhatsApp API token
+            
+        Returns:
+            Client with prebuilt URL and headers
+        """
+        client = cls._tenant_clients.get(phone_number_id)
+        if client is None or client.token != token:
+            client = cls(phone_number_id=phone_number_id, token=token)
+            cls._tenant_clients[phone_number_id] = client
+        return client
+    
+    @classmethod
+    def _create_http_client(cls) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=settings.WHATSAPP_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.WHATSAPP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.WHATSAPP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.WHATSAPP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=httpx.Timeout(settings.WHATSAPP_TIMEOUT_SECONDS),
+        )
+    
+    @classmethod
+    async def startup(cls):
+        """Open the shared connection pool (call once at application startup)."""
+        if cls._http_client is None or cls._http_client.is_closed:
+            cls._http_client = cls._create_http_client()
+            logger.info(
+                f"WhatsApp HTTP client started (http2={settings.WHATSAPP_HTTP2}, "
+                f"max_connections={settings.WHATSAPP_MAX_CONNECTIONS})"
+            )
+    
+    @classmethod
+    async def shutdown(cls):
+        """Close the shared connection pool (call once at application shutdown)."""
+        if cls._http_client is not None:
+            await cls._http_client.aclose()
+            cls._http_client = None
+        cls._tenant_clients.clear()
+    
+    @classmethod
+    def http_client(cls) -> httpx.AsyncClient:
+        """Shared HTTP client; created on first use when startup() was not called (scripts, tasks)."""
+        if cls._http_client is None or cls._http_client.is_closed:
+            cls._http_client = cls._create_http_client()
+        return cls._http_client
+    
     async def send_text_message(self, to: str, text: str) -> Dict:
         """Send a text message to a WhatsApp user.
         
@@ -40,11 +106,6 @@ class WhatsAppClient:
             API response
         """
         try:
-            url = f"{self.base_url}/messages"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.token}"
-            }
             payload = {
                 "messaging_product": "whatsapp",
                 "recipient_type": "individual",
@@ -53,21 +114,24 @@ class WhatsAppClient:
                 "text": {"body": text}
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    url, 
-                    headers=headers, 
-                    json=payload, 
-                    timeout=10.0
-                )
+            response = await self.http_client().post(
+                self.messages_url, 
+                headers=self.headers, 
+                json=payload
+            )
+            
+            if response.status_code == 200:
+                logger.info(f"Message sent successfully to {to}")
+                return response.json()
+            else:
+                logger.error(f"Failed to send message: {response.text}")
+                return {
+                    "error": response.text,
+                    "status_code": response.status_code,
+                    "retry_after": response.headers.get("Retry-After")
+                }
                 
-                if response.status_code == 200:
-                    logger.info(f"Message sent successfully to {to}")
-                    return response.json()
-                else:
-                    logger.error(f"Failed to send message: {response.text}")
-                    return {"error": response.text, "status_code": response.status_code}
-                    
+
         except Exception as e:
             logger.error(f"Error sending WhatsApp message: {str(e)}")
             return {"error": str(e)}
@@ -91,12 +155,6 @@ class WhatsAppClient:
             API response
         """
         try:
-            url = f"{self.base_url}/messages"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.token}"
-            }
-            
             template = {
                 "name": template_name,
                 "language": {"code": language_code}
@@ -113,29 +171,151 @@ class WhatsAppClient:
                 "template": template
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    url, 
-                    headers=headers, 
-                    json=payload,
-                    timeout=10.0
-                )
+            response = await self.http_client().post(
+                self.messages_url, 
+                headers=self.headers, 
+                json=payload
+            )
+            
+            if response.status_code == 200:
+                logger.info(f"Template message sent successfully to {to}")
+                return response.json()
+            else:
+                logger.error(f"Failed to send template message: {response.text}")
+                return {
+                    "error": response.text,
+                    "status_code": response.status_code,
+                    "retry_after": response.headers.get("Retry-After")
+                }
                 
-                if response.status_code == 200:
-                    logger.info(f"Template message sent successfully to {to}")
-                    return response.json()
-                else:
-                    logger.error(f"Failed to send template message: {response.text}")
-                    return {"error": response.text, "status_code": response.status_code}
-                    
         except Exception as e:
             logger.error(f"Error sending WhatsApp template message: {str(e)}")
             return {"error": str(e)}
     
+    @staticmethod
+    def _parse_message(message: Dict, phone_number_id: Optional[str]) -> Dict:
+        """Parse a single entry of `value.messages`.
+        
+        Args:
+            message: Message object from the webhook
+            phone_number_id: Business phone number ID the message was sent to
+            
+        Returns:
+            Parsed message
+        """
+        # Extract message content based on type
+        message_type = message.get("type")
+        content = None
+        
+        if message_type == "text":
+            text_obj = message.get("text", {})
+            content = text_obj.get("body") if text_obj else None
+        elif message_type == "image":
+            image_obj = message.get("image", {})
+            content = image_obj.get("id") if image_obj else None
+        elif message_type == "audio":
+            audio_obj = message.get("audio", {})
+            content = audio_obj.get("id") if audio_obj else None
+        elif message_type == "document":
+            document_obj = message.get("document", {})
+            content = document_obj.get("id") if document_obj else None
+        
+        return {
+            "kind": "message",
+            "message_id": message.get("id"),
+            "phone_number_id": phone_number_id,
+            "from": message.get("from"),
+            "timestamp": message.get("timestamp"),
+            "type": message_type,
+            "content": content
+        }
+    
+    @staticmethod
+    def _parse_status(status: Dict, phone_number_id: Optional[str]) -> Dict:
+        """Parse a single entry of `value.statuses` (delivery/read callbacks).
+        
+        Args:
+            status: Status object from the webhook
+            phone_number_id: Business phone number ID that sent the message
+            
+        Returns:
+            Parsed status callback
+        """
+        return {
+            "kind": "status",
+            "message_id": status.get("id"),
+            "phone_number_id": phone_number_id,
+            "recipient_id": status.get("recipient_id"),
+            "status": status.get("status"),
+            "timestamp": status.get("timestamp"),
+            "errors": status.get("errors")
+        }
+    
+    @staticmethod
+    def iter_webhook_events(body: Dict) -> Iterator[Dict]:
+        """Yield every message and status callback in a webhook payload.
+        
+        Meta batches several messages, and several phone numbers, into one
+        webhook, so every entry, change, message and status is visited.
+        Malformed items are logged and skipped without dropping the rest.
+        
+        Args:
+            body: Webhook request body
+            
+        Yields:
+            Parsed events; messages have kind "message", status callbacks kind "status"
+        """
+        entries = body.get("entry") if isinstance(body, dict) else None
+        if not isinstance(entries, list):
+            return
+        
+        for entry in entries:
+            changes = entry.get("changes") if isinstance(entry, dict) else None
+            if not isinstance(changes, list):
+                continue
+            
+            for change in changes:
+                value = change.get("value") if isinstance(change, dict) else None
+                if not isinstance(value, dict):
+                    continue
+                
+                metadata = value.get("metadata") or {}
+                messages = value.get("messages") or []
+                statuses = value.get("statuses") or []
+                if not isinstance(metadata, dict) or not isinstance(messages, list) or not isinstance(statuses, list):
+                    logger.error("Skipping malformed webhook change")
+                    continue
+                phone_number_id = metadata.get("phone_number_id")
+                
+                for message in messages:
+                    try:
+                        yield WhatsAppClient._parse_message(message, phone_number_id)
+                    except Exception as e:
+                        logger.error(f"Error parsing webhook message: {str(e)}")
+                
+                for status in statuses:
+                    try:
+                        yield WhatsAppClient._parse_status(status, phone_number_id)
+                    except Exception as e:
+                        logger.error(f"Error parsing webhook status: {str(e)}")
+    
+    @staticmethod
+    def iter_webhook_messages(body: Dict) -> Iterator[Dict]:
+        """Yield every inbound message in a webhook payload."""
+        return (event for event in WhatsAppClient.iter_webhook_events(body) if event["kind"] == "message")
+    
+    @staticmethod
+    def iter_webhook_statuses(body: Dict) -> Iterator[Dict]:
+        """Yield every status callback in a webhook payload."""
+        return (event for event in WhatsAppClient.iter_webhook_events(body) if event["kind"] == "status")
+    
     @staticmethod
     def parse_webhook_message(body: Dict) -> Optional[Dict]:
         """Parse WhatsApp webhook message.
         
+        Only the first message is returned; use iter_webhook_messages to
+        read every message in a batched webhook.
+        
         Args:
             body: Webhook request body
             
@@ -143,61 +323,7 @@ class WhatsAppClient:
             Parsed message or None if invalid
         """
         try:
-            # Extract entry and changes
-            entry = body.get("entry", [])
-            if not entry or not isinstance(entry, list):
-                return None
-                
-            changes = entry[0].get("changes", [])
-            if not changes or not isinstance(changes, list):
-                return None
-                
-            # Extract value
-            value = changes[0].get("value", {})
-            if not value:
-                return None
-                
-            # Extract messages
-            messages = value.get("messages", [])
-            if not messages or not isinstance(messages, list):
-                return None
-                
-            # Extract first message
-            message = messages[0]
-            if not message:
-                return None
-                
-            # Extract message details
-            message_id = message.get("id")
-            from_number = message.get("from")
-            timestamp = message.get("timestamp")
-            
-            # Extract message content based on type
-            message_type = message.get("type")
-            content = None
-            
-            if message_type == "text":
-                text_obj = message.get("text", {})
-                content = text_obj.get("body") if text_obj else None
-            elif message_type == "image":
-                image_obj = message.get("image", {})
-                content = image_obj.get("id") if image_obj else None
-            elif message_type == "audio":
-                audio_obj = message.get("audio", {})
-                content = audio_obj.get("id") if audio_obj else None
-            elif message_type == "document":
-                document_obj = message.get("document", {})
-                content = document_obj.get("id") if document_obj else None
-            
-            # Return parsed message
-            return {
-                "message_id": message_id,
-                "from": from_number,
-                "timestamp": timestamp,
-                "type": message_type,
-                "content": content
-            }
-            
+            return next(WhatsAppClient.iter_webhook_messages(body), None)
         except Exception as e:
             logger.error(f"Error parsing webhook message: {str(e)}")
             return None
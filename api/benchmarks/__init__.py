@@ -0,0 +1,9 @@
+"""Load tests and benchmarks for the request hot path.
+
+Nothing here talks to OpenAI or Meta: `fake_servers` stands in for the OpenAI
+embeddings/chat API and the WhatsApp Graph `/messages` endpoint with
+configurable latency and error rates, `payloads` generates realistic batched
+webhook bodies, and `scenarios` drives a running API and reports throughput
+and p50/p95/p99 latency. `python -m benchmarks.run --help` lists the commands;
+see benchmarks/README.md for the full setup.
+"""
@@ -0,0 +1,253 @@
+"""Local stand-ins for the OpenAI API and the WhatsApp Graph API.
+
+Both are small FastAPI apps. Every request first goes through a `FaultProfile`,
+which sleeps for the configured latency (plus uniform jitter) and fails a
+configured fraction of requests, so the API under test sees the same kind of
+slow and flaky upstreams it sees in production, reproducibly (seeded RNG).
+
+Embeddings are derived from a hash of the input text, so the same text always
+gets the same unit vector, and the vector index, caches and pgvector behave as
+they would with real embeddings. Chat completions stream word by word with a
+fixed interval between chunks, so time to first token and total generation
+time can be set independently.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import List, Optional
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_ANSWER = (
+    "Thanks for reaching out! Based on our knowledge base, here is what you need to know. "
+    "Please let us know if there is anything else we can help you with today."
+)
+
+
+class FaultProfile:
+    """Latency and failure injection for one fake upstream."""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+
+    async def delay(self):
+        latency = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    def error_response(self) -> Optional[JSONResponse]:
+        """A failure response for this request, or None if it should succeed."""
+        if self.error_rate <= 0 or self._random.random() >= self.error_rate:
+            return None
+        headers = {"Retry-After": "1"} if self.error_status == 429 else None
+        return JSONResponse(
+            status_code=self.error_status,
+            content={"error": {"message": "Injected failure", "type": "fake_server_error"}},
+            headers=headers,
+        )
+
+
+class RequestStats:
+    """Counters a scenario reads back over GET /_stats."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.failures = 0
+        self.items = 0
+        self.first_at: Optional[float] = None
+        self.last_at: Optional[float] = None
+
+    def record(self, items: int = 1, failed: bool = False):
+        now = time.time()
+        self.requests += 1
+        if failed:
+            self.failures += 1
+        else:
+            self.items += items
+        self.first_at = self.first_at or now
+        self.last_at = now
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "items": self.items,
+            "first_at": self.first_at,
+            "last_at": self.last_at,
+        }
+
+
+def _add_stats_routes(app: FastAPI, stats: RequestStats):
+    @app.get("/_stats")
+    async def get_stats():
+        return stats.as_dict()
+
+    @app.post("/_reset")
+    async def reset_stats():
+        stats.reset()
+        return stats.as_dict()
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Deterministic unit vector for a text."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def create_openai_app(
+    profile: FaultProfile,
+    embedding_dim: int = 1536,
+    completion_words: int = 40,
+    token_interval_ms: float = 10.0,
+) -> FastAPI:
+    """Fake of POST /v1/embeddings and POST /v1/chat/completions (plain and streaming)."""
+    app = FastAPI(title="Fake OpenAI")
+    stats = RequestStats()
+    _add_stats_routes(app, stats)
+    words = (FAKE_ANSWER.split() * (completion_words // len(FAKE_ANSWER.split()) + 1))[:completion_words]
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await profile.delay()
+        error = profile.error_response()
+        stats.record(items=len(inputs), failed=error is not None)
+        if error is not None:
+            return error
+
+        return {
+            "object": "list",
+            "model": body.get("model"),
+            "data": [
+                {"object": "embedding", "index": index, "embedding": fake_embedding(text, embedding_dim)}
+                for index, text in enumerate(inputs)
+            ],
+            "usage": {
+                "prompt_tokens": sum(_estimate_tokens(text) for text in inputs),
+                "total_tokens": sum(_estimate_tokens(text) for text in inputs),
+            },
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        # Time to first token
+        await profile.delay()
+        error = profile.error_response()
+        stats.record(failed=error is not None)
+        if error is not None:
+            return error
+
+        prompt_tokens = sum(_estimate_tokens(message.get("content") or "") for message in body["messages"])
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+        }
+        completion_id = f"chatcmpl-fake-{stats.requests}"
+        created = int(time.time())
+        model = body.get("model")
+
+        if not body.get("stream"):
+            await asyncio.sleep(token_interval_ms * len(words) / 1000)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        async def chunks():
+            def chunk(delta: dict, finish_reason: Optional[str] = None, chunk_usage: Optional[dict] = None) -> str:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+                    "usage": chunk_usage,
+                }
+                return f"data: {json.dumps(payload)}\n\n"
+
+            yield chunk({"role": "assistant", "content": ""})
+            for position, word in enumerate(words):
+                if position:
+                    await asyncio.sleep(token_interval_ms / 1000)
+                yield chunk({"content": word if position == 0 else f" {word}"})
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield chunk(None, chunk_usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+def create_graph_app(profile: FaultProfile) -> FastAPI:
+    """Fake of the WhatsApp Graph API's POST /{version}/{phone_number_id}/messages."""
+    app = FastAPI(title="Fake WhatsApp Graph API")
+    stats = RequestStats()
+    _add_stats_routes(app, stats)
+
+    @app.post("/{api_version}/{phone_number_id}/messages")
+    async def send_message(api_version: str, phone_number_id: str, request: Request):
+        body = await request.json()
+        await profile.delay()
+        error = profile.error_response()
+        stats.record(failed=error is not None)
+        if error is not None:
+            return error
+
+        return {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+            "messages": [{"id": f"wamid.fake.{phone_number_id}.{stats.requests}"}],
+        }
+
+    return app
+
+
+async def serve(app: FastAPI, host: str, port: int, shutdown_event: asyncio.Event):
+    """Serve an app with hypercorn until shutdown_event is set."""
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"{host}:{port}"]
+    config.accesslog = None
+    config.errorlog = "-"
+    await hypercorn_serve(app, config, shutdown_trigger=shutdown_event.wait)
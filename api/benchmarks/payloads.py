@@ -0,0 +1,173 @@
+"""Realistic WhatsApp webhook bodies for load tests.
+
+Meta batches deliveries: a single POST can carry several entries (one per
+business account), each with changes for several phone numbers, each with
+several messages and status callbacks. `WebhookPayloadGenerator` reproduces
+that shape, mixing in non-text messages, status callbacks and redelivered
+(duplicate) message ids in configurable proportions. It is seeded, so a run
+can be repeated payload for payload.
+"""
+
+import random
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+QUESTION_TEMPLATES = [
+    "What are your opening hours on {day}?",
+    "How much does the {product} cost?",
+    "Is the {product} in stock?",
+    "Do you ship to {city}?",
+    "How long does delivery to {city} take?",
+    "Can I return the {product} if it does not fit?",
+    "What is the warranty on the {product}?",
+    "Where is my order {order}?",
+    "I want to cancel order {order}",
+    "Do you have a store in {city}?",
+    "{product} price",
+    "{order}",
+    "hi",
+    "Can I pay for the {product} in installments, and is there a discount if I order two of them for delivery to {city}?",
+]
+PRODUCTS = ["XR-200 headphones", "Model S kettle", "AX-55 router", "winter jacket", "yoga mat", "espresso machine"]
+CITIES = ["Berlin", "Madrid", "Warsaw", "Lisbon", "Milan", "Prague"]
+DAYS = ["Saturday", "Sunday", "public holidays", "weekdays"]
+NAMES = ["Anna", "Luca", "Marta", "Jonas", "Sofia", "Pavel", "Ines"]
+STATUSES = ["sent", "delivered", "read", "failed"]
+MEDIA_TYPES = ["image", "audio", "document"]
+
+
+def render_question(rng: random.Random) -> str:
+    return rng.choice(QUESTION_TEMPLATES).format(
+        day=rng.choice(DAYS),
+        product=rng.choice(PRODUCTS),
+        city=rng.choice(CITIES),
+        order=f"#{rng.randint(100000, 999999)}",
+    )
+
+
+class WebhookPayloadGenerator:
+    """Batched webhook bodies addressed to a fixed set of business phone number ids.
+
+    `expected_replies` counts the unique text messages generated so far for
+    the given phone ids, i.e. how many replies the API should eventually send.
+    """
+
+    def __init__(
+        self,
+        phone_number_ids: Sequence[str],
+        seed: int = 42,
+        min_messages: int = 1,
+        max_messages: int = 5,
+        phone_ids_per_payload: int = 1,
+        status_ratio: float = 0.2,
+        media_ratio: float = 0.05,
+        duplicate_ratio: float = 0.02,
+        users_per_phone_id: int = 1000,
+    ):
+        if not phone_number_ids:
+            raise ValueError("At least one phone_number_id is required")
+        self.phone_number_ids = list(phone_number_ids)
+        self.min_messages = max(0, min_messages)
+        self.max_messages = max(self.min_messages, max_messages)
+        self.phone_ids_per_payload = max(1, min(phone_ids_per_payload, len(self.phone_number_ids)))
+        self.status_ratio = status_ratio
+        self.media_ratio = media_ratio
+        self.duplicate_ratio = duplicate_ratio
+        self.users_per_phone_id = max(1, users_per_phone_id)
+        self.expected_replies = 0
+        self.messages_generated = 0
+        self._rng = random.Random(seed)
+        self._sequence = 0
+        # (id, timestamp) of every message sent, for redeliveries
+        self._sent_ids: List[Tuple[str, str]] = []
+
+    def _user(self, phone_number_id: str) -> str:
+        # Stable per phone id, so conversations repeat across payloads
+        offset = zlib.crc32(phone_number_id.encode("utf-8")) % 10**6
+        return f"49{offset:06d}{self._rng.randrange(self.users_per_phone_id):04d}"
+
+    def _message(self, sender: str) -> Dict:
+        self.messages_generated += 1
+        if self._sent_ids and self._rng.random() < self.duplicate_ratio:
+            # A redelivery: same id and timestamp as an earlier message, as in Meta's
+            # retries, so it hits the (wa_msg_id, ts) dedupe in the database
+            message_id, timestamp = self._rng.choice(self._sent_ids)
+            return {
+                "from": sender,
+                "id": message_id,
+                "timestamp": timestamp,
+                "type": "text",
+                "text": {"body": "redelivered"},
+            }
+
+        self._sequence += 1
+        message_id = f"wamid.bench.{self._sequence:010d}"
+        timestamp = str(int(time.time()))
+        self._sent_ids.append((message_id, timestamp))
+        message = {"from": sender, "id": message_id, "timestamp": timestamp}
+        if self._rng.random() < self.media_ratio:
+            media_type = self._rng.choice(MEDIA_TYPES)
+            message.update({"type": media_type, media_type: {"id": f"media.{self._sequence}", "mime_type": "application/octet-stream"}})
+        else:
+            message.update({"type": "text", "text": {"body": render_question(self._rng)}})
+            self.expected_replies += 1
+        return message
+
+    def _status(self, recipient: str) -> Dict:
+        return {
+            "id": f"wamid.out.{self._rng.randrange(10**9):09d}",
+            "status": self._rng.choice(STATUSES),
+            "timestamp": str(int(time.time())),
+            "recipient_id": recipient,
+        }
+
+    def _value(self, phone_number_id: str) -> Dict:
+        value = {
+            "messaging_product": "whatsapp",
+            "metadata": {"display_phone_number": f"+{phone_number_id}", "phone_number_id": phone_number_id},
+        }
+        senders = [self._user(phone_number_id) for _ in range(self._rng.randint(self.min_messages, self.max_messages))]
+        if senders:
+            value["contacts"] = [
+                {"profile": {"name": self._rng.choice(NAMES)}, "wa_id": sender} for sender in dict.fromkeys(senders)
+            ]
+            value["messages"] = [self._message(sender) for sender in senders]
+        if self._rng.random() < self.status_ratio:
+            value["statuses"] = [self._status(self._user(phone_number_id))]
+        return value
+
+    def payload(self) -> Dict:
+        phone_ids = self._rng.sample(self.phone_number_ids, self.phone_ids_per_payload)
+        return {
+            "object": "whatsapp_business_account",
+            "entry": [{
+                "id": f"waba.{phone_number_id}",
+                "changes": [{"field": "messages", "value": self._value(phone_number_id)}],
+            } for phone_number_id in phone_ids],
+        }
+
+    def payloads(self, count: int) -> Iterator[Dict]:
+        for _ in range(count):
+            yield self.payload()
+
+
+def rag_queries(count: int, seed: int = 42, tenant_ids: Optional[Sequence[str]] = None) -> List[Dict]:
+    """Bodies for POST /rag/query/ with the same question mix as the webhooks."""
+    rng = random.Random(seed)
+    tenant_ids = list(tenant_ids or ["bench-tenant-0"])
+    return [{"tenant_id": rng.choice(tenant_ids), "query": render_question(rng)} for _ in range(count)]
+
+
+def faq_items(count: int, seed: int = 42) -> List[Dict]:
+    """FAQ entries for seeding and bulk import scenarios."""
+    rng = random.Random(seed)
+    items = []
+    for position in range(count):
+        question = render_question(rng)
+        answer = (
+            f"Answer {position}: {rng.choice(PRODUCTS)} ships to {rng.choice(CITIES)} within "
+            f"{rng.randint(1, 7)} working days. " + "Details follow. " * rng.randint(1, 20)
+        )
+        items.append({"question": question, "answer": answer.strip()})
+    return items
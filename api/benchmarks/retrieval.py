@@ -0,0 +1,333 @@
+"""Retrieval micro-benchmarks: speed, memory and recall@k of FAQ search engines.
+
+    python -m benchmarks.retrieval --sizes 1000,10000,100000 --engines numpy
+    python -m benchmarks.retrieval --sizes 100000 --engines numpy,pgvector-exact,pgvector-ann \\
+        --ef-search 40,100,200 --output retrieval.json
+
+Each size gets a synthetic tenant with seeded 1536-d unit vectors, either
+uniformly random or drawn around a number of cluster centres (closer to real
+FAQ embeddings, and much harder for ANN indexes). Exact top-k ground truth is
+computed with NumPy in chunks, so memory stays bounded even for 1M rows, and
+every engine is scored against it:
+
+- numpy: the in-memory `TenantVectorIndex` used with VECTOR_INDEX_ENABLED.
+- pgvector-exact: `find_relevant_faqs` with index scans disabled (a full scan).
+- pgvector-ann: `find_relevant_faqs` on the HNSW/IVFFlat index, once per
+  --ef-search (HNSW) or --probes (IVFFlat) value.
+
+The pgvector engines need DATABASE_URL (migrated, with pgvector) and an
+initialized embedding provider (OPENAI_API_KEY may be any value, queries are
+passed in as vectors). Synthetic tenants are kept between runs and only
+loaded again with --reload. The numpy engine holds size x 1536 float32 values
+in memory, about 6 GB at 1M.
+"""
+
+import argparse
+import asyncio
+import io
+import logging
+import resource
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.stats import LatencyRecorder, format_table, write_report
+
+DIM = 1536
+QUESTION_PREFIX = "synthetic-"
+
+
+class SyntheticCorpus:
+    """Seeded vectors generated chunk by chunk, so any chunk can be recreated without the rest."""
+
+    def __init__(self, size: int, distribution: str = "clustered", clusters: int = 100,
+                 spread: float = 0.35, seed: int = 42, dim: int = DIM):
+        self.size = size
+        self.distribution = distribution
+        self.spread = spread
+        self.seed = seed
+        self.dim = dim
+        centres = np.random.default_rng(seed).standard_normal((max(1, clusters), dim)).astype(np.float32)
+        self.centres = centres / np.linalg.norm(centres, axis=1, keepdims=True)
+
+    def _sample(self, rng: np.random.Generator, count: int) -> np.ndarray:
+        if self.distribution == "random":
+            vectors = rng.standard_normal((count, self.dim)).astype(np.float32)
+        else:
+            assignment = rng.integers(0, len(self.centres), size=count)
+            noise = rng.standard_normal((count, self.dim)).astype(np.float32) * (self.spread / np.sqrt(self.dim))
+            vectors = self.centres[assignment] + noise
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def chunks(self, chunk_size: int = 50000) -> Iterator[Tuple[int, np.ndarray]]:
+        for chunk_index, start in enumerate(range(0, self.size, chunk_size)):
+            rng = np.random.default_rng([self.seed, chunk_index, chunk_size])
+            yield start, self._sample(rng, min(chunk_size, self.size - start))
+
+    def queries(self, count: int) -> np.ndarray:
+        # Same distribution as the corpus, never identical to a stored vector
+        return self._sample(np.random.default_rng([self.seed, 10**9]), count)
+
+
+def exact_top_k(corpus: SyntheticCorpus, queries: np.ndarray, k: int, chunk_size: int = 50000) -> np.ndarray:
+    """Row positions of the exact cosine top-k for every query, best first."""
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_positions = np.zeros((len(queries), 0), dtype=np.int64)
+    for start, chunk in corpus.chunks(chunk_size):
+        scores = np.concatenate([best_scores, queries @ chunk.T], axis=1)
+        positions = np.concatenate([best_positions, np.broadcast_to(
+            np.arange(start, start + len(chunk)), (len(queries), len(chunk)))], axis=1)
+        keep = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+        best_positions = np.take_along_axis(positions, keep, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_positions, order, axis=1)
+
+
+def recall_at_k(results: List[List[int]], truth: np.ndarray, k: int) -> float:
+    hits = sum(len(set(found[:k]) & set(expected[:k].tolist())) for found, expected in zip(results, truth))
+    return hits / (k * len(results)) if results else 0.0
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+# --- Engines --- #
+
+class NumpyEngine:
+    """The in-memory TenantVectorIndex; ids are row positions."""
+
+    name = "numpy"
+
+    def __init__(self, corpus: SyntheticCorpus):
+        from app.services.vector_index import TenantVectorIndex
+
+        matrix = np.empty((corpus.size, corpus.dim), dtype=np.float32)
+        for start, chunk in corpus.chunks():
+            matrix[start:start + len(chunk)] = chunk
+        self.index = TenantVectorIndex.from_arrays(corpus.dim, np.arange(corpus.size, dtype=np.int64), matrix)
+
+    async def search(self, query: np.ndarray, k: int) -> List[int]:
+        return [faq_id for faq_id, _ in self.index.search(query, k)]
+
+    async def memory_bytes(self) -> Dict[str, int]:
+        return {"index_bytes": self.index.nbytes}
+
+    async def close(self):
+        pass
+
+
+class PgvectorEngine:
+    """find_relevant_faqs against the synthetic tenant, exact or through the ANN index."""
+
+    def __init__(self, tenant_id: str, exact: bool = False, ef_search: Optional[int] = None, probes: Optional[int] = None):
+        from app.core.database import AsyncSessionLocal
+
+        self.tenant_id = tenant_id
+        self.exact = exact
+        self.ef_search = ef_search
+        self.probes = probes
+        if exact:
+            self.name = "pgvector-exact"
+        else:
+            self.name = f"pgvector-ann(ef_search={ef_search or 'default'},probes={probes or 'default'})"
+        self._session_factory = AsyncSessionLocal
+
+    async def search(self, query: np.ndarray, k: int) -> List[int]:
+        from sqlalchemy import text
+        from app.services.ai import find_relevant_faqs
+
+        async with self._session_factory() as db:
+            if self.exact:
+                await db.execute(text("SET LOCAL enable_indexscan = off"))
+            faqs = await find_relevant_faqs(
+                db, self.tenant_id, "synthetic query", top_k=k,
+                ef_search=self.ef_search, probes=self.probes, query_embedding=query.tolist(),
+            )
+            await db.rollback()
+        return [int(faq.question[len(QUESTION_PREFIX):]) for faq in faqs]
+
+    async def memory_bytes(self) -> Dict[str, int]:
+        from sqlalchemy import text
+
+        async with self._session_factory() as db:
+            rows = (await db.execute(text(
+                "SELECT indexrelname, pg_relation_size(indexrelid) FROM pg_stat_user_indexes "
+                "WHERE relname = 'faqs' AND indexrelname LIKE 'ix_faqs_embedding%'"
+            ))).all()
+            table_bytes = (await db.execute(text("SELECT pg_total_relation_size('faqs')"))).scalar()
+        # ANN indexes cover every tenant's rows, not only the synthetic one
+        memory = {f"{name}_bytes": size for name, size in rows}
+        memory["faqs_total_bytes"] = table_bytes
+        return memory
+
+    async def close(self):
+        pass
+
+
+# --- Database loading --- #
+
+def synthetic_tenant_id(corpus: SyntheticCorpus) -> str:
+    return f"bench-retrieval-{corpus.distribution}-{corpus.size}-{corpus.seed}"
+
+
+def load_synthetic_tenant(corpus: SyntheticCorpus, embedding_model: str, reload: bool = False) -> str:
+    """Create the tenant and COPY its FAQs, unless a complete copy is already there."""
+    from sqlalchemy import delete, func, select
+    from app.core.database import SessionLocal
+    from app.models.faq import FAQ
+    from app.models.tenant import Tenant
+
+    tenant_id = synthetic_tenant_id(corpus)
+    db = SessionLocal()
+    try:
+        if db.get(Tenant, tenant_id) is None:
+            db.add(Tenant(id=tenant_id, phone_id=tenant_id, wh_token="bench", system_prompt=None))
+            db.commit()
+
+        existing = db.scalar(select(func.count()).select_from(FAQ).where(FAQ.tenant_id == tenant_id))
+        if existing == corpus.size and not reload:
+            return tenant_id
+        db.execute(delete(FAQ).where(FAQ.tenant_id == tenant_id))
+        db.commit()
+
+        now = datetime.utcnow().isoformat()
+        for start, chunk in corpus.chunks():
+            vectors = io.StringIO()
+            np.savetxt(vectors, chunk, fmt="%.6g", delimiter=",")
+            buffer = io.StringIO()
+            for position, vector in enumerate(vectors.getvalue().splitlines(), start=start):
+                buffer.write(f'{tenant_id}\t{QUESTION_PREFIX}{position}\tsynthetic\t[{vector}]\t'
+                             f'{embedding_model}\t{corpus.dim}\t1\t{now}\n')
+            buffer.seek(0)
+            cursor = db.connection().connection.cursor()
+            try:
+                cursor.copy_expert(
+                    "COPY faqs (tenant_id, question, answer, embedding, embedding_model, embedding_dim, token_count, ts) "
+                    "FROM STDIN",
+                    buffer,
+                )
+            finally:
+                cursor.close()
+            db.commit()
+            print(f"  loaded {start + len(chunk)}/{corpus.size} rows for {tenant_id}", flush=True)
+        # Fresh statistics so the planner sees the real table size
+        db.connection().exec_driver_sql("ANALYZE faqs")
+        db.commit()
+        return tenant_id
+    finally:
+        db.close()
+
+
+# --- Runner --- #
+
+async def measure(engine, queries: np.ndarray, truth: np.ndarray, k: int, size: int) -> Dict:
+    recorder = LatencyRecorder(f"{engine.name} n={size}")
+    results = []
+    recorder.start()
+    for query in queries:
+        start = time.perf_counter()
+        results.append(await engine.search(query, k))
+        recorder.record(time.perf_counter() - start)
+    recorder.stop()
+
+    summary = recorder.summary()
+    summary["engine"] = engine.name
+    summary["size"] = size
+    summary[f"recall_at_{k}"] = round(recall_at_k(results, truth, k), 4)
+    summary.update(await engine.memory_bytes())
+    return summary
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="FAQ retrieval speed, memory and recall benchmarks")
+    parser.add_argument("--sizes", type=_int_list, default=[1000, 10000, 100000],
+                        help="Comma-separated tenant sizes (FAQ count)")
+    parser.add_argument("--engines", default="numpy", help="Comma-separated: numpy, pgvector-exact, pgvector-ann")
+    parser.add_argument("--distribution", choices=("clustered", "random"), default="clustered")
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--spread", type=float, default=0.35, help="Noise around cluster centres (clustered only)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef-search", type=_int_list, default=[], help="HNSW ef_search values for pgvector-ann")
+    parser.add_argument("--probes", type=_int_list, default=[], help="IVFFlat probes values for pgvector-ann")
+    parser.add_argument("--reload", action="store_true", help="Reload synthetic tenants even if already present")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write a JSON report here")
+    return parser
+
+
+async def run(args: argparse.Namespace) -> List[Dict]:
+    engines = [engine.strip() for engine in args.engines.split(",") if engine.strip()]
+    uses_database = any(engine.startswith("pgvector") for engine in engines)
+    if uses_database:
+        from app.core.config import settings
+        from app.services.ai import get_embedding_provider
+
+        # Measure the vector search itself, not the hybrid or in-memory paths
+        settings.HYBRID_SEARCH_ENABLED = False
+        settings.VECTOR_INDEX_ENABLED = False
+        embedding_model = get_embedding_provider().model_name
+        # One line per query from find_relevant_faqs would dominate the output
+        logging.getLogger("app").setLevel(logging.WARNING)
+
+    summaries = []
+    for size in args.sizes:
+        corpus = SyntheticCorpus(size, args.distribution, args.clusters, args.spread, args.seed)
+        queries = corpus.queries(args.queries)
+        truth = exact_top_k(corpus, queries, args.k)
+        print(f"n={size}: ground truth ready", flush=True)
+
+        tenant_id = load_synthetic_tenant(corpus, embedding_model, args.reload) if uses_database else None
+        for engine_name in engines:
+            if engine_name == "numpy":
+                candidates = [NumpyEngine(corpus)]
+            elif engine_name == "pgvector-exact":
+                candidates = [PgvectorEngine(tenant_id, exact=True)]
+            elif engine_name == "pgvector-ann":
+                candidates = [PgvectorEngine(tenant_id, ef_search=ef_search) for ef_search in args.ef_search]
+                candidates += [PgvectorEngine(tenant_id, probes=probes) for probes in args.probes]
+                candidates = candidates or [PgvectorEngine(tenant_id)]
+            else:
+                raise SystemExit(f"Unknown engine: {engine_name}")
+
+            for engine in candidates:
+                summaries.append(await measure(engine, queries, truth, args.k, size))
+                await engine.close()
+                print(f"n={size}: {engine.name} done", flush=True)
+
+    if uses_database:
+        from app.core.database import dispose_async_engine
+        await dispose_async_engine()
+    return summaries
+
+
+def main(argv: List[str] = None):
+    args = build_parser().parse_args(argv)
+    summaries = asyncio.run(run(args))
+
+    columns = ["name", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", f"recall_at_{args.k}"]
+    print(format_table(summaries, columns))
+    print(f"peak RSS: {peak_rss_bytes() / 2**20:.0f} MiB")
+    if args.output:
+        write_report(args.output, summaries, {
+            "command": "retrieval",
+            "arguments": {key: value for key, value in vars(args).items()},
+            "peak_rss_bytes": peak_rss_bytes(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        })
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Command line entry point for the benchmarks.
+
+    python -m benchmarks.run fakes                  # fake OpenAI (:8100) and Graph (:8200) servers
+    python -m benchmarks.run seed --tenants 3 --faqs 200
+    python -m benchmarks.run webhook --requests 2000 --concurrency 50 --output before.json
+    python -m benchmarks.run rag --requests 500 --concurrency 20 --stream
+    python -m benchmarks.run bulk-import --imports 5 --items 1000
+    python -m benchmarks.run compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks import scenarios
+from benchmarks.fake_servers import FaultProfile, create_graph_app, create_openai_app, serve
+from benchmarks.payloads import WebhookPayloadGenerator, faq_items, rag_queries
+from benchmarks.stats import compare_reports, format_table, write_report
+
+DEFAULT_API_URL = "http://127.0.0.1:8000"
+DEFAULT_GRAPH_URL = "http://127.0.0.1:8200"
+
+
+def tenant_id(position: int) -> str:
+    return f"bench-tenant-{position}"
+
+
+def phone_number_id(position: int) -> str:
+    return f"100000000{position:04d}"
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _report(args: argparse.Namespace, results: List[Dict]):
+    print(format_table(results))
+    if args.output:
+        metadata = {
+            "command": args.command,
+            "arguments": {key: value for key, value in vars(args).items() if key not in ("handler", "admin_token")},
+            "git_revision": _git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+        write_report(args.output, results, metadata)
+        print(f"Report written to {args.output}")
+
+
+async def run_fakes(args: argparse.Namespace):
+    openai_profile = FaultProfile(args.openai_latency_ms, args.openai_jitter_ms, args.openai_error_rate,
+                                  args.openai_error_status, seed=args.seed)
+    graph_profile = FaultProfile(args.graph_latency_ms, args.graph_jitter_ms, args.graph_error_rate,
+                                 args.graph_error_status, seed=args.seed)
+    openai_app = create_openai_app(openai_profile, completion_words=args.completion_words,
+                                   token_interval_ms=args.token_interval_ms)
+    graph_app = create_graph_app(graph_profile)
+
+    print(f"Fake OpenAI API: OPENAI_BASE_URL=http://{args.host}:{args.openai_port}/v1")
+    print(f"Fake Graph API:  WHATSAPP_API_BASE_URL=http://{args.host}:{args.graph_port}")
+    shutdown = asyncio.Event()
+    await asyncio.gather(
+        serve(openai_app, args.host, args.openai_port, shutdown),
+        serve(graph_app, args.host, args.graph_port, shutdown),
+    )
+
+
+async def run_seed(args: argparse.Namespace):
+    headers = {"X-Admin-Token": args.admin_token}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(base_url=args.api_url, headers=headers, timeout=60.0) as client:
+        async def create_faq(tenant: str, item: Dict):
+            async with semaphore:
+                response = await client.post(f"/admin/tenants/{tenant}/faq/", json=item)
+                response.raise_for_status()
+
+        for position in range(args.tenants):
+            response = await client.post("/admin/tenants/", json={
+                "id": tenant_id(position),
+                "phone_id": phone_number_id(position),
+                "wh_token": "bench-token",
+                "system_prompt": "You are a concise customer support assistant.",
+                "tier": "standard",
+            })
+            if response.status_code == 400:
+                print(f"{tenant_id(position)} already exists, adding FAQs only")
+            else:
+                response.raise_for_status()
+            await asyncio.gather(*(
+                create_faq(tenant_id(position), item) for item in faq_items(args.faqs, seed=args.seed + position)
+            ))
+            print(f"Seeded {tenant_id(position)} (phone_id {phone_number_id(position)}) with {args.faqs} FAQs")
+
+
+async def run_webhook(args: argparse.Namespace):
+    generator = WebhookPayloadGenerator(
+        [phone_number_id(position) for position in range(args.tenants)],
+        seed=args.seed,
+        min_messages=args.min_messages,
+        max_messages=args.max_messages,
+        phone_ids_per_payload=args.phone_ids_per_payload,
+        duplicate_ratio=args.duplicate_ratio,
+    )
+    results = await scenarios.webhook_scenario(
+        args.api_url, generator, args.requests, args.concurrency,
+        graph_url=None if args.no_replies else args.graph_url,
+        reply_timeout=args.reply_timeout,
+    )
+    _report(args, results)
+
+
+async def run_rag(args: argparse.Namespace):
+    queries = rag_queries(args.requests, seed=args.seed, tenant_ids=[tenant_id(position) for position in range(args.tenants)])
+    results = await scenarios.rag_scenario(args.api_url, queries, args.concurrency, args.warmup, stream=args.stream)
+    _report(args, results)
+
+
+async def run_bulk_import(args: argparse.Namespace):
+    results = await scenarios.bulk_import_scenario(
+        args.api_url, args.admin_token, tenant_id(0), faq_items(args.items, seed=args.seed),
+        args.imports, args.concurrency,
+    )
+    _report(args, results)
+
+
+def run_compare(args: argparse.Namespace):
+    print(compare_reports(args.before, args.after))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmarks for the WhatsApp RAG API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(command: argparse.ArgumentParser, requests: int, concurrency: int):
+        command.add_argument("--api-url", default=DEFAULT_API_URL)
+        command.add_argument("--tenants", type=int, default=1, help="Number of seeded tenants to spread load over")
+        command.add_argument("--requests", type=int, default=requests)
+        command.add_argument("--concurrency", type=int, default=concurrency)
+        command.add_argument("--seed", type=int, default=42)
+        command.add_argument("--output", help="Write a JSON report here (input for `compare`)")
+
+    fakes = commands.add_parser("fakes", help="Run the fake OpenAI and Graph API servers")
+    fakes.add_argument("--host", default="127.0.0.1")
+    fakes.add_argument("--openai-port", type=int, default=8100)
+    fakes.add_argument("--graph-port", type=int, default=8200)
+    fakes.add_argument("--openai-latency-ms", type=float, default=150.0, help="Embedding latency / time to first token")
+    fakes.add_argument("--openai-jitter-ms", type=float, default=50.0)
+    fakes.add_argument("--openai-error-rate", type=float, default=0.0)
+    fakes.add_argument("--openai-error-status", type=int, default=500)
+    fakes.add_argument("--token-interval-ms", type=float, default=15.0, help="Delay between streamed chunks")
+    fakes.add_argument("--completion-words", type=int, default=40)
+    fakes.add_argument("--graph-latency-ms", type=float, default=80.0)
+    fakes.add_argument("--graph-jitter-ms", type=float, default=30.0)
+    fakes.add_argument("--graph-error-rate", type=float, default=0.0)
+    fakes.add_argument("--graph-error-status", type=int, default=429)
+    fakes.add_argument("--seed", type=int, default=42)
+    fakes.set_defaults(handler=run_fakes)
+
+    seed = commands.add_parser("seed", help="Create benchmark tenants and FAQs through the admin API")
+    seed.add_argument("--api-url", default=DEFAULT_API_URL)
+    seed.add_argument("--admin-token", default=os.getenv("X_ADMIN_TOKEN"))
+    seed.add_argument("--tenants", type=int, default=1)
+    seed.add_argument("--faqs", type=int, default=200)
+    seed.add_argument("--concurrency", type=int, default=10)
+    seed.add_argument("--seed", type=int, default=42)
+    seed.set_defaults(handler=run_seed)
+
+    webhook = commands.add_parser("webhook", help="Drive POST /webhook with batched payloads")
+    add_common(webhook, requests=1000, concurrency=50)
+    webhook.add_argument("--graph-url", default=DEFAULT_GRAPH_URL, help="Fake Graph server, for end-to-end reply timing")
+    webhook.add_argument("--no-replies", action="store_true", help="Only measure acknowledgement latency")
+    webhook.add_argument("--reply-timeout", type=float, default=120.0)
+    webhook.add_argument("--min-messages", type=int, default=1)
+    webhook.add_argument("--max-messages", type=int, default=5)
+    webhook.add_argument("--phone-ids-per-payload", type=int, default=1)
+    webhook.add_argument("--duplicate-ratio", type=float, default=0.02)
+    webhook.set_defaults(handler=run_webhook)
+
+    rag = commands.add_parser("rag", help="Drive POST /rag/query/ (or /rag/query/stream)")
+    add_common(rag, requests=500, concurrency=20)
+    rag.add_argument("--warmup", type=int, default=10)
+    rag.add_argument("--stream", action="store_true", help="Use the SSE endpoint and time the first chunk")
+    rag.set_defaults(handler=run_rag)
+
+    bulk_import = commands.add_parser("bulk-import", help="Time admin bulk imports end to end (needs a Celery worker)")
+    bulk_import.add_argument("--api-url", default=DEFAULT_API_URL)
+    bulk_import.add_argument("--admin-token", default=os.getenv("X_ADMIN_TOKEN"))
+    bulk_import.add_argument("--imports", type=int, default=3)
+    bulk_import.add_argument("--items", type=int, default=1000)
+    bulk_import.add_argument("--concurrency", type=int, default=1)
+    bulk_import.add_argument("--seed", type=int, default=42)
+    bulk_import.add_argument("--output")
+    bulk_import.set_defaults(handler=run_bulk_import)
+
+    compare = commands.add_parser("compare", help="Compare two JSON reports")
+    compare.add_argument("before")
+    compare.add_argument("after")
+    compare.set_defaults(handler=run_compare)
+    return parser
+
+
+def main(argv: List[str] = None):
+    args = build_parser().parse_args(argv)
+    if args.handler is run_compare:
+        run_compare(args)
+        return
+    try:
+        asyncio.run(args.handler(args))
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Load scenarios against a running API.
+
+Each scenario is a closed loop: `concurrency` workers send requests back to
+back until `requests` have been sent, after `warmup` unrecorded ones. The API
+must already be running against the fake upstreams (see benchmarks/README.md),
+so the numbers measure this service and not OpenAI or Meta.
+"""
+
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks.payloads import WebhookPayloadGenerator
+from benchmarks.stats import LatencyRecorder
+
+Request = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+async def run_closed_loop(
+    client: httpx.AsyncClient,
+    recorder: LatencyRecorder,
+    send: Request,
+    requests: int,
+    concurrency: int,
+    warmup: int = 0,
+) -> LatencyRecorder:
+    """Send `warmup` + `requests` requests from `concurrency` workers, recording all but the warmup."""
+    for position in range(warmup):
+        await send(client, -1 - position)
+
+    counter = iter(range(requests))
+
+    async def worker():
+        for position in counter:
+            start = time.perf_counter()
+            try:
+                response = await send(client, position)
+            except httpx.HTTPError as e:
+                recorder.record(time.perf_counter() - start, error=type(e).__name__)
+                continue
+            latency = time.perf_counter() - start
+            recorder.record(latency, error=None if response.status_code < 400 else f"http_{response.status_code}")
+
+    recorder.start()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    recorder.stop()
+    return recorder
+
+
+async def _fake_stats(client: httpx.AsyncClient, url: str) -> Dict:
+    response = await client.get(f"{url.rstrip('/')}/_stats")
+    response.raise_for_status()
+    return response.json()
+
+
+async def webhook_scenario(
+    api_url: str,
+    generator: WebhookPayloadGenerator,
+    requests: int,
+    concurrency: int,
+    graph_url: Optional[str] = None,
+    reply_timeout: float = 120.0,
+) -> List[Dict]:
+    """
+    POST generated payloads to /webhook and measure the acknowledgement latency.
+    With graph_url (the fake Graph server), also wait until every expected reply
+    has arrived there and report end-to-end reply throughput.
+    """
+    payloads = list(generator.payloads(requests))
+    results = []
+    async with httpx.AsyncClient(base_url=api_url, timeout=30.0) as client:
+        if graph_url:
+            await client.post(f"{graph_url.rstrip('/')}/_reset")
+
+        ack = LatencyRecorder("webhook_ack")
+        await run_closed_loop(
+            client, ack, lambda client, position: client.post("/webhook", json=payloads[position]),
+            requests, concurrency,
+        )
+        ack.extra["messages"] = generator.messages_generated
+        results.append(ack.summary())
+
+        if graph_url:
+            deadline = time.monotonic() + reply_timeout
+            stats = await _fake_stats(client, graph_url)
+            while stats["items"] < generator.expected_replies and time.monotonic() < deadline:
+                await asyncio.sleep(0.5)
+                stats = await _fake_stats(client, graph_url)
+
+            duration = (stats["last_at"] - ack.started_at_wall) if stats["last_at"] else None
+            results.append({
+                "name": "webhook_end_to_end",
+                "requests": generator.expected_replies,
+                "errors": generator.expected_replies - stats["items"],
+                "replies_received": stats["items"],
+                "send_failures": stats["failures"],
+                "duration_s": round(duration, 3) if duration else None,
+                "throughput_rps": round(stats["items"] / duration, 2) if duration else None,
+            })
+    return results
+
+
+async def rag_scenario(
+    api_url: str,
+    queries: List[Dict],
+    concurrency: int,
+    warmup: int = 0,
+    stream: bool = False,
+) -> List[Dict]:
+    """
+    POST queries to /rag/query/ (or /rag/query/stream) and measure latency.
+    The streaming variant also records time to the first answer chunk, the
+    latency a user actually notices.
+    """
+    async with httpx.AsyncClient(base_url=api_url, timeout=60.0) as client:
+        if not stream:
+            recorder = LatencyRecorder("rag_query")
+            await run_closed_loop(
+                client, recorder,
+                lambda client, position: client.post("/rag/query/", json=queries[position % len(queries)]),
+                len(queries), concurrency, warmup,
+            )
+            return [recorder.summary()]
+
+        first_chunk = LatencyRecorder("rag_stream_first_chunk")
+
+        async def send(client: httpx.AsyncClient, position: int) -> httpx.Response:
+            start = time.perf_counter()
+            async with client.stream("POST", "/rag/query/stream", json=queries[position % len(queries)]) as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("data:") and "delta" in json.loads(line[5:]):
+                        if position >= 0:
+                            first_chunk.record(time.perf_counter() - start)
+                        break
+                await response.aread()
+            return response
+
+        total = LatencyRecorder("rag_stream_total")
+        first_chunk.start()
+        await run_closed_loop(client, total, send, len(queries), concurrency, warmup)
+        first_chunk.stop()
+        return [first_chunk.summary(), total.summary()]
+
+
+async def bulk_import_scenario(
+    api_url: str,
+    admin_token: str,
+    tenant_id: str,
+    items: List[Dict],
+    imports: int,
+    concurrency: int = 1,
+    poll_interval: float = 0.5,
+    timeout: float = 600.0,
+) -> List[Dict]:
+    """
+    Submit `imports` bulk imports of `items` and time each one from submission
+    until its Celery task reports SUCCESS. Requires a running Celery worker.
+    """
+    headers = {"X-Admin-Token": admin_token}
+    recorder = LatencyRecorder("bulk_import")
+
+    async def send(client: httpx.AsyncClient, position: int) -> httpx.Response:
+        response = await client.post(f"/admin/tenants/{tenant_id}/faq/bulk-import/", json={"items": items})
+        if response.status_code >= 400:
+            return response
+        task_id = response.json()["task_id"]
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            status = await client.get(f"/admin/tenants/{tenant_id}/faq/bulk-import/{task_id}")
+            if status.status_code >= 400 or status.json()["status"] in ("SUCCESS", "FAILURE"):
+                if status.status_code < 400 and status.json()["status"] == "FAILURE":
+                    return httpx.Response(500, request=status.request)
+                return status
+            await asyncio.sleep(poll_interval)
+        return httpx.Response(504, request=response.request)
+
+    async with httpx.AsyncClient(base_url=api_url, headers=headers, timeout=60.0) as client:
+        await run_closed_loop(client, recorder, send, imports, concurrency)
+
+    summary = recorder.summary()
+    if summary["throughput_rps"]:
+        summary["items_per_second"] = round(len(items) * summary["throughput_rps"], 2)
+    return [summary]
@@ -0,0 +1,102 @@
+"""Latency recording and reporting for benchmark runs."""
+
+import json
+import math
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Linearly interpolated percentile of an already sorted sequence (fraction in 0..1)."""
+    if not sorted_values:
+        return float("nan")
+    position = (len(sorted_values) - 1) * fraction
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return sorted_values[lower]
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class LatencyRecorder:
+    """Collects per-request latencies and outcomes for one named measurement."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors: Counter = Counter()
+        self.started_at: Optional[float] = None
+        # Wall-clock start, comparable with timestamps reported by the fake servers
+        self.started_at_wall: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.extra: Dict[str, float] = {}
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.started_at_wall = time.time()
+
+    def stop(self):
+        self.finished_at = time.perf_counter()
+
+    def record(self, latency_seconds: float, error: Optional[str] = None):
+        if error is None:
+            self.latencies.append(latency_seconds)
+        else:
+            self.errors[error] += 1
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies) + sum(self.errors.values())
+
+    def summary(self) -> Dict:
+        latencies = sorted(self.latencies)
+        duration = (self.finished_at or time.perf_counter()) - (self.started_at or time.perf_counter())
+        summary = {
+            "name": self.name,
+            "requests": self.requests,
+            "errors": sum(self.errors.values()),
+            "error_kinds": dict(self.errors),
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(len(latencies) / duration, 2) if duration > 0 else None,
+            "mean_ms": round(1000 * sum(latencies) / len(latencies), 2) if latencies else None,
+        }
+        for label, fraction in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99), ("max_ms", 1.0)):
+            summary[label] = round(1000 * percentile(latencies, fraction), 2) if latencies else None
+        summary.update(self.extra)
+        return summary
+
+
+COLUMNS = ("name", "requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+
+
+def format_table(summaries: Iterable[Dict], columns: Sequence[str] = COLUMNS) -> str:
+    rows = [[str(summary.get(column, "")) for column in columns] for summary in summaries]
+    widths = [max(len(column), *(len(row[index]) for row in rows)) if rows else len(column)
+              for index, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines += ["  ".join(value.ljust(width) for value, width in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
+
+
+def write_report(path: str, summaries: List[Dict], metadata: Dict):
+    with open(path, "w") as report:
+        json.dump({"metadata": metadata, "results": summaries}, report, indent=2)
+
+
+def compare_reports(before_path: str, after_path: str) -> str:
+    """Side-by-side change of throughput and tail latency between two saved reports."""
+    with open(before_path) as report:
+        before = {result["name"]: result for result in json.load(report)["results"]}
+    with open(after_path) as report:
+        after = {result["name"]: result for result in json.load(report)["results"]}
+
+    lines = []
+    for name in [name for name in before if name in after]:
+        parts = [name]
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            old, new = before[name].get(metric), after[name].get(metric)
+            if old and new is not None:
+                parts.append(f"{metric} {old} -> {new} ({(new - old) / old:+.1%})")
+        lines.append("  ".join(parts))
+    return "\n".join(lines)
@@ -1,10 +1,17 @@
 from fastapi import FastAPI, Depends, HTTPException, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
 import os
-from app.api.endpoints import webhook
-from app.core.database import get_db
+from app.api.endpoints import admin, rag, webhook
+from app.core.database import dispose_async_engine, get_db
 from app.core.logging import logging as logger
+from app.services.ai import close_embedding_provider, warmup_embedding_provider
+from app.services.monitoring import setup_metrics
+from app.services.outbound import outbound_scheduler
+from app.services.response_cache import response_cache
+from app.services.tenant_cache import tenant_cache
+from app.services.vector_index import vector_index
+from app.services.webhook_pipeline import webhook_pipeline
+from app.services.whatsapp import WhatsAppClient
 
 # Create FastAPI app
 app = FastAPI(title="LuminiteQ API")
@@ -18,8 +25,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# HTTP metrics and the /metrics endpoint
+setup_metrics(app)
+
 # Include routers
 app.include_router(webhook.router, tags=["webhook"])
+app.include_router(admin.router)
+app.include_router(rag.router)
+
+# Start/stop the embedding provider, the outbound HTTP pool and the webhook workers with the application
+@app.on_event("startup")
+async def start_webhook_pipeline():
+    await warmup_embedding_provider()
+    # FAQ changes reported by other workers and by Celery imports
+    tenant_cache.add_faq_listener(response_cache.invalidate)
+    tenant_cache.add_faq_listener(vector_index.drop)
+    await tenant_cache.start()
+    await WhatsAppClient.startup()
+    outbound_scheduler.start()
+    webhook_pipeline.start()
+
+@app.on_event("shutdown")
+async def stop_webhook_pipeline():
+    await webhook_pipeline.stop()
+    await outbound_scheduler.stop()
+    await WhatsAppClient.shutdown()
+    close_embedding_provider()
+    await tenant_cache.stop()
+    await dispose_async_engine()
 
 # Root endpoint
 @app.get("/")
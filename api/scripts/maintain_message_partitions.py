@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""Create upcoming messages partitions and archive the expired ones.
+
+The same job runs daily from Celery beat; this script is for running it by hand,
+e.g. right after a deployment or to preview what retention would remove:
+
+    python scripts/maintain_message_partitions.py --dry-run
+    python scripts/maintain_message_partitions.py --retention-months 6 --archive-dir /data/archive
+"""
+import argparse
+import json
+import os
+import sys
+
+# Add parent directory to sys.path to make 'app' importable
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+from app.core.database import SessionLocal
+from app.services.message_partitions import apply_retention, ensure_partitions
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the monthly partitions of the messages table")
+    parser.add_argument("--months-ahead", type=int, help="Partitions to create ahead (default: MESSAGES_PARTITION_MONTHS_AHEAD)")
+    parser.add_argument("--retention-months", type=int, help="Full months to keep (default: MESSAGES_RETENTION_MONTHS)")
+    parser.add_argument("--archive-dir", help="Where archives are written (default: MESSAGES_ARCHIVE_DIR)")
+    parser.add_argument("--skip-retention", action="store_true", help="Only create partitions")
+    parser.add_argument("--dry-run", action="store_true", help="List expired partitions without touching them")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        result = {}
+        if not args.dry_run:
+            result["partitions_created"] = ensure_partitions(db, args.months_ahead)
+        if not args.skip_retention:
+            result.update(apply_retention(db, args.retention_months, args.archive_dir, dry_run=args.dry_run))
+    finally:
+        db.close()
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
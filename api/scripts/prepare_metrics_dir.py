@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Prepare PROMETHEUS_MULTIPROC_DIR before the workers start.
+
+prometheus_client aggregates every *.db file in the directory, so files left
+over from a previous run would be added to the new run's counters. Run this
+once per deployment, before hypercorn spawns its workers.
+"""
+import os
+import shutil
+import logging
+
+logging.basicConfig(
+    format="%(levelname)s [%(name)s] [%(module)s:%(lineno)d] %(message)s",
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+def prepare_metrics_dir():
+    """Create an empty multiprocess metrics directory (no-op when the variable is unset)"""
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")
+    if not metrics_dir:
+        logger.info("PROMETHEUS_MULTIPROC_DIR not set, metrics stay per-process")
+        return
+
+    if os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            path = os.path.join(metrics_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    os.makedirs(metrics_dir, exist_ok=True)
+    logger.info(f"Prepared multiprocess metrics directory {metrics_dir}")
+
+if __name__ == "__main__":
+    prepare_metrics_dir()
@@ -0,0 +1,76 @@
+"""Test the benchmark harness helpers."""
+
+import numpy as np
+
+from benchmarks import payloads
+from benchmarks.payloads import WebhookPayloadGenerator
+from benchmarks.retrieval import SyntheticCorpus, exact_top_k, recall_at_k
+from benchmarks.stats import LatencyRecorder, percentile
+from app.services.whatsapp import WhatsAppClient
+
+
+def test_payload_generator_is_reproducible_and_parseable():
+    phone_ids = ["1000000000000", "1000000000001"]
+    first = WebhookPayloadGenerator(phone_ids, seed=7, phone_ids_per_payload=2, duplicate_ratio=0.0)
+    second = WebhookPayloadGenerator(phone_ids, seed=7, phone_ids_per_payload=2, duplicate_ratio=0.0)
+
+    payloads = list(first.payloads(20))
+    assert [
+        [event["message_id"] for event in WhatsAppClient.iter_webhook_messages(payload)] for payload in payloads
+    ] == [
+        [event["message_id"] for event in WhatsAppClient.iter_webhook_messages(payload)] for payload in second.payloads(20)
+    ]
+
+    messages = [event for payload in payloads for event in WhatsAppClient.iter_webhook_messages(payload)]
+    assert len(messages) == first.messages_generated
+    assert {event["phone_number_id"] for event in messages} == set(phone_ids)
+    # Every unique text message is one reply the API should send
+    assert first.expected_replies == sum(1 for event in messages if event["type"] == "text")
+
+
+
+def test_redeliveries_repeat_the_original_timestamp(monkeypatch):
+    generator = WebhookPayloadGenerator(["1000000000000"], seed=3, duplicate_ratio=0.5, media_ratio=0.0)
+    clock = iter(range(1_700_000_000, 1_700_001_000))
+    monkeypatch.setattr(payloads.time, "time", lambda: next(clock))
+
+    first_seen = {}
+    redelivered = 0
+    for payload in generator.payloads(30):
+        for event in WhatsAppClient.iter_webhook_messages(payload):
+            timestamp = first_seen.setdefault(event["message_id"], event["timestamp"])
+            if event["content"] == "redelivered":
+                redelivered += 1
+            # The dedupe key (wa_msg_id, ts) is the same on every delivery
+            assert event["timestamp"] == timestamp
+    assert redelivered > 0
+
+def test_latency_percentiles():
+    assert percentile([1.0, 2.0, 3.0, 4.0], 0.5) == 2.5
+    assert percentile([1.0, 2.0, 3.0, 4.0], 1.0) == 4.0
+
+    recorder = LatencyRecorder("test")
+    recorder.start()
+    for value in range(1, 101):
+        recorder.record(value / 1000)
+    recorder.record(0.5, error="http_500")
+    recorder.stop()
+    summary = recorder.summary()
+
+    assert summary["requests"] == 101
+    assert summary["errors"] == 1
+    assert summary["p50_ms"] == 50.5
+    assert summary["p99_ms"] == 99.01
+
+
+def test_chunked_ground_truth_matches_brute_force():
+    corpus = SyntheticCorpus(size=1000, clusters=5, seed=3, dim=32)
+    queries = corpus.queries(8)
+    matrix = np.concatenate([chunk for _, chunk in corpus.chunks(chunk_size=128)])
+
+    truth = exact_top_k(corpus, queries, k=5, chunk_size=128)
+
+    expected = np.argsort(-(queries @ matrix.T), axis=1)[:, :5]
+    assert (truth == expected).all()
+    assert recall_at_k([row.tolist() for row in expected], truth, k=5) == 1.0
+    assert recall_at_k([row[:4].tolist() + [-1] for row in expected], truth, k=5) == 0.8
@@ -0,0 +1,126 @@
+"""Test monitoring module."""
+
+import os
+import subprocess
+import sys
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.services.monitoring import StageTimer, registry, setup_metrics
+
+
+def _requests_total(method, endpoint, status_code):
+    value = registry.get_sample_value(
+        "http_requests_total",
+        {"method": method, "endpoint": endpoint, "status_code": str(status_code)},
+    )
+    return value or 0.0
+
+
+def _make_app():
+    app = FastAPI()
+    setup_metrics(app)
+
+    @app.get("/tenants/{tenant_id}/faq/")
+    async def list_faqs(tenant_id: str):
+        return {"tenant_id": tenant_id}
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    return app
+
+
+def test_metrics_use_route_template_not_raw_path():
+    client = TestClient(_make_app())
+    before = _requests_total("GET", "/tenants/{tenant_id}/faq/", 200)
+
+    for tenant_id in ("a", "b", "c"):
+        assert client.get(f"/tenants/{tenant_id}/faq/").status_code == 200
+
+    assert _requests_total("GET", "/tenants/{tenant_id}/faq/", 200) == before + 3
+    assert _requests_total("GET", "/tenants/a/faq/", 200) == 0
+
+
+def test_unmatched_paths_and_odd_methods_share_one_series():
+    client = TestClient(_make_app())
+    before = _requests_total("GET", "<unmatched>", 404)
+
+    client.get("/no/such/path/1")
+    client.get("/no/such/path/2")
+    client.request("PURGE", "/tenants/a/faq/")
+
+    assert _requests_total("GET", "<unmatched>", 404) == before + 2
+    assert _requests_total("other", "/tenants/{tenant_id}/faq/", 405) >= 1
+
+
+def test_unhandled_errors_are_counted_as_500():
+    client = TestClient(_make_app(), raise_server_exceptions=False)
+    before = _requests_total("GET", "/boom", 500)
+
+    assert client.get("/boom").status_code == 500
+    assert _requests_total("GET", "/boom", 500) == before + 1
+    duration_count = registry.get_sample_value(
+        "http_request_duration_seconds_count", {"method": "GET", "endpoint": "/boom"}
+    )
+    assert duration_count >= 1
+
+
+def test_metrics_endpoint_exports_registry():
+    client = TestClient(_make_app())
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert "http_requests_total" in response.text
+
+
+def test_multiprocess_mode_aggregates_workers(tmp_path):
+    # prometheus_client picks its value backend at import time, so each "worker" is a subprocess
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def run(code):
+        return subprocess.run(
+            [sys.executable, "-c", code], cwd=api_dir, env=env, check=True, capture_output=True, text=True
+        ).stdout
+
+    worker = (
+        "from app.services.monitoring import webhook_messages_total, webhook_queue_depth, mark_process_dead\n"
+        "webhook_messages_total.labels(status='processed').inc(2)\n"
+        "webhook_queue_depth.set(5)\n"
+    )
+    run(worker)
+    run(worker + "mark_process_dead()\n")
+
+    scrape = run(
+        "import sys\n"
+        "from app.services.monitoring import collect_metrics\n"
+        "sys.stdout.write(collect_metrics().decode())\n"
+    )
+    assert 'webhook_messages_total{status="processed"} 4.0' in scrape
+    # Only the worker that did not exit cleanly still counts towards the live gauge
+    assert "webhook_queue_depth 5.0" in scrape
+
+
+def test_stage_timer_records_stages_by_tier():
+    timer = StageTimer()
+    with timer.stage("embedding"):
+        pass
+    with timer.stage("retrieval"):
+        pass
+    with timer.stage("retrieval"):
+        pass
+    before = registry.get_sample_value(
+        "rag_stage_duration_seconds_count", {"stage": "retrieval", "tenant_tier": "premium"}
+    ) or 0.0
+
+    timer.observe("premium")
+
+    assert list(timer.stages) == ["embedding", "retrieval"]
+    assert registry.get_sample_value(
+        "rag_stage_duration_seconds_count", {"stage": "retrieval", "tenant_tier": "premium"}
+    ) == before + 1
+    assert timer.server_timing().startswith("embedding;dur=")
+    assert ", retrieval;dur=" in timer.server_timing()
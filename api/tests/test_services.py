@@ -1,18 +1,64 @@
 """Test services module."""
 
 # Removed unused import: os
+import asyncio
+import importlib.util
+import os
+import time
+import uuid
+from datetime import date, datetime
 from unittest.mock import AsyncMock, MagicMock, patch
 
+import numpy as np
 import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.dialects import postgresql
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Removed unused import: sqlalchemy.orm.Session
+from app.api.endpoints import admin
+from app.core import database
+from app.core.database import _async_database_url, get_db
+from app.core import tasks
+from app.core.tasks import import_faqs
 from app.models.faq import FAQ
-from app.services.ai import find_relevant_faqs, generate_embedding, get_rag_response
+from app.models.message import Message
+from app.models.tenant import Tenant
+from app.services import ai
+from app.services.ai import (
+    find_relevant_faqs,
+    generate_embedding,
+    generate_embeddings,
+    build_rag_messages,
+    get_rag_response,
+    stream_answer,
+)
+from app.services.conversation import ConversationMemory, ConversationTurn
+from app.services.embedding_cache import LRUEmbeddingCache, embedding_cache, make_cache_key
+from app.services import embedding_providers
+from app.services.embedding_providers import SentenceTransformerProvider, pad_embedding
+from app.services.idempotency import RecentMessageIds
+from app.services.message_partitions import add_months, partition_month, retention_cutoff
+from app.services.monitoring import registry
+from app.services.pagination import InvalidCursor, apply_keyset, decode_cursor, encode_cursor
+from app.services.rag_context import pack_faq_context
+from app.services.response_cache import SemanticResponseCache
+from app.services import tenant_cache as tenant_cache_module
+from app.services.tenant_cache import FAQ_INVALIDATION_CHANNEL, INVALIDATION_CHANNEL, TenantCache, TenantSnapshot
+from app.services.vector_index import TenantVectorIndex
 
 # Mock data
 MOCK_EMBEDDING = [0.1] * 1536  # 1536-dimensional vector with all values as 0.1
 
 
+@pytest.fixture(autouse=True)
+def clear_embedding_cache():
+    embedding_cache.clear()
+    yield
+    embedding_cache.clear()
+
+
 @pytest.fixture
 def mock_openai_client():
     with patch("app.services.ai.client") as mock_client:
@@ -26,6 +72,12 @@ def mock_openai_client():
         mock_client.embeddings = MagicMock()
         mock_client.embeddings.create = embeddings_create_mock
 
+        # Chat completions answer with a fixed message and usage
+        completion = MagicMock()
+        completion.choices = [MagicMock(message=MagicMock(content="The meaning of life is 42."))]
+        completion.usage = MagicMock(prompt_tokens=120, completion_tokens=8)
+        mock_client.chat.completions.create = AsyncMock(return_value=completion)
+
         yield mock_client
 
 
@@ -40,7 +92,51 @@ async def test_generate_embedding(mock_openai_client, monkeypatch):
     # Assertions
     assert embedding == MOCK_EMBEDDING
     mock_openai_client.embeddings.create.assert_called_once_with(
-        model="text-embedding-ada-002", input="Test query"
+        model="text-embedding-ada-002", input=["Test query"]
+    )
+
+
+def _batch_response(**kwargs):
+    """Build an embeddings response with one vector per input."""
+    response = MagicMock()
+    response.data = [
+        MagicMock(index=i, embedding=[float(i)] * 1536)
+        for i in range(len(kwargs["input"]))
+    ]
+    return response
+
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_batch(mock_openai_client, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test_api_key")
+    mock_openai_client.embeddings.create.side_effect = _batch_response
+
+    embeddings = await generate_embeddings(["first", "", "second"])
+
+    # Invalid inputs are skipped, valid ones go out in a single request
+    assert embeddings == [[0.0] * 1536, None, [1.0] * 1536]
+    mock_openai_client.embeddings.create.assert_called_once_with(
+        model="text-embedding-ada-002", input=["first", "second"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_generate_embedding_coalesces_concurrent_calls(
+    mock_openai_client, monkeypatch
+):
+    monkeypatch.setenv("OPENAI_API_KEY", "test_api_key")
+    mock_openai_client.embeddings.create.side_effect = _batch_response
+
+    results = await asyncio.gather(
+        generate_embedding("alpha"),
+        generate_embedding("beta"),
+        generate_embedding("alpha"),
+    )
+
+    # Duplicates share one input and all callers are served by one request
+    assert results == [[0.0] * 1536, [1.0] * 1536, [0.0] * 1536]
+    mock_openai_client.embeddings.create.assert_called_once_with(
+        model="text-embedding-ada-002", input=["alpha", "beta"]
     )
 
 
@@ -60,41 +156,209 @@ async def test_generate_embedding_error(mock_openai_client, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_find_relevant_faqs(mock_openai_client, test_db, monkeypatch):
+async def test_generate_embedding_uses_cache(mock_openai_client, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test_api_key")
+
+    first = await generate_embedding("Opening hours?")
+    # Whitespace differences normalize to the same cache entry
+    second = await generate_embedding("  Opening   hours? ")
+
+    # Cached vectors are stored as float32
+    assert second == pytest.approx(first, rel=1e-6)
+    mock_openai_client.embeddings.create.assert_called_once()
+
+
+
+@pytest.mark.asyncio
+async def test_local_provider_dimension_without_inference(monkeypatch):
+    class FakeModel:
+        def get_sentence_embedding_dimension(self):
+            return 384
+
+        def encode(self, texts, batch_size, **kwargs):
+            raise AssertionError("cached texts must not be encoded")
+
+    monkeypatch.setattr(embedding_providers, "_load_sentence_transformer", lambda *args: FakeModel())
+    provider = SentenceTransformerProvider("local-test-model")
+    monkeypatch.setattr(ai, "embedding_provider", provider)
+    monkeypatch.setattr(embedding_cache, "get_many", AsyncMock(return_value=[MOCK_EMBEDDING]))
+
+    # Every text is cached, as for a Celery worker that never warmed up
+    assert await generate_embeddings(["cached"]) == [MOCK_EMBEDDING]
+    assert ai.embedding_columns() == {"embedding_model": "local-test-model", "embedding_dim": 384}
+    provider.close()
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_with_local_provider(monkeypatch):
+    class FakeModel:
+        def __init__(self):
+            self.calls = []
+
+        def encode(self, texts, batch_size, **kwargs):
+            self.calls.append(list(texts))
+            return np.array([[float(len(text)), 1.0, 0.0] for text in texts])
+
+    provider = SentenceTransformerProvider("local-test-model", batch_size=2)
+    provider._model = FakeModel()
+    monkeypatch.setattr(ai, "embedding_provider", provider)
+
+    embeddings = await generate_embeddings(["a", "bbb", "cc"])
+
+    # Sent in provider-sized batches and zero-padded to the column width
+    assert provider._model.calls == [["a", "bbb"], ["cc"]]
+    assert provider.dimension == 3
+    assert all(len(embedding) == 1536 for embedding in embeddings)
+    assert embeddings[1][:3] == [3.0, 1.0, 0.0]
+    assert ai.embedding_columns() == {"embedding_model": "local-test-model", "embedding_dim": 3}
+
+    # Padding leaves cosine similarity unchanged
+    a, b = np.array([1.0, 2.0, 3.0]), np.array([3.0, -1.0, 2.0])
+    padded_a, padded_b = np.array(pad_embedding(a, 8)), np.array(pad_embedding(b, 8))
+    assert padded_a @ padded_b / (np.linalg.norm(padded_a) * np.linalg.norm(padded_b)) == pytest.approx(
+        a @ b / (np.linalg.norm(a) * np.linalg.norm(b))
+    )
+    provider.close()
+
+
+def test_lru_embedding_cache_eviction_and_ttl(monkeypatch):
+    cache = LRUEmbeddingCache(max_entries=2, ttl_seconds=60)
+    key_a = make_cache_key("model", "a")
+    key_b = make_cache_key("model", "b")
+    key_c = make_cache_key("model", "c")
+
+    cache.set(key_a, [1.0])
+    cache.set(key_b, [2.0])
+    assert cache.get(key_a) == [1.0]  # refreshes a, so b is the LRU entry
+    cache.set(key_c, [3.0])
+
+    assert cache.get(key_b) is None
+    assert cache.get(key_a) == [1.0]
+    assert len(cache) == 2
+
+    # Entries expire once their TTL has passed
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert cache.get(key_c) is None
+
+
+def test_tenant_vector_index_search_and_updates():
+    index = TenantVectorIndex.from_rows(3, [(1, [1.0, 0.0, 0.0]), (2, [0.0, 1.0, 0.0])])
+    index.upsert(3, [0.0, 0.0, 5.0])  # grows past the initial capacity
+
+    assert [faq_id for faq_id, _ in index.search([0.1, 0.0, 1.0], top_k=2)] == [3, 1]
+
+    # Updating moves the vector, removing compacts the matrix
+    index.upsert(1, [0.0, 0.0, 1.0])
+    index.remove(3)
+    ranked = index.search([0.0, 0.0, 1.0], top_k=5)
+
+    assert len(index) == 2
+    assert [faq_id for faq_id, _ in ranked] == [1, 2]
+    assert ranked[0][1] == pytest.approx(1.0)
+
+
+def test_semantic_response_cache(monkeypatch):
+    cache = SemanticResponseCache(
+        threshold=0.95, max_entries=2, ttl_seconds=60, max_tenants=10
+    )
+    cache.store("tenant", "prompt", [1.0, 0.0], "We open at 9.")
+
+    # Near-duplicate queries hit, unrelated ones and other tenants miss
+    assert cache.lookup("tenant", "prompt", [0.99, 0.05]) == "We open at 9."
+    assert cache.lookup("tenant", "prompt", [0.0, 1.0]) is None
+    assert cache.lookup("other", "prompt", [1.0, 0.0]) is None
+
+    # A new system prompt discards the tenant's answers
+    assert cache.lookup("tenant", "new prompt", [1.0, 0.0]) is None
+    assert cache.lookup("tenant", "prompt", [1.0, 0.0]) is None
+
+    cache.store("tenant", "prompt", [1.0, 0.0], "We open at 9.")
+    cache.invalidate("tenant")
+    assert cache.lookup("tenant", "prompt", [1.0, 0.0]) is None
+
+    cache.store("tenant", "prompt", [1.0, 0.0], "We open at 9.")
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert cache.lookup("tenant", "prompt", [1.0, 0.0]) is None
+
+
+@pytest.mark.asyncio
+async def test_find_relevant_faqs(mock_openai_client, monkeypatch):
     # Set environment variable
     monkeypatch.setenv("OPENAI_API_KEY", "test_api_key")
 
-    # Create test FAQs
-    faq1 = FAQ(
+    faq = FAQ(
+        id=1,
         tenant_id="test_tenant",
         question="What is the meaning of life?",
         answer="42",
         embedding=MOCK_EMBEDDING,
     )
-    faq2 = FAQ(
-        tenant_id="test_tenant",
-        question="How does this work?",
-        answer="It just works",
-        embedding=MOCK_EMBEDDING,
-    )
-    test_db.add(faq1)
-    test_db.add(faq2)
-    test_db.commit()
 
-    # Mock the cosine_distance function to return predictable results
-    with patch("app.models.faq.FAQ.embedding") as mock_embedding:
-        # Setup the cosine_distance method
-        mock_embedding.cosine_distance = MagicMock()
+    # pgvector ranking needs Postgres; check the statement and the async call instead
+    db = MagicMock(spec=AsyncSession)
+    db.get_bind.return_value.dialect.name = "postgresql"
+    result = MagicMock()
+    result.all.return_value = [faq]
+    db.scalars = AsyncMock(return_value=result)
+    db.execute = AsyncMock()
 
-        # Call the function
-        faqs = await find_relevant_faqs(
-            test_db, "test_tenant", "meaning of life", top_k=1
-        )
+    faqs = await find_relevant_faqs(db, "test_tenant", "meaning of life", top_k=1)
+
+    assert faqs == [faq]
+    # Per-transaction ANN settings, then one ranked query
+    db.execute.assert_awaited_once()
+    statement = db.scalars.await_args.args[0]
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert "faqs.tenant_id = " in sql
+    assert "ORDER BY faqs.embedding <=> " in sql
+    assert "LIMIT " in sql
 
-        # Assertions
-        assert len(faqs) > 0
-        # We can't assert exact matches due to the mocking complexity,
-        # but we can verify the function ran without errors
+
+
+@pytest.mark.asyncio
+async def test_ann_search_params_skip_iterative_scan_when_off(monkeypatch):
+    db = MagicMock(spec=AsyncSession)
+    db.get_bind.return_value.dialect.name = "postgresql"
+    db.execute = AsyncMock()
+
+    await ai._apply_ann_search_params(db, top_k=50, ef_search=None, probes=None)
+    statement, params = db.execute.await_args.args
+    assert "hnsw.iterative_scan" in str(statement)
+    assert params["ef_search"] == "50"
+
+    # pgvector < 0.8 rejects the iterative_scan settings
+    monkeypatch.setattr(ai.settings, "PGVECTOR_ITERATIVE_SCAN", "off")
+    await ai._apply_ann_search_params(db, top_k=5, ef_search=None, probes=None)
+    statement, params = db.execute.await_args.args
+    assert "iterative_scan" not in str(statement)
+    assert set(params) == {"ef_search", "probes"}
+
+def test_async_database_url_uses_asyncpg():
+    url = _async_database_url("postgresql://user:secret@db:5432/app?sslmode=require")
+    assert url.drivername == "postgresql+asyncpg"
+    assert dict(url.query) == {"ssl": "require"}
+
+    # Other backends are left alone
+    assert _async_database_url("sqlite:///:memory:").drivername == "sqlite"
+
+
+@pytest.mark.asyncio
+async def test_get_db_yields_async_session_on_asyncpg(monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_URL", "postgresql://user:secret@db:5432/app")
+    monkeypatch.setattr(database, "_async_engine", None)
+    monkeypatch.setattr(database, "_async_session_factory", None)
+
+    try:
+        sessions = get_db()
+        db = await sessions.__anext__()
+        assert isinstance(db, AsyncSession)
+        assert db.get_bind().dialect.driver == "asyncpg"
+        # Objects stay readable after commit without a lazy load
+        assert db.sync_session.expire_on_commit is False
+        await sessions.aclose()
+    finally:
+        await database.dispose_async_engine()
 
 
 @pytest.mark.asyncio
@@ -125,3 +389,396 @@ async def test_get_rag_response(mock_openai_client, test_db, monkeypatch):
         assert response is not None
         assert "meaning of life" in response
         mock_find_faqs.assert_called_once()
+        messages = mock_openai_client.chat.completions.create.call_args.kwargs["messages"]
+        assert "Answer: 42" in messages[0]["content"]
+        assert messages[1] == {"role": "user", "content": "meaning of life"}
+
+
+def test_build_rag_messages_trims_context_to_budget():
+    faqs = [FAQ(question=f"Question {i}?", answer="word " * 200) for i in range(1, 6)]
+
+    messages, included = build_rag_messages("Be brief.", "a question", faqs, max_prompt_tokens=10000)
+    assert included == 5
+
+    messages, included = build_rag_messages("Be brief.", "a question", faqs, max_prompt_tokens=500)
+    assert 0 < included < 5
+    assert "Question 1?" in messages[0]["content"]
+    assert f"Question {included + 1}?" not in messages[0]["content"]
+
+    messages, included = build_rag_messages("Be brief.", "a question", faqs, max_prompt_tokens=10)
+    assert included == 0
+    assert "No specific information found" in messages[0]["content"]
+
+
+def test_build_rag_messages_keeps_recent_history():
+    history = [
+        {"role": "user" if i % 2 else "assistant", "content": f"turn {i} " + "word " * 50} for i in range(1, 7)
+    ]
+
+    messages, _ = build_rag_messages("Be brief.", "and the price?", [], history=history)
+    assert [message["content"] for message in messages[1:-1]] == [message["content"] for message in history]
+    assert messages[-1] == {"role": "user", "content": "and the price?"}
+
+    # Too little room: the oldest turns go first
+    messages, _ = build_rag_messages("Be brief.", "and the price?", [], max_prompt_tokens=200, history=history)
+    assert 0 < len(messages) - 2 < len(history)
+    assert messages[-2]["content"] == history[-1]["content"]
+
+
+@pytest.mark.asyncio
+async def test_conversation_memory_loads_once_then_appends():
+    memory = ConversationMemory(turns=2, max_users=10, ttl_seconds=60)
+    rows = MagicMock()
+    rows.all.return_value = [
+        MagicMock(role="user", text="current", ts=None, wa_msg_id="wamid.3"),
+        MagicMock(role="assistant", text="answer 1", ts=None, wa_msg_id="wamid.2"),
+        MagicMock(role="user", text="question 1", ts=None, wa_msg_id="wamid.1"),
+    ]
+    db = MagicMock()
+    db.execute = AsyncMock(return_value=rows)
+
+    # Turns outside the ring are not cached, they are read with the rest on the first lookup
+    memory.record("tenant", "15550001", ConversationTurn("user", "ignored", None, "wamid.0"))
+    turns = await memory.history(db, "tenant", "15550001", exclude_msg_id="wamid.3")
+    assert [turn.text for turn in turns] == ["question 1", "answer 1"]
+
+    memory.record("tenant", "15550001", ConversationTurn("assistant", "answer 2", None, "wamid.4"))
+    memory.record("tenant", "15550001", ConversationTurn("user", "question 3", None, "wamid.5"))
+    turns = await memory.history(db, "tenant", "15550001", exclude_msg_id="wamid.5")
+    assert [turn.text for turn in turns] == ["current", "answer 2"]
+    assert db.execute.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_confident_lexical_match_skips_embedding(monkeypatch):
+    monkeypatch.setattr(ai.settings, "HYBRID_SEARCH_ENABLED", True)
+    faq = FAQ(id=1, tenant_id="test_tenant", question="Model XR-200 price?", answer="199 EUR")
+    db = MagicMock()
+    db.get_bind.return_value.dialect.name = "postgresql"
+    result = MagicMock()
+    db.execute = AsyncMock(return_value=result)
+
+    result.all.return_value = [MagicMock(FAQ=faq, lexical_score=0.9)]
+    assert await ai.find_confident_lexical_match(db, "test_tenant", "XR-200", top_k=5) == [faq]
+
+    # A weak best match falls back to the embedding path
+    result.all.return_value = [MagicMock(FAQ=faq, lexical_score=0.1)]
+    assert await ai.find_confident_lexical_match(db, "test_tenant", "XR-200", top_k=5) is None
+
+    # Long natural-language questions are not probed at all
+    db.execute.reset_mock()
+    assert await ai.find_confident_lexical_match(
+        db, "test_tenant", "how much does the newest model cost in my country", top_k=5
+    ) is None
+    db.execute.assert_not_awaited()
+
+
+def test_pack_faq_context_is_greedy_and_deduplicates():
+    def faq(question, answer, embedding, token_count):
+        return FAQ(question=question, answer=answer, embedding=embedding, token_count=token_count)
+
+    best = faq("Opening hours?", "9 to 5.", [1.0, 0.0, 0.0], 40)
+    near_duplicate = faq("When are you open?", "From 9 to 5.", [0.99, 0.01, 0.0], 40)
+    too_long = faq("Refund policy?", "A very long answer.", [0.0, 1.0, 0.0], 500)
+    same_text = faq("opening  hours?", "9 TO 5.", None, 40)
+    short = faq("Parking?", "Free.", [0.0, 0.0, 1.0], 20)
+
+    packed = pack_faq_context([best, near_duplicate, too_long, same_text, short], max_tokens=100)
+
+    # Oversized candidates are skipped rather than ending the scan
+    assert packed == [best, short]
+
+
+@pytest.mark.asyncio
+async def test_stream_answer_records_usage(mock_openai_client, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test_api_key")
+
+    def chunk(content=None, usage=None):
+        choices = [MagicMock(delta=MagicMock(content=content))] if content is not None else []
+        return MagicMock(choices=choices, usage=usage)
+
+    class FakeStream:
+        def __init__(self, chunks):
+            self.chunks = chunks
+            self.closed = False
+
+        def __aiter__(self):
+            return self._iterate()
+
+        async def _iterate(self):
+            for item in self.chunks:
+                yield item
+
+        async def close(self):
+            self.closed = True
+
+    stream = FakeStream([chunk("The answer "), chunk("is 42."), chunk(usage=MagicMock(prompt_tokens=50, completion_tokens=5))])
+    mock_openai_client.chat.completions.create = AsyncMock(return_value=stream)
+
+    def completion_tokens():
+        return registry.get_sample_value(
+            "openai_api_tokens_total", {"model": ai.settings.RAG_CHAT_MODEL, "type": "completion"}
+        ) or 0
+
+    before = completion_tokens()
+    prompt = ai.RAGPrompt("test_tenant", "prompt", None, messages=[{"role": "user", "content": "q"}])
+    deltas = [delta async for delta in stream_answer(prompt)]
+
+    assert deltas == ["The answer ", "is 42."]
+    assert completion_tokens() - before == 5
+    assert stream.closed
+    assert mock_openai_client.chat.completions.create.call_args.kwargs["stream"] is True
+
+
+def test_recent_message_ids_bounded_with_ttl(monkeypatch):
+    seen = RecentMessageIds(max_entries=2, ttl_seconds=60)
+    seen.add("wamid.1")
+    seen.add("wamid.2")
+    seen.add("wamid.3")
+
+    # The oldest id is evicted once the set is full
+    assert "wamid.1" not in seen
+    assert "wamid.2" in seen and "wamid.3" in seen
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert "wamid.3" not in seen
+
+
+def test_import_faqs_in_chunks(test_db, monkeypatch):
+    calls = []
+
+    async def fake_generate_embeddings(texts):
+        calls.append(len(texts))
+        return [None if "broken" in text else MOCK_EMBEDDING for text in texts]
+
+    monkeypatch.setattr(ai, "generate_embeddings", fake_generate_embeddings)
+    # No provider client is needed to describe the vectors
+    monkeypatch.setattr(ai, "embedding_columns", lambda: {"embedding_model": "test-model", "embedding_dim": 1536})
+    items = [{"question": f"Question {n}?", "answer": f"Answer {n}."} for n in range(5)]
+    items[1] = {"question": "", "answer": "No question"}
+    items[3] = {"question": "broken?", "answer": "Embedding fails."}
+    progress_updates = []
+
+    result = import_faqs(
+        test_db, "tenant", items, chunk_size=2,
+        on_progress=lambda progress: progress_updates.append(progress["processed_items"]),
+    )
+
+    # One embedding call per chunk, progress reported after each chunk
+    assert calls == [1, 2, 1]
+    assert progress_updates == [2, 4, 5]
+    assert result["successful_items"] == 3
+    assert result["failed_items"] == 2
+    assert [error["index"] for error in result["errors"]] == [1, 3]
+    assert test_db.query(FAQ).filter(FAQ.tenant_id == "tenant").count() == 3
+    assert all(faq.token_count for faq in test_db.query(FAQ).filter(FAQ.tenant_id == "tenant"))
+    assert {faq.embedding_model for faq in test_db.query(FAQ).filter(FAQ.tenant_id == "tenant")} == {"test-model"}
+
+
+
+def test_bulk_import_task_publishes_faq_invalidation(monkeypatch):
+    published = []
+    monkeypatch.setattr(database, "SessionLocal", MagicMock())
+    monkeypatch.setattr("app.services.tenant_cache.publish_faq_invalidation", published.append)
+    result = {"successful_items": 2, "failed_items": 0}
+    monkeypatch.setattr(tasks, "import_faqs", lambda *args, **kwargs: result)
+
+    assert tasks.process_bulk_faq_import("tenant", []) == result
+    assert published == ["tenant"]
+
+    # Nothing was written, so the caches are left alone
+    result = {"successful_items": 0, "failed_items": 2}
+    tasks.process_bulk_faq_import("tenant", [])
+    assert published == ["tenant"]
+
+
+def test_bulk_import_failure_is_only_reported_to_its_tenant(monkeypatch):
+    task = MagicMock(state="FAILURE", info=RuntimeError("database is down"), result=RuntimeError("database is down"))
+    task.kwargs = {"tenant_id": "owner", "import_items": []}
+    monkeypatch.setattr(admin.celery_app, "AsyncResult", lambda task_id: task)
+
+    status = admin.get_bulk_import_status("owner", "task-1")
+    assert status["errors"] == [{"error": "database is down"}]
+
+    with pytest.raises(HTTPException) as error:
+        admin.get_bulk_import_status("someone-else", "task-1")
+    assert error.value.status_code == 404
+
+    # Without the task's kwargs in the backend the owner cannot be confirmed
+    task.kwargs = None
+    with pytest.raises(HTTPException):
+        admin.get_bulk_import_status("owner", "task-1")
+
+@pytest.mark.asyncio
+async def test_tenant_cache_by_id_and_phone_id(monkeypatch):
+    tenant = Tenant(id="t1", phone_id="phone-1", wh_token="token", system_prompt="prompt")
+    db = MagicMock()
+    db.get = AsyncMock(return_value=tenant)
+    db.scalars = AsyncMock(return_value=[tenant])
+    cache = TenantCache(ttl_seconds=60, max_entries=10)
+
+    assert (await cache.get_by_id(db, "t1")).system_prompt == "prompt"
+    # Loaded by id, so the phone_id index is warm as well
+    assert (await cache.get_by_phone_ids(db, ["phone-1"]))["phone-1"].id == "t1"
+    assert (await cache.get_by_id(db, "t1")).phone_id == "phone-1"
+    db.get.assert_awaited_once()
+    db.scalars.assert_not_awaited()
+
+    await cache.invalidate("t1")
+    assert (await cache.get_by_phone_ids(db, ["phone-1", None]))["phone-1"].id == "t1"
+    db.scalars.assert_awaited_once()
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    await cache.get_by_id(db, "t1")
+    assert db.get.await_count == 2
+
+
+
+@pytest.mark.asyncio
+async def test_tenant_cache_dispatches_faq_invalidations():
+    tenant = Tenant(id="t1", phone_id="phone-1", wh_token="token", system_prompt="prompt")
+    db = MagicMock()
+    db.get = AsyncMock(return_value=tenant)
+    cache = TenantCache(ttl_seconds=60, max_entries=10)
+    await cache.get_by_id(db, "t1")
+    changed = []
+    cache.add_faq_listener(changed.append)
+    cache.add_faq_listener(changed.append)
+
+    class FakePubSub:
+        async def listen(self):
+            yield {"type": "subscribe", "channel": FAQ_INVALIDATION_CHANNEL, "data": 1}
+            yield {"type": "message", "channel": FAQ_INVALIDATION_CHANNEL, "data": "t1"}
+            yield {"type": "message", "channel": INVALIDATION_CHANNEL, "data": "t1"}
+
+        async def close(self):
+            pass
+
+    await cache._listen(FakePubSub())
+    # FAQ changes go to the listeners (registered once), tenant changes to the tenant entries
+    assert changed == ["t1"]
+    await cache.get_by_id(db, "t1")
+    assert db.get.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_tenant_cache_resubscribes_after_connection_loss(monkeypatch):
+    monkeypatch.setattr(tenant_cache_module, "RESUBSCRIBE_DELAY_SECONDS", 0)
+    cache = TenantCache(ttl_seconds=60, max_entries=10)
+    cache.put(TenantSnapshot("t1", "phone-1", "token", "prompt"))
+    changed = []
+    cache.add_faq_listener(changed.append)
+    delivered = asyncio.Event()
+
+    class FakePubSub:
+        def __init__(self, connected):
+            self.connected = connected
+
+        async def subscribe(self, *channels):
+            pass
+
+        async def listen(self):
+            if not self.connected:
+                raise ConnectionError("Connection closed by server.")
+            yield {"type": "message", "channel": FAQ_INVALIDATION_CHANNEL, "data": "t1"}
+            delivered.set()
+            await asyncio.Event().wait()
+
+        async def close(self):
+            pass
+
+    connections = iter([False, True])
+    cache._redis = MagicMock()
+    cache._redis.pubsub.side_effect = lambda **kwargs: FakePubSub(next(connections))
+    listener = asyncio.ensure_future(cache._subscribe())
+    try:
+        await asyncio.wait_for(delivered.wait(), timeout=1)
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+    assert changed == ["t1"]
+    assert cache._redis.pubsub.call_count == 2
+    # Entries may have missed invalidations while the subscription was down
+    assert cache._get("t1") is None
+
+def test_message_partition_months_and_retention_cutoff():
+    assert add_months(date(2026, 11, 15), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 31), -1) == date(2025, 12, 1)
+    assert partition_month("messages_y2025m09") == date(2025, 9, 1)
+    assert partition_month("messages_default") is None
+
+    # October 2026 with 12 months of retention keeps October 2025 onwards
+    cutoff = retention_cutoff(date(2026, 10, 18), 12)
+    assert cutoff == date(2025, 10, 1)
+    assert add_months(partition_month("messages_y2025m09"), 1) <= cutoff
+    assert not add_months(partition_month("messages_y2025m10"), 1) <= cutoff
+
+
+
+def _load_migration(name):
+    path = os.path.join(os.path.dirname(__file__), "..", "alembic", "versions", f"{name}.py")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="needs a Postgres database in TEST_POSTGRES_URL")
+def test_create_messages_partitions_moves_rows_out_of_default():
+    migration = _load_migration("011_partition_default_rows")
+    schema = f"partition_test_{uuid.uuid4().hex[:8]}"
+    engine = create_engine(os.environ["TEST_POSTGRES_URL"])
+    next_month = add_months(date.today(), 1)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"SET LOCAL search_path TO {schema}"))
+            conn.execute(text("""
+                CREATE TABLE messages (
+                    id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+                    wa_msg_id VARCHAR,
+                    ts TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+                    PRIMARY KEY (id, ts),
+                    CONSTRAINT uq_messages_wa_msg_id_ts UNIQUE (wa_msg_id, ts)
+                ) PARTITION BY RANGE (ts)
+            """))
+            conn.execute(text("CREATE TABLE messages_default PARTITION OF messages DEFAULT"))
+            conn.execute(text(migration.CREATE_PARTITIONS_FUNCTION))
+            # Next month's row arrived before its partition existed; the old one has no month to go to
+            conn.execute(
+                text("INSERT INTO messages (wa_msg_id, ts) VALUES ('wamid.next', :next), ('wamid.old', '1970-01-01')"),
+                {"next": datetime(next_month.year, next_month.month, 2)},
+            )
+
+            assert conn.execute(text("SELECT create_messages_partitions(CAST(now() AS date), 1)")).scalar() == 2
+            partition = f"messages_y{next_month:%Y}m{next_month:%m}"
+            assert conn.execute(text(f"SELECT wa_msg_id FROM {partition}")).scalars().all() == ["wamid.next"]
+            assert conn.execute(text("SELECT wa_msg_id FROM messages_default")).scalars().all() == ["wamid.old"]
+            # The moved partition carries the parent's unique constraint
+            assert conn.execute(text(
+                "SELECT count(*) FROM pg_indexes WHERE schemaname = :schema AND tablename = :partition"
+            ), {"schema": schema, "partition": partition}).scalar() == 2
+            assert conn.execute(text("SELECT create_messages_partitions(CAST(now() AS date), 1)")).scalar() == 0
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        engine.dispose()
+
+def test_cursor_round_trip_and_keyset_condition():
+    cursor = encode_cursor([datetime(2026, 10, 18, 12, 30), 42])
+    assert decode_cursor(cursor, [Message.ts, Message.id]) == (datetime(2026, 10, 18, 12, 30), 42)
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, [Message.id])
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not a cursor!", [Message.id])
+
+    statement = apply_keyset(select(Message), [Message.ts, Message.id], cursor, page_size=50, descending=True)
+    sql = str(statement.compile(compile_kwargs={"literal_binds": True}))
+    assert "(messages.ts, messages.id) < (" in sql
+    assert "ORDER BY messages.ts DESC, messages.id DESC" in sql
+    assert "LIMIT 51" in sql
@@ -0,0 +1,358 @@
+"""Test WhatsApp client module."""
+
+import asyncio
+import json
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+from app.api.endpoints import webhook
+from app.services import webhook_pipeline as pipeline_module
+from app.services.idempotency import recent_message_ids
+from app.services.outbound import OutboundScheduler, TokenBucket
+from app.services.tenant_cache import TenantSnapshot
+from app.services.webhook_pipeline import MISSING_TIMESTAMP, WebhookPipeline, _message_timestamp
+from app.services.whatsapp import WhatsAppClient
+
+
+def _text_message(message_id, sender, body):
+    return {
+        "id": message_id,
+        "from": sender,
+        "timestamp": "1700000000",
+        "type": "text",
+        "text": {"body": body},
+    }
+
+
+BATCHED_WEBHOOK = {
+    "object": "whatsapp_business_account",
+    "entry": [
+        {
+            "id": "waba-1",
+            "changes": [
+                {
+                    "field": "messages",
+                    "value": {
+                        "metadata": {"phone_number_id": "phone-1"},
+                        "messages": [
+                            _text_message("wamid.1", "111", "Hi"),
+                            _text_message("wamid.2", "222", "Opening hours?"),
+                        ],
+                        "statuses": [
+                            {"id": "wamid.out", "status": "delivered", "recipient_id": "111"}
+                        ],
+                    },
+                }
+            ],
+        },
+        {
+            "id": "waba-2",
+            "changes": [
+                {
+                    "field": "messages",
+                    "value": {
+                        "metadata": {"phone_number_id": "phone-2"},
+                        "messages": [_text_message("wamid.3", "333", "Price?")],
+                    },
+                }
+            ],
+        },
+    ],
+}
+
+
+def test_iter_webhook_messages_reads_every_entry_and_change():
+    messages = list(WhatsAppClient.iter_webhook_messages(BATCHED_WEBHOOK))
+
+    assert [m["message_id"] for m in messages] == ["wamid.1", "wamid.2", "wamid.3"]
+    assert [m["phone_number_id"] for m in messages] == ["phone-1", "phone-1", "phone-2"]
+    assert messages[1]["content"] == "Opening hours?"
+
+
+def test_iter_webhook_statuses_are_separated_from_messages():
+    statuses = list(WhatsAppClient.iter_webhook_statuses(BATCHED_WEBHOOK))
+
+    assert len(statuses) == 1
+    assert statuses[0]["kind"] == "status"
+    assert statuses[0]["status"] == "delivered"
+    assert statuses[0]["phone_number_id"] == "phone-1"
+
+
+def test_parse_webhook_message_returns_first_message():
+    message = WhatsAppClient.parse_webhook_message(BATCHED_WEBHOOK)
+
+    assert message["message_id"] == "wamid.1"
+    assert message["from"] == "111"
+
+
+def test_malformed_payloads_yield_nothing():
+    assert list(WhatsAppClient.iter_webhook_events({})) == []
+    assert list(WhatsAppClient.iter_webhook_events({"entry": "bad"})) == []
+    assert list(WhatsAppClient.iter_webhook_events({"entry": [{"changes": [None]}]})) == []
+    assert WhatsAppClient.parse_webhook_message({"entry": []}) is None
+
+
+
+def test_malformed_change_does_not_drop_the_rest_of_the_batch():
+    body = json.loads(json.dumps(BATCHED_WEBHOOK))
+    body["entry"][0]["changes"].insert(0, {"field": "messages", "value": {"metadata": "bad", "messages": []}})
+    body["entry"][0]["changes"].append({"field": "messages", "value": {"messages": {"id": "bad"}}})
+
+    messages = list(WhatsAppClient.iter_webhook_messages(body))
+
+    assert [message["message_id"] for message in messages] == ["wamid.1", "wamid.2", "wamid.3"]
+
+@pytest.mark.asyncio
+async def test_send_text_message_reuses_shared_client():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"messages": [{"id": "wamid.out"}]})
+
+    WhatsAppClient._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        client = WhatsAppClient.for_tenant("phone-1", "token-1")
+        assert WhatsAppClient.for_tenant("phone-1", "token-1") is client
+
+        await client.send_text_message("111", "Hello")
+        result = await client.send_text_message("222", "Hello again")
+
+        assert result == {"messages": [{"id": "wamid.out"}]}
+        assert len(requests) == 2
+        assert requests[0].url.path.endswith("/phone-1/messages")
+        assert requests[0].headers["Authorization"] == "Bearer token-1"
+    finally:
+        await WhatsAppClient.shutdown()
+
+    assert WhatsAppClient._http_client is None
+
+
+def _scheduler(**overrides):
+    options = dict(
+        rate_per_second=1000.0,
+        burst=1000,
+        max_concurrency=1,
+        max_attempts=3,
+        backoff_base=0.001,
+        backoff_max=0.01,
+    )
+    options.update(overrides)
+    return OutboundScheduler(**options)
+
+
+@pytest.mark.asyncio
+async def test_outbound_scheduler_round_robins_between_phone_numbers():
+    scheduler = _scheduler()
+    sent = []
+
+    def send(label):
+        async def _send(client):
+            sent.append((client.phone_number_id, label))
+            return {"messages": [{"id": label}]}
+        return _send
+
+    busy = WhatsAppClient("busy", "token")
+    quiet = WhatsAppClient("quiet", "token")
+    try:
+        results = await asyncio.gather(
+            *(scheduler.submit(busy, send(f"b{i}"), bulk=True) for i in range(3)),
+            scheduler.submit(quiet, send("q0")),
+        )
+    finally:
+        await scheduler.stop()
+
+    assert [r["messages"][0]["id"] for r in results] == ["b0", "b1", "b2", "q0"]
+    # The quiet number is served before the busy number's broadcast finishes
+    assert sent.index(("quiet", "q0")) < sent.index(("busy", "b2"))
+
+
+@pytest.mark.asyncio
+async def test_outbound_scheduler_retries_throttled_sends():
+    scheduler = _scheduler()
+    attempts = []
+
+    async def send(client):
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            return {"error": "rate limited", "status_code": 429, "retry_after": "0.05"}
+        return {"messages": [{"id": "ok"}]}
+
+    try:
+        result = await scheduler.submit(WhatsAppClient("phone", "token"), send)
+    finally:
+        await scheduler.stop()
+
+    assert result == {"messages": [{"id": "ok"}]}
+    assert len(attempts) == 2
+    # Retry-After is honored before the second attempt
+    assert attempts[1] - attempts[0] >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_outbound_scheduler_does_not_retry_client_errors():
+    scheduler = _scheduler()
+    attempts = []
+
+    async def send(client):
+        attempts.append(1)
+        return {"error": '{"error": {"code": 100}}', "status_code": 400}
+
+    try:
+        result = await scheduler.submit(WhatsAppClient("phone", "token"), send)
+    finally:
+        await scheduler.stop()
+
+    assert result["status_code"] == 400
+    assert len(attempts) == 1
+
+
+
+@pytest.mark.asyncio
+async def test_outbound_scheduler_stop_fails_messages_waiting_for_a_slot():
+    scheduler = _scheduler(max_concurrency=1)
+    release = asyncio.Event()
+
+    async def slow_send(client):
+        await release.wait()
+        return {"messages": [{"id": "first"}]}
+
+    async def send(client):
+        return {"messages": [{"id": "second"}]}
+
+    client = WhatsAppClient("phone", "token")
+    first = asyncio.ensure_future(scheduler.submit(client, slow_send))
+    await asyncio.sleep(0.01)
+    # Queued while the only slot is busy
+    second = asyncio.ensure_future(scheduler.submit(client, send))
+    await asyncio.sleep(0.01)
+
+    stopping = asyncio.ensure_future(scheduler.stop())
+    await asyncio.sleep(0.01)
+    release.set()
+    await asyncio.wait_for(stopping, timeout=1)
+
+    assert (await first)["messages"][0]["id"] == "first"
+    with pytest.raises(RuntimeError):
+        await asyncio.wait_for(second, timeout=1)
+
+def test_token_bucket_rate_and_pause():
+    bucket = TokenBucket(rate=10.0, burst=1)
+    now = bucket.updated
+
+    assert bucket.delay(now) == 0
+    bucket.consume(now)
+    assert bucket.delay(now) == pytest.approx(0.1)
+
+    bucket.pause(2.0, now)
+    assert bucket.delay(now) == pytest.approx(2.1)
+
+
+def test_message_timestamp_is_stable_without_meta_timestamp():
+    assert _message_timestamp({"timestamp": "1700000000"}).year == 2023
+    # Redeliveries must produce the same idempotency key
+    assert _message_timestamp({}) == _message_timestamp({"timestamp": "soon"}) == MISSING_TIMESTAMP
+
+
+def _pipeline_event(message_id, content="Hi", phone_number_id="phone-1", kind="text"):
+    return {
+        "kind": "message",
+        "message_id": message_id,
+        "from": "111",
+        "phone_number_id": phone_number_id,
+        "timestamp": "1700000000",
+        "type": kind,
+        "content": content,
+    }
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+@pytest.mark.asyncio
+async def test_webhook_answers_503_when_the_queue_is_full(monkeypatch):
+    fake_pipeline = MagicMock()
+    fake_pipeline.enqueue.side_effect = [True, False]
+    monkeypatch.setattr(webhook, "webhook_pipeline", fake_pipeline)
+    request = MagicMock()
+    request.json = AsyncMock(return_value=json.loads(json.dumps(BATCHED_WEBHOOK)))
+
+    response = await webhook.webhook_handler(request)
+
+    assert response.status_code == 503
+    assert json.loads(response.body) == {"status": "busy"}
+    assert fake_pipeline.enqueue.call_count == 2
+    # Only the queued message counts as seen; Meta's redelivery of the rest must get through
+    assert "wamid.1" in recent_message_ids
+    assert "wamid.2" not in recent_message_ids
+
+
+@pytest.mark.asyncio
+async def test_process_batch_answers_each_new_message_once(monkeypatch):
+    tenant = TenantSnapshot("t1", "phone-1", "token", "prompt")
+    monkeypatch.setattr(pipeline_module, "AsyncSessionLocal", FakeSession)
+    monkeypatch.setattr(
+        pipeline_module.tenant_cache, "get_by_phone_ids", AsyncMock(return_value={"phone-1": tenant})
+    )
+    inserted = []
+
+    async def fake_insert_new_messages(db, rows):
+        inserted.extend(rows)
+        return {"wamid.new", "wamid.image", "wamid.broken"}
+
+    monkeypatch.setattr(pipeline_module, "insert_new_messages", fake_insert_new_messages)
+    save_turns = AsyncMock()
+    monkeypatch.setattr(pipeline_module, "save_turns", save_turns)
+
+    pipeline = WebhookPipeline(maxsize=10, workers=1, batch_size=10, shutdown_timeout=1)
+    reply_row = {"tenant_id": "t1", "wa_msg_id": "wamid.out", "user_phone": "111", "role": "assistant",
+                 "text": "Hello", "ts": MISSING_TIMESTAMP}
+    monkeypatch.setattr(pipeline, "_reply", AsyncMock(side_effect=[reply_row, RuntimeError("send failed")]))
+
+    outcomes = await pipeline.process_batch([
+        _pipeline_event("wamid.new"),
+        _pipeline_event("wamid.new"),
+        _pipeline_event("wamid.old"),
+        _pipeline_event("wamid.other", phone_number_id="phone-unknown"),
+        _pipeline_event("wamid.image", content=None, kind="image"),
+        _pipeline_event("wamid.broken"),
+    ])
+
+    assert outcomes == ["processed", "duplicate", "duplicate", "ignored", "ignored", "failed"]
+    # One bulk insert for the batch; messages of unknown tenants are not stored
+    assert [row["wa_msg_id"] for row in inserted] == [
+        "wamid.new", "wamid.new", "wamid.old", "wamid.image", "wamid.broken"
+    ]
+    assert pipeline._reply.await_count == 2
+    save_turns.assert_awaited_once()
+    assert save_turns.await_args.args[1] == [reply_row]
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_queued_messages():
+    pipeline = WebhookPipeline(maxsize=10, workers=2, batch_size=2, shutdown_timeout=5)
+    processed = []
+
+    async def fake_process_batch(messages):
+        await asyncio.sleep(0.01)
+        processed.extend(message["message_id"] for message in messages)
+        return ["processed"] * len(messages)
+
+    pipeline.process_batch = fake_process_batch
+    pipeline.start()
+    for number in range(7):
+        assert pipeline.enqueue(_pipeline_event(f"wamid.{number}"))
+
+    await pipeline.stop()
+
+    assert sorted(processed) == [f"wamid.{number}" for number in range(7)]
+    assert not pipeline.running
+    with pytest.raises(RuntimeError):
+        pipeline.enqueue(_pipeline_event("wamid.late"))